@@ -0,0 +1,69 @@
+"""
+Benchmark: the original per-cell normalizers (.apply) vs the default rules
+applied once per distinct value (the *_series functions the engine runs).
+
+    python benchmarks/bench_normalize.py            # 10k / 100k / 1M rows
+    python benchmarks/bench_normalize.py 50000      # custom sizes
+
+Each size also checks that both give identical output.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grantNormalize import (  # noqa: E402
+    normalize_blank,
+    normalize_blank_series,
+    normalize_citizenship,
+    normalize_citizenship_series,
+    normalize_victimization,
+    normalize_victimization_series,
+)
+
+VICTIMIZATION_VALUES = [
+    "Sex Trafficking", "Labor Trafficking", "Sex Trafficking, Labor Trafficking",
+    "sex trafficking & labor trafficking", "Exploitation", "  ", "nan", None, np.nan,
+]
+CITIZENSHIP_VALUES = ["Nicaragua", "nicaraugua", "Niceragua ", "nicaragua.", "Mexico", " USA", None, np.nan]
+MULTI_SELECT_VALUES = ["White|Black", "Asian, White", "Hispanic/Latino & White", " White ", "", "NaN", None, np.nan]
+
+CASES = [
+    ("Type of Victimization", VICTIMIZATION_VALUES, normalize_victimization, normalize_victimization_series),
+    ("Country of Citizenship", CITIZENSHIP_VALUES, normalize_citizenship, normalize_citizenship_series),
+    ("Race/Ethnicity", MULTI_SELECT_VALUES, normalize_blank, normalize_blank_series),
+]
+
+
+def make_column(values, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(values), size=rows)
+    return pd.Series(np.array(values, dtype=object)[picks], dtype=object)
+
+
+def timed(fn, series):
+    start = time.perf_counter()
+    out = fn(series)
+    return out, time.perf_counter() - start
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    sizes = [int(a) for a in argv] or [10_000, 100_000, 1_000_000]
+    print(f"{'column':<24}{'rows':>10}{'apply (s)':>12}{'vector (s)':>12}{'speedup':>10}")
+    for rows in sizes:
+        for column, values, scalar_fn, series_fn in CASES:
+            series = make_column(values, rows)
+            expected, t_apply = timed(lambda s: s.apply(scalar_fn), series)
+            actual, t_vector = timed(series_fn, series)
+            pd.testing.assert_series_equal(actual, expected)
+            print(f"{column:<24}{rows:>10}{t_apply:>12.3f}{t_vector:>12.3f}{t_apply / t_vector:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
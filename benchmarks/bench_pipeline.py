@@ -0,0 +1,236 @@
+"""
+Benchmark suite: the whole report pipeline on synthetic exports, headless.
+
+    python benchmarks/bench_pipeline.py                        # 1k, 10k and 100k clients
+    python benchmarks/bench_pipeline.py --sizes 1000,5000000   # up to 5M clients
+    python benchmarks/bench_pipeline.py --compare              # last two runs side by side
+
+For each size a synthetic workbook (synthetic_workbook) is generated and,
+while its sheets fit Excel's row limit, written to an .xlsx once (kept under
+--data-dir for later runs). Then, through GrantReportEngine with its stage
+metrics (grantMetrics), the benchmark times:
+
+    load        load_workbook of the .xlsx (parse every tab, build views);
+                larger sizes skip it and use the generated frames
+    merge       the merged view from the six "- Rows" sheets (merge,
+                normalizations, dedupe)
+    prepare     the demographics view: normalizations, dedupe, filter index
+    filter      a GUI-like sequence of filter changes (counts included)
+    dropdowns   dropdown counts after each change (first one builds the cube)
+    export      the filtered client list to .csv and .parquet (.xlsx while small)
+
+With --store the views are written into a fresh SQLite client store
+(grantStore) after loading, and filtering, counts and exports run against it;
+"reopen" then times opening the stored workbook from a new engine.
+
+Every stage record (seconds, rows, peak RSS growth) is aggregated per stage
+and appended to --results (JSON lines, one line per size and stage, tagged
+with the run, git commit and library versions), so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from grantEngine import DEMOGRAPHICS_SHEET, DEMOGRAPHICS_VIEW, GrantReportEngine  # noqa: E402
+from grantMetrics import Metrics  # noqa: E402
+from grantStore import ClientStore  # noqa: E402
+from synthetic_workbook import fits_xlsx, make_sheets, write_workbook  # noqa: E402
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results", "pipeline.jsonl")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "grant-report-bench")
+# Writing .xlsx through openpyxl is slow; only small lists are exported to it
+XLSX_EXPORT_MAX_ROWS = 100_000
+
+# Filter changes a user makes one dropdown at a time (then clears them)
+FILTER_STEPS = [
+    {"Funder": "OVC"},
+    {"Funder": "OVC", "Gender": "Female"},
+    {"Funder": "OVC", "Gender": "Female", "Race/Ethnicity": "White"},
+    {"Funder": "OVC", "Gender": "Female", "Race/Ethnicity": "White", "Homelessness": "Yes"},
+    {"Funder": ["OVC", "HHS"], "Gender": {"not": "Male"}, "Type of Victimization": "Sex Trafficking"},
+    {},
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def workbook_path(data_dir, n_clients, seed):
+    return os.path.join(data_dir, f"synthetic-{n_clients}-{seed}.xlsx")
+
+
+def bench_size(n_clients, seed, data_dir, out_dir, log, store=False):
+    """Run every stage for one size; returns the engine's Metrics."""
+    sheets = make_sheets(n_clients, seed)
+    metrics = Metrics()
+    store_path = os.path.join(out_dir, f"store-{n_clients}.sqlite")
+    engine = GrantReportEngine(metrics=metrics, store=ClientStore(store_path) if store else None)
+
+    path = workbook_path(data_dir, n_clients, seed)
+    if fits_xlsx(sheets):
+        if not os.path.exists(path):
+            log(f"  writing {path} ...")
+            os.makedirs(data_dir, exist_ok=True)
+            write_workbook(path, sheets)
+        with metrics.stage("bench:load", rows_in=sum(len(df) for df in sheets.values())):
+            engine.load_workbook(path)
+    else:
+        log("  over Excel's row limit: load skipped, views built from the generated frames")
+        engine.workbook_sheets = sheets
+        engine.build_views()
+        if store:
+            engine.write_store(f"synthetic-{n_clients}-{seed}", path)
+
+    if store:
+        with metrics.stage("bench:reopen"):
+            reopened = GrantReportEngine(metrics=Metrics(), store=ClientStore(store_path))
+            reopened.open_store_views(next(iter(reopened.store.execute("SELECT key FROM workbooks")))[0])
+
+    rows_sheets = {name: df for name, df in engine.workbook_sheets.items() if name != DEMOGRAPHICS_SHEET}
+    with metrics.stage("bench:merge", rows_in=sum(len(df) for df in rows_sheets.values())) as stage:
+        loaded, engine.workbook_sheets = engine.workbook_sheets, rows_sheets
+        try:
+            stage.rows_out = len(engine.build_merged_report_view())
+        finally:
+            engine.workbook_sheets = loaded
+
+    view = DEMOGRAPHICS_VIEW
+    with metrics.stage("bench:prepare", rows_in=len(engine.views[view])) as stage:
+        df = engine.prepare_view(view)
+        index = engine.view_filter_index(view)
+        stage.rows_out = len(df)
+
+    filters = engine.filter_engine(df, index)
+    for step in FILTER_STEPS:
+        with metrics.stage("bench:filter", rows_in=len(df)) as stage:
+            filters.update(step)
+            stage.rows_out = len(filters.positions())
+            engine.filtered_counts(view, filters)
+        with metrics.stage("bench:dropdowns", rows_in=len(df)):
+            engine.dropdown_counts(view, filters)
+
+    filters.update(FILTER_STEPS[0])
+    positions = filters.positions()
+    extensions = [".csv", ".parquet"] + ([".xlsx"] if len(positions) <= XLSX_EXPORT_MAX_ROWS else [])
+    for ext in extensions:
+        with metrics.stage(f"bench:export{ext}", rows_in=len(positions)):
+            engine.write_results(df, os.path.join(out_dir, f"clients-{n_clients}{ext}"), positions=positions)
+    return metrics
+
+
+def aggregate(metrics):
+    """{stage: {"calls", "seconds", "rows_in", "rows_out", "peak_rss_growth_mib"}} over a run's records."""
+    stages = {}
+    for record in metrics.records:
+        entry = stages.setdefault(record["stage"], {
+            "calls": 0, "seconds": 0.0, "rows_in": None, "rows_out": None, "peak_rss_growth_mib": None,
+        })
+        entry["calls"] += 1
+        entry["seconds"] += record["seconds"]
+        for key in ("rows_in", "rows_out"):
+            if record.get(key) is not None:
+                entry[key] = record[key]
+        growth = record.get("peak_rss_growth_mib")
+        if growth is not None:
+            entry["peak_rss_growth_mib"] = max(entry["peak_rss_growth_mib"] or 0, growth)
+    return stages
+
+
+def print_stages(stages):
+    for stage, entry in sorted(stages.items(), key=lambda item: (not item[0].startswith("bench:"), item[0])):
+        print(
+            f"  {stage:38} {entry['calls']:>4} x {entry['seconds']:9.3f}s  "
+            f"rows {entry['rows_in'] if entry['rows_in'] is not None else '':>9} -> "
+            f"{entry['rows_out'] if entry['rows_out'] is not None else '':<9} "
+            f"peak RSS +{entry['peak_rss_growth_mib'] or 0:.1f} MiB"
+        )
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def compare(path, baseline=None, current=None):
+    """Print each (size, stage) of two runs (default: the last two) with the time ratio."""
+    results = read_results(path)
+    runs = list(dict.fromkeys(r["run"] for r in results))
+    if len(runs) < 2 and not (baseline and current):
+        print(f"Need two runs in {path} to compare (found {len(runs)})")
+        return 1
+    baseline = baseline or runs[-2]
+    current = current or runs[-1]
+    old = {(r["clients"], r["stage"]): r for r in results if r["run"] == baseline}
+    new = {(r["clients"], r["stage"]): r for r in results if r["run"] == current}
+    print(f"{baseline} ({next(iter(old.values()), {}).get('commit')}) -> "
+          f"{current} ({next(iter(new.values()), {}).get('commit')})")
+    for key in sorted(set(old) & set(new), key=lambda k: (k[0], not k[1].startswith("bench:"), k[1])):
+        before, after = old[key]["seconds"], new[key]["seconds"]
+        ratio = after / before if before else float("nan")
+        print(f"  {key[0]:>9} {key[1]:38} {before:9.3f}s -> {after:9.3f}s  x{ratio:5.2f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the report pipeline on synthetic Apricot exports")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="Comma-separated client counts (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where generated workbooks are kept")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON-lines file results are appended to")
+    parser.add_argument("--store", action="store_true",
+                        help="Filter, count and export through a SQLite client store instead of in memory")
+    parser.add_argument("--compare", nargs="*", metavar="RUN",
+                        help="Compare two runs in --results (default: the last two) instead of running")
+    args = parser.parse_args(argv)
+    if args.compare is not None:
+        return compare(args.results, *args.compare[:2])
+
+    run = {
+        "run": f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.node(),
+        "cpus": os.cpu_count(),
+        "backend": "store" if args.store else "memory",
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+    out_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    log = lambda message: print(message, file=sys.stderr)
+    for n_clients in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        log(f"{n_clients} clients")
+        stages = aggregate(bench_size(n_clients, args.seed, args.data_dir, out_dir, log, store=args.store))
+        print(f"{n_clients} clients:")
+        print_stages(stages)
+        with open(args.results, "a", encoding="utf-8") as fh:
+            for stage, entry in stages.items():
+                fh.write(json.dumps({**run, "clients": n_clients, "stage": stage, **entry}) + "\n")
+    print(f"Results appended to {args.results} (run {run['run']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
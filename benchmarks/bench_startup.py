@@ -0,0 +1,105 @@
+"""
+Startup benchmark: what launching grantDemo.py imports, and how long it takes.
+
+    python benchmarks/bench_startup.py                 # import grantDemo
+    python benchmarks/bench_startup.py --app           # ... and build the window (needs a display)
+    python benchmarks/bench_startup.py --max-ms 150    # also fail over a time budget
+
+Runs a fresh interpreter under `python -X importtime`, prints the total
+import time and the slowest modules (cumulative, i.e. with what they import),
+and exits with 1 when the data stack (pandas, numpy, openpyxl, pyarrow) was
+imported before the window is up: those belong on the worker thread, after
+the first paint. With --app the window is created withdrawn and checked
+before its deferred callbacks (filter dropdowns, pre-warming) run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported until a workbook is on its way
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow")
+
+IMPORT_ONLY = "import grantDemo"
+WITH_APP = """
+import tkinter as tk
+import grantDemo
+root = tk.Tk()
+root.withdraw()
+app = grantDemo.GrantReportDemoApp(root)
+root.update_idletasks()
+"""
+REPORT = """
+import json, sys
+print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+def parse_importtime(stderr):
+    """[(module, depth, self_us, cumulative_us)] from `-X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), depth, self_us, cumulative_us))
+    return entries
+
+
+def measure(app=False):
+    """(wall seconds, importtime entries, heavy modules loaded) of one cold start."""
+    code = (WITH_APP if app else IMPORT_ONLY) + REPORT.format(heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "startup failed")
+    return seconds, parse_importtime(proc.stderr), json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time grantDemo's cold start and check what it imports")
+    parser.add_argument("--app", action="store_true", help="Also build the (withdrawn) main window")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Cold starts; the fastest counts (default: %(default)s)")
+    parser.add_argument("--max-ms", type=float, help="Fail when imports take longer than this")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for _ in range(max(1, args.repeat)):
+        try:
+            runs.append(measure(args.app))
+        except RuntimeError as e:
+            print(f"Startup failed: {e}")
+            return 1
+    seconds, entries, heavy = min(runs, key=lambda run: sum(e[3] for e in run[1] if e[1] == 0))
+
+    total_ms = sum(cumulative for _name, depth, _self, cumulative in entries if depth == 0) / 1000
+    print(f"{'grantDemo + window' if args.app else 'import grantDemo'}: "
+          f"imports {total_ms:.1f} ms, process {seconds * 1000:.0f} ms, {len(entries)} modules")
+    for name, depth, self_us, cumulative_us in sorted(entries, key=lambda e: -e[3])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f})  {'  ' * depth}{name}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)} (import them on the worker thread)")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL: imports took {total_ms:.1f} ms, over the {args.max_ms:g} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
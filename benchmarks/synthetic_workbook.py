@@ -0,0 +1,189 @@
+"""
+Synthetic Apricot-style exports for benchmarks.
+
+    python benchmarks/synthetic_workbook.py out.xlsx                  # 10k clients
+    python benchmarks/synthetic_workbook.py out.xlsx --clients 250000 --seed 3
+
+make_sheets builds the "New Client Demographics" tab and the six "- Rows"
+sheets build_merged_report_view merges, with what real exports look like:
+clients listed twice on the demographics tab (~5%), several rows per client
+on the "- Rows" tabs (~25% extra) and some clients missing from them, a few
+rows without an ID, multi-select cells jumbled with "|", "," and "&" and
+stray spaces, blanks written as "", "  " or "nan", victimization and
+country spellings the normalizers fix, and columns the report never reads.
+
+Columns are Categoricals built from codes, so millions of rows fit in memory;
+an .xlsx is only possible while every sheet stays under Excel's row limit
+(write_workbook raises otherwise; benchmark such sizes from the frames).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grantEngine import DEMOGRAPHICS_SHEET, ID_COLUMN, PREVIEW_COLUMNS, SHEET_MAPPINGS  # noqa: E402
+from grantExport import XLSX_MAX_ROWS  # noqa: E402
+
+DEMOGRAPHICS_DUPLICATE_RATE = 0.05
+ROWS_SHEET_EXTRA_RATE = 0.25
+ROWS_SHEET_COVERAGE = 0.9
+MISSING_ID_RATE = 0.001
+BLANK_RATE = 0.08
+
+BLANKS = ["", "  ", "nan"]
+SEPARATORS = ["|", "|", ", ", ",", " & ", " | "]
+
+# Single-choice fields: (values, weights); None is an empty cell
+CHOICES = {
+    "Funder": (["OVC", "HHS", "State", "OVC ", "hhs", None], [40, 30, 20, 3, 2, 5]),
+    "Gender": (["Female", "Male", "Non-binary", "Transgender", None], [60, 30, 5, 2, 3]),
+    "Program": (["Shelter", "Case Management", "Legal Advocacy", "Housing", None], [30, 35, 15, 15, 5]),
+    "Veteran Status": (["No", "Yes", "Unknown", None], [85, 5, 5, 5]),
+    "LGBTQ/Two-Spirited": (["No", "Yes", "Unknown", "Declined", None], [60, 15, 10, 10, 5]),
+    "Immigrant Status": (["No", "Yes", "Unknown", None], [55, 35, 5, 5]),
+    "Primary Language": (["English", "Spanish", "spanish", "ENGLISH", "Mandarin", "Tagalog", None],
+                         [55, 25, 4, 3, 5, 3, 5]),
+    "Type of Victimization": (
+        ["Sex Trafficking", "Labor Trafficking", "Sex Trafficking, Labor Trafficking",
+         "sex trafficking & labor trafficking", "Labor Trafficking,Sex Trafficking", "Exploitation",
+         "  ", None],
+        [40, 25, 8, 4, 3, 10, 3, 7],
+    ),
+    "Country of Citizenship": (
+        ["USA", "Mexico", "Nicaragua", "nicaraugua", "Niceragua ", "nicaragua.", "Honduras", "Guatemala",
+         " USA", None],
+        [45, 20, 8, 2, 1, 1, 8, 8, 2, 5],
+    ),
+    "Notes": (["", "Follow up", "Referred out", "See case file", None], [40, 20, 10, 10, 20]),
+}
+
+# Multi-select fields: their tokens
+MULTI_SELECT = {
+    "Race/Ethnicity": ["White", "Black/African American", "Hispanic/Latino", "Asian",
+                       "American Indian/Alaska Native", "Native Hawaiian/Pacific Islander"],
+    "Disability": ["Physical", "Cognitive", "Mental Health", "Sensory", "None"],
+    "Victim Type": ["Adult", "Minor", "Primary", "Secondary"],
+    "Homelessness": ["No", "Yes", "At Risk", "Unknown"],
+    "Age at Time of Trafficking": ["Under 18", "18-24", "25-59", "60+"],
+}
+
+EXTRA_COLUMNS = ["Notes", "Intake Date"]
+
+
+def jumbled_values(tokens, rng, n_combos=60):
+    """(values, weights) for a multi-select field: single tokens, jumbled combinations and blanks."""
+    values = list(tokens)
+    weights = [55 / len(tokens)] * len(tokens)
+    combos = set()
+    for _ in range(n_combos):
+        picked = rng.choice(tokens, size=rng.integers(2, min(3, len(tokens)) + 1), replace=False)
+        text = rng.choice(SEPARATORS).join(picked)
+        combos.add(f" {text}" if rng.random() < 0.1 else text)
+    combos = sorted(combos)
+    values += combos + BLANKS + [None]
+    weights += [30 / len(combos)] * len(combos) + [15 * BLANK_RATE] * len(BLANKS) + [15 * (1 - BLANK_RATE)]
+    return values, weights
+
+
+def column(values, weights, n_rows, rng):
+    """A Categorical column drawn from values (None = missing)."""
+    probabilities = np.asarray(weights, dtype=float) / sum(weights)
+    picked = rng.choice(len(values), size=n_rows, p=probabilities)
+    categories = [v for v in dict.fromkeys(values) if v is not None]
+    lookup = np.array([categories.index(v) if v is not None else -1 for v in values])
+    return pd.Categorical.from_codes(lookup[picked], categories=categories)
+
+
+def dates(start, days, n_rows, rng, missing=0.02):
+    values = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n_rows), "D")
+    return pd.Series(values).where(rng.random(n_rows) >= missing)
+
+
+def client_rows(client_ids, extra_rate, coverage, rng):
+    """
+    Row -> client ID for one tab: `coverage` of the clients, a share of them on
+    extra rows, a few rows without an ID, in shuffled order.
+    """
+    n_clients = len(client_ids)
+    present = np.flatnonzero(rng.random(n_clients) < coverage)
+    repeats = present[rng.random(len(present)) < extra_rate]
+    rows = rng.permutation(np.concatenate([present, repeats]))
+    values = client_ids[rows]
+    values[rng.random(len(rows)) < MISSING_ID_RATE] = np.nan
+    return values
+
+
+def make_frame(columns, ids, rng):
+    data = {ID_COLUMN: ids}
+    for col in columns:
+        if col == ID_COLUMN:
+            continue
+        if col == "Date of Birth":
+            data[col] = dates("1950-01-01", 25_000, len(ids), rng)
+        elif col == "Intake Date":
+            data[col] = dates("2015-01-01", 3_000, len(ids), rng, missing=0)
+        elif col in MULTI_SELECT:
+            data[col] = column(*jumbled_values(MULTI_SELECT[col], rng), len(ids), rng)
+        else:
+            data[col] = column(*CHOICES[col], len(ids), rng)
+    return pd.DataFrame(data)
+
+
+def make_sheets(n_clients, seed=0, demographics=True):
+    """{sheet name: frame} of a synthetic export with n_clients clients."""
+    rng = np.random.default_rng(seed)
+    # One shared array of ID strings; every tab indexes into it
+    client_ids = np.array([f"C{i:07d}" for i in range(n_clients)], dtype=object)
+    sheets = {}
+    if demographics:
+        ids = client_rows(client_ids, DEMOGRAPHICS_DUPLICATE_RATE, 1.0, rng)
+        columns = PREVIEW_COLUMNS + ["Date of Birth"] + EXTRA_COLUMNS
+        sheets[DEMOGRAPHICS_SHEET] = make_frame(columns, ids, rng)
+    for sheet, columns in SHEET_MAPPINGS.items():
+        ids = client_rows(client_ids, ROWS_SHEET_EXTRA_RATE, ROWS_SHEET_COVERAGE, rng)
+        sheets[sheet] = make_frame(columns + EXTRA_COLUMNS[:1], ids, rng)
+    return sheets
+
+
+def fits_xlsx(sheets):
+    return all(len(df) <= XLSX_MAX_ROWS for df in sheets.values())
+
+
+def write_workbook(path, sheets):
+    """Write the sheets as an .xlsx (openpyxl write-only, row by row)."""
+    import openpyxl
+
+    if not fits_xlsx(sheets):
+        raise ValueError(f"A sheet has more than Excel's {XLSX_MAX_ROWS} rows; benchmark these frames in memory")
+    book = openpyxl.Workbook(write_only=True)
+    for name, df in sheets.items():
+        sheet = book.create_sheet(name)
+        sheet.append(list(df.columns))
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+    part = f"{path}.part"
+    book.save(part)
+    os.replace(part, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Apricot-style export")
+    parser.add_argument("output", help="Workbook to write (.xlsx)")
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-demographics", action="store_true",
+                        help="Only the '- Rows' sheets (the merged view is built from them)")
+    args = parser.parse_args(argv)
+    sheets = make_sheets(args.clients, args.seed, demographics=not args.no_demographics)
+    write_workbook(args.output, sheets)
+    print(f"Wrote {args.output}: " + ", ".join(f"{name} ({len(df)} rows)" for name, df in sheets.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Cross-tab counts for grant reports ("unique clients by Race/Ethnicity x
+Funder x Program").
+
+Every dimension is expanded through its value/token index: each row belongs
+to the buckets its cell lists, so a client reported as "Asian|White" counts
+once under Asian and once under White. Rows become (row, bucket, ...) tuples
+with numpy repeat/take over the index codes (no Python loop over rows), and
+counts are bincounts over the combined bucket code. Unique clients are
+counted on factorized ID codes.
+"""
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from grantIndex import build_index
+
+BLANK_BUCKET = "(blank)"
+CLIENTS = "Clients"
+ROWS = "Rows"
+
+# AggregateCube limits: fields per cuboid, estimated memory and build time
+CUBE_MAX_DIMS = 2
+CUBE_MAX_BYTES = 64 * 1024 ** 2
+CUBE_MAX_SECONDS = 2.0
+CUBE_BYTES_PER_CELL = 240   # dict entry + key tuple + two ints, roughly
+
+
+def bucket_membership(index):
+    """
+    (buckets, value_ids, bucket_ids) for one index: the bucket labels and the
+    (distinct value -> bucket) pairs. Cells with no tokens (blank, missing)
+    belong to BLANK_BUCKET. A token repeated in one cell is one membership.
+    """
+    buckets, bucket_ids = [], {}
+    pair_values, pair_buckets = [], []
+    n_present = len(index.value_texts) - 2   # the last two slots are missing cells
+    for value_id, text in enumerate(index.value_texts):
+        # Only text counts: "None" typed into a cell is a value like any other
+        tokens = [t for t in index.tokenize(text) if t.strip()] if value_id < n_present else []
+        for token in dict.fromkeys(tokens or [BLANK_BUCKET]):
+            bucket = bucket_ids.setdefault(token, len(buckets))
+            if bucket == len(buckets):
+                buckets.append(token)
+            pair_values.append(value_id)
+            pair_buckets.append(bucket)
+    pair_values = np.asarray(pair_values, dtype=np.int64)
+    pair_buckets = np.asarray(pair_buckets, dtype=np.int64)
+    order = np.argsort(pair_values, kind="stable")
+    return buckets, pair_values[order], pair_buckets[order]
+
+
+def expand(rows, row_codes, value_ids, bucket_ids, n_values):
+    """
+    Explode row positions through a value -> buckets relation (value_ids
+    sorted). Returns (take, buckets): take indexes into `rows`, one entry per
+    (row, bucket) membership.
+    """
+    offsets = np.searchsorted(value_ids, np.arange(n_values + 1))
+    codes = row_codes[rows]
+    n_per_row = offsets[codes + 1] - offsets[codes]
+    take = np.repeat(np.arange(len(rows)), n_per_row)
+    # Position of each output entry inside its row's run of buckets
+    run_starts = np.repeat(np.cumsum(n_per_row) - n_per_row, n_per_row)
+    within = np.arange(len(take)) - run_starts
+    return take, bucket_ids[np.repeat(offsets[codes], n_per_row) + within]
+
+
+def crosstab(df, fields, multi_select_fields=(), index=None, positions=None, id_column=None):
+    """
+    Counts per combination of buckets of `fields` over the rows at `positions`
+    (all rows when None). index: optional {field: TokenIndex/ValueIndex} of df.
+    Returns a long DataFrame: one column per field, then Clients (unique
+    id_column values, when given and present) and Rows, sorted by the fields.
+    """
+    fields = [f for f in fields if f in df.columns]
+    if not fields:
+        raise ValueError("crosstab needs at least one column of the view")
+    index = dict(index or {})
+    rows = np.arange(len(df)) if positions is None else np.asarray(positions, dtype=np.int64)
+
+    take = np.arange(len(rows))
+    labels, bucket_codes = [], []
+    for field in fields:
+        field_index = index.get(field) or build_index(df[field], field in multi_select_fields)
+        buckets, value_ids, bucket_ids = bucket_membership(field_index)
+        step, codes = expand(take, field_index.row_codes[rows], value_ids, bucket_ids, len(field_index.value_texts))
+        take = take[step]
+        bucket_codes = [c[step] for c in bucket_codes] + [codes]
+        labels.append(buckets)
+
+    shape = tuple(len(b) for b in labels)
+    if np.prod(shape, dtype=np.float64) < 2 ** 62:
+        keys = np.ravel_multi_index(bucket_codes, shape) if bucket_codes[0].size else np.empty(0, np.int64)
+        key_codes, cells = pd.factorize(keys)
+        cell_codes = np.unravel_index(cells, shape)
+    else:
+        # Too many combinations for one integer key: factorize the tuples instead
+        key_frame = pd.DataFrame({i: c for i, c in enumerate(bucket_codes)})
+        key_codes, cells = pd.factorize(pd.MultiIndex.from_frame(key_frame))
+        cell_codes = [cells.get_level_values(i).to_numpy() for i in range(len(fields))]
+    key_codes = np.asarray(key_codes, dtype=np.int64).ravel()
+
+    result = {
+        field: np.asarray(buckets, dtype=object)[np.asarray(codes, dtype=np.int64)]
+        for field, buckets, codes in zip(fields, labels, cell_codes)
+    }
+    if id_column is not None and id_column in df.columns:
+        client_codes, clients = pd.factorize(df[id_column])
+        client_codes = client_codes[rows][take]
+        known = client_codes >= 0
+        # One (cell, client) pair per client in each cell
+        pairs = pd.unique(key_codes[known] * len(clients) + client_codes[known])
+        result[CLIENTS] = np.bincount(pairs // max(len(clients), 1), minlength=len(cell_codes[0]))
+    result[ROWS] = np.bincount(key_codes, minlength=len(cell_codes[0]))
+    return pd.DataFrame(result).sort_values(fields, kind="stable", ignore_index=True)
+
+
+def pivot(table, rows, columns, value=CLIENTS):
+    """Wide table from a crosstab result: `rows` fields down, `columns` fields across (0 where empty)."""
+    wide = table.pivot_table(index=rows, columns=columns, values=value, aggfunc="sum", fill_value=0)
+    return wide.astype(np.int64)
+
+
+class AggregateCube:
+    """
+    Precomputed unique-client/row counts for one prepared view.
+
+    Unique-client counts do not add up across cells, so the cube keeps one
+    cuboid per combination of fields (every single field, then pairs, up to
+    max_dims), each mapping a tuple of bucket values to (clients, rows).
+    Cuboids are built until the memory or time budget runs out; lookups for
+    anything else return None and the caller computes the count on the fly.
+    """
+
+    def __init__(self, df, fields, multi_select_fields=(), index=None, id_column=None,
+                 max_dims=CUBE_MAX_DIMS, max_bytes=CUBE_MAX_BYTES, max_seconds=CUBE_MAX_SECONDS):
+        self.fields = [f for f in fields if f in df.columns]
+        self.cuboids = {}     # tuple of fields (in self.fields order) -> {tuple of values: (clients, rows)}
+        self.buckets = {}     # field -> bucket labels seen (a missing cell then means a count of 0)
+        self.skipped = 0      # field combinations left to on-the-fly counting
+        self.bytes = 0
+
+        if id_column is not None and id_column in df.columns:
+            self.total = (int(df[id_column].nunique(dropna=True)), len(df))
+        else:
+            self.total = (len(df), len(df))
+
+        # Index each field once for all its cuboids
+        index = dict(index or {})
+        for field in self.fields:
+            if index.get(field) is None:
+                index[field] = build_index(df[field], field in multi_select_fields)
+
+        start = time.perf_counter()
+        combos = [c for n in range(1, max_dims + 1) for c in itertools.combinations(self.fields, n)]
+        for i, combo in enumerate(combos):
+            if self.bytes > max_bytes or time.perf_counter() - start > max_seconds:
+                self.skipped = len(combos) - i
+                break
+            table = crosstab(df, combo, multi_select_fields, index=index, id_column=id_column)
+            clients = table[CLIENTS] if CLIENTS in table.columns else table[ROWS]
+            keys = zip(*(table[f].tolist() for f in combo))
+            self.cuboids[combo] = dict(zip(keys, zip(clients.tolist(), table[ROWS].tolist())))
+            self.bytes += len(table) * CUBE_BYTES_PER_CELL
+            if len(combo) == 1:
+                # A filter on a value missing cells also match counts more than its bucket
+                self.buckets[combo[0]] = set(table[combo[0]]) - {BLANK_BUCKET} - index[combo[0]].missing_tokens
+
+    def _known(self, field, value):
+        # Blank/unknown values (and those missing cells match) are left to the filter engine
+        return field in self.buckets and value in self.buckets[field]
+
+    def _cuboid(self, fields):
+        return self.cuboids.get(tuple(f for f in self.fields if f in fields))
+
+    def lookup(self, selections):
+        """(clients, rows) for {field: single value} selections, or None if not precomputed."""
+        if not selections:
+            return self.total
+        if not all(self._known(f, v) for f, v in selections.items()):
+            return None
+        cuboid = self._cuboid(selections)
+        if cuboid is None:
+            return None
+        return cuboid.get(tuple(selections[f] for f in self.fields if f in selections), (0, 0))
+
+    def value_counts(self, field, selections, values):
+        """
+        {value: unique clients} each dropdown value of `field` would give next to
+        the other selections, or None if not precomputed. Values the cube cannot
+        answer (blanks, values missing cells match) are left out for the caller.
+        """
+        others = {f: v for f, v in selections.items() if f != field}
+        if field not in self.buckets or not all(self._known(f, v) for f, v in others.items()):
+            return None
+        cuboid = self._cuboid(set(others) | {field})
+        if cuboid is None:
+            return None
+        fields = [f for f in self.fields if f in others or f == field]
+        counts = {}
+        for value in values:
+            if self._known(field, value):
+                key = tuple(value if f == field else others[f] for f in fields)
+                counts[value] = cuboid.get(key, (0, 0))[0]
+        return counts
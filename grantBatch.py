@@ -0,0 +1,272 @@
+"""
+Batch mode: many Apricot exports -> one client list.
+
+Programs send one export per program or per month. The batch pipeline reads a
+directory/glob of workbooks concurrently (one process per workbook), takes the
+report view of each, and folds them into a single client-level dataset where
+the latest record wins: a client appearing in several exports keeps the row
+from the newest one. The usual grant filters then run over the combined set.
+
+    python grantBatch.py "exports/*.xlsx" --filter "Funder=OVC" --output all_clients.csv
+
+With a cache directory the pipeline is incremental. Each workbook's client
+list is cached under its content hash, and so is every combined result. When
+one new month is added, the combined set of the other months is reused and
+only the new export is parsed and folded in.
+"""
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import multiprocessing
+import os
+import sys
+
+import pandas as pd
+
+from grantCache import CACHE_VERSION, WorkbookCache
+from grantEngine import FILTER_FIELDS, GrantReportEngine, load_filter_spec, parse_filter_args
+from grantLoader import DEFAULT_CHUNK_ROWS, categorize_columns, pack_frame, unpack_frame
+
+SOURCE_COLUMN = "Source Workbook"
+BATCH_VIEW_PREFIX = "Batch client list: "
+COMBINED_VIEW = "Batch combined clients"
+
+
+def find_workbooks(patterns):
+    """Expand directories (their *.xlsx) and globs to workbook paths, skipping Excel lock files."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = glob.glob(os.path.join(pattern, "*.xlsx"))
+        else:
+            found = glob.glob(pattern) or ([pattern] if os.path.exists(pattern) else [])
+        paths.extend(sorted(found))
+    paths = [os.path.abspath(p) for p in paths if not os.path.basename(p).startswith("~$")]
+    return list(dict.fromkeys(paths))
+
+
+def order_workbooks(paths, order="mtime"):
+    """Oldest first: by modification time (ties by name), or by file name with order='name'."""
+    if order == "name":
+        return sorted(paths, key=lambda p: os.path.basename(p))
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), os.path.basename(p)))
+
+
+def combine_clients(older, newer, id_column):
+    """
+    Fold a newer client list onto an older one: older rows whose ID is in the
+    newer list are dropped (hash lookup), the rest are kept. Rows without an
+    ID never match anything.
+    """
+    if older is None:
+        return newer
+    if id_column in older.columns and id_column in newer.columns:
+        ids = older[id_column]
+        stale = ids.isin(newer[id_column].dropna()).to_numpy() & ids.notna().to_numpy()
+        older = older[~stale]
+    combined = pd.concat([older, newer], ignore_index=True)
+    # Categoricals with different categories come back as object
+    return categorize_columns(combined)
+
+
+def ingest_workbook(path, view=None, sheet_workers=None, project=True, streaming=False,
+                    chunk_size=DEFAULT_CHUNK_ROWS):
+    """Worker: the prepared client list of one workbook. Returns (path, view_name, packed frame, error)."""
+    engine = GrantReportEngine(
+        workers=sheet_workers, project=project, streaming=streaming, chunk_size=chunk_size
+    )
+    try:
+        engine.load_workbook(path)
+        view_name = engine.resolve_view_name(view)
+        if view_name is None:
+            raise ValueError("Workbook has no readable sheets")
+        df = engine.prepare_view(view_name).copy()
+    except Exception as e:
+        return path, None, None, str(e)
+    df[SOURCE_COLUMN] = pd.Categorical([os.path.basename(path)] * len(df))
+    return path, view_name, pack_frame(df), None
+
+
+class BatchPipeline:
+    def __init__(self, log=None, cache=None, workers=None, view=None, order="mtime", project=True,
+                 streaming=False, chunk_size=DEFAULT_CHUNK_ROWS):
+        # log: optional callable(message) used for progress/status lines
+        self.log_callback = log
+        # cache: optional WorkbookCache; per-workbook and combined client lists are reused
+        self.cache = cache
+        # workers: workbooks parsed at once (None = one per core, 1 = in-process)
+        self.workers = workers
+        self.view = view
+        self.order = order
+        self.project = project
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        # Used for cache keys, filtering and output; never loads a workbook itself
+        self.engine = GrantReportEngine(
+            log=log, cache=cache, project=project, streaming=streaming, chunk_size=chunk_size
+        )
+
+        self.workbooks = []   # paths in fold order (oldest first)
+        self.failed = {}      # path -> error
+        self.clients = None   # combined client list
+
+    def log(self, message):
+        if self.log_callback is not None:
+            self.log_callback(message)
+
+    # ---- Cache keys ----
+
+    def client_list_name(self):
+        return f"{BATCH_VIEW_PREFIX}{self.view or 'default'}"
+
+    def combined_key(self, workbook_keys):
+        """Cache key of the combined list of these workbooks, in this order."""
+        digest = hashlib.sha256("\n".join([self.client_list_name()] + workbook_keys).encode("utf-8"))
+        return f"v{CACHE_VERSION}-batch-{digest.hexdigest()}"
+
+    # ---- Pipeline ----
+
+    def run(self, paths):
+        """Ingest workbooks and fold them into one client list (latest record wins)."""
+        self.workbooks = order_workbooks(paths, self.order)
+        self.failed = {}
+        keys = [self.engine.workbook_cache_key(p) for p in self.workbooks] if self.cache else []
+
+        # Longest already-combined prefix: only the workbooks after it need folding in
+        combined, done = None, 0
+        for n in range(len(keys), 0, -1):
+            combined = self.cache.load_view(self.combined_key(keys[:n]), COMBINED_VIEW)
+            if combined is not None:
+                done = n
+                self.log(f"Reusing combined client list of {n} workbook(s).")
+                break
+
+        todo = self.workbooks[done:]
+        lists = self.load_client_lists(todo, dict(zip(self.workbooks, keys)))
+        # A prefix with a failed workbook is not cached: its key would claim that workbook
+        complete = bool(keys)
+        for i, path in enumerate(todo, start=done):
+            if path not in lists:
+                complete = False
+                continue
+            combined = combine_clients(combined, lists[path], self.engine.id_column)
+            if complete:
+                self.cache.store_view(self.combined_key(keys[:i + 1]), COMBINED_VIEW, combined)
+
+        self.clients = combined
+        n_ok = len(self.workbooks) - len(self.failed)
+        self.log(f"Combined {n_ok} workbook(s): {0 if combined is None else len(combined)} client rows.")
+        return combined
+
+    def load_client_lists(self, paths, keys):
+        """{path: client list} from the cache where possible, else parsed (concurrently)."""
+        lists, missing = {}, []
+        for path in paths:
+            df = self.cache.load_view(keys[path], self.client_list_name()) if self.cache else None
+            if df is not None:
+                lists[path] = df
+            else:
+                missing.append(path)
+        if self.cache and len(missing) < len(paths):
+            self.log(f"{len(paths) - len(missing)} workbook(s) cached, parsing {len(missing)}.")
+
+        workers = self.workers or os.cpu_count() or 1
+        workers = max(1, min(workers, len(missing)))
+        options = dict(view=self.view, project=self.project, streaming=self.streaming, chunk_size=self.chunk_size)
+        if workers <= 1:
+            results = []
+            for path in missing:
+                self.log(f"Reading {os.path.basename(path)}...")
+                results.append(ingest_workbook(path, sheet_workers=None, **options))
+        else:
+            self.log(f"Reading {len(missing)} workbooks with {workers} worker processes...")
+            # spawn, not fork: the GUI process holds a Tk/X connection
+            context = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = [pool.submit(ingest_workbook, path, sheet_workers=1, **options) for path in missing]
+                results = [future.result() for future in concurrent.futures.as_completed(futures)]
+
+        for path, view_name, payload, error in results:
+            if error is not None:
+                self.failed[path] = error
+                self.log(f"Skipped {os.path.basename(path)}: {error}")
+                continue
+            df = unpack_frame(payload)
+            lists[path] = df
+            self.log(f"{os.path.basename(path)} [{view_name}]: {len(df)} client rows")
+            if self.cache:
+                self.cache.store_view(keys[path], self.client_list_name(), df)
+        return lists
+
+    def apply_filters(self, selections):
+        """Grant filters over the combined list. Returns (filtered_df, active labels)."""
+        return self.engine.apply_filters(self.clients, selections)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Combine many Apricot exports into one de-duplicated, filtered client list."
+    )
+    parser.add_argument("workbooks", nargs="+", help="Workbooks, directories or glob patterns")
+    parser.add_argument("--view", help="View taken from each workbook (default: demographics tab, else merged view)")
+    parser.add_argument("--order", choices=["mtime", "name"], default="mtime",
+                        help="How to tell which export is newest (default: file modification time)")
+    parser.add_argument("--spec", help="JSON filter spec file")
+    parser.add_argument("--filter", action="append", default=[], metavar="FIELD=VALUE",
+                        help="Grant filter; repeatable, overrides --spec")
+    parser.add_argument("--output", help="Output file (.csv/.xlsx/.parquet) for the combined client list")
+    parser.add_argument("--cache-dir", help="Cache directory; makes re-runs incremental")
+    parser.add_argument("--workers", type=int,
+                        help="Workbooks parsed at once (default: one per core, 1 = no pool)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Stream only the report columns in row chunks (exports larger than RAM)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Rows per chunk in --streaming mode (default: {DEFAULT_CHUNK_ROWS})")
+    parser.add_argument("--quiet", action="store_true", help="Only print errors")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    paths = find_workbooks(args.workbooks)
+    if not paths:
+        print("No workbooks found", file=sys.stderr)
+        return 2
+
+    spec = load_filter_spec(args.spec) if args.spec else {}
+    spec.update(parse_filter_args(args.filter))
+    for field in spec:
+        if field not in FILTER_FIELDS:
+            print(f"Ignoring unknown filter field: {field}", file=sys.stderr)
+    log = None if args.quiet else (lambda message: print(message, file=sys.stderr))
+
+    pipeline = BatchPipeline(
+        log=log,
+        cache=WorkbookCache(args.cache_dir) if args.cache_dir else None,
+        workers=args.workers,
+        view=args.view,
+        order=args.order,
+        streaming=args.streaming,
+        chunk_size=args.chunk_size,
+    )
+    clients = pipeline.run(paths)
+    for path, error in pipeline.failed.items():
+        print(f"{path}: error: {error}", file=sys.stderr)
+    if clients is None:
+        return 1
+
+    df, active = pipeline.apply_filters(spec)
+    engine = pipeline.engine
+    print(
+        f"{len(paths) - len(pipeline.failed)} workbook(s) "
+        f"{', '.join(active) or '(no filters)'}: "
+        f"{engine.count_clients(df)} of {engine.count_clients(clients)} clients"
+    )
+    if args.output:
+        engine.write_results(df, args.output)
+    return 1 if pipeline.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+On-disk cache of parsed workbooks.
+
+openpyxl takes minutes on large Apricot exports, and the same export is
+reopened many times a day. Each parsed sheet (and the built merged view) is
+stored as an Arrow IPC/Feather file next to a small manifest. Reopening an
+unchanged workbook memory-maps those files instead of re-parsing the Excel.
+
+Entries are keyed by the SHA-256 of the workbook bytes. A (path, size, mtime)
+lookup skips re-hashing files that have not been touched. The least recently
+used entries are evicted once the cache grows past its size budget.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; fall back to pickle files
+    pa = None
+    feather = None
+
+# Bump when parsing/view-building changes so stale entries are not reused
+CACHE_VERSION = 5
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+MANIFEST = "manifest.json"
+FUZZY_MATCHES = "fuzzy-matches.json"
+
+
+def default_cache_dir():
+    return os.environ.get(
+        "GRANT_REPORT_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "grant-report"),
+    )
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def table_to_frame(table):
+    """Arrow table -> DataFrame the way Excel parsing produced it."""
+    df = table.to_pandas()
+    # Arrow hands back missing strings as None; Excel parsing gave NaN
+    for col in df.columns[df.dtypes == object]:
+        if df[col].isna().any():
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def write_frame(df, path_stem):
+    """Write a frame as Feather when Arrow can type it, else as a pickle. Returns the file path."""
+    if feather is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            path = path_stem + ".arrow"
+            feather.write_feather(table, path, compression="uncompressed")
+            return path
+        except (pa.ArrowException, TypeError, ValueError):
+            # mixed-type object columns, non-string headers, ...
+            pass
+    path = path_stem + ".pkl"
+    df.to_pickle(path)
+    return path
+
+
+def read_frame(path):
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+    # Uncompressed IPC files can be memory-mapped instead of read into memory
+    return table_to_frame(feather.read_table(path, memory_map=True))
+
+
+class WorkbookCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ---- Manifest ----
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.setdefault("entries", {})
+        manifest.setdefault("paths", {})
+        return manifest
+
+    def _write_manifest(self, manifest):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp, self._manifest_path())
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # ---- Keys ----
+
+    def key(self, path):
+        """Cache key for a workbook: content hash (re-used while size/mtime are unchanged)."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        manifest = self._read_manifest()
+        known = manifest["paths"].get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["key"]
+        key = f"v{CACHE_VERSION}-{file_digest(path)}"
+        manifest["paths"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}
+        self._write_manifest(manifest)
+        return key
+
+    def previous_key(self, path):
+        """Key recorded for a path when it was last loaded (its contents may have changed since)."""
+        known = self._read_manifest()["paths"].get(os.path.abspath(path))
+        return known["key"] if known else None
+
+    # ---- Sheets / views ----
+
+    def load_sheets(self, key):
+        """{sheet_name: df} in workbook order, or None on a cache miss."""
+        return self._load(key, "sheets")
+
+    def store_sheets(self, key, sheets):
+        self._store(key, "sheets", sheets)
+
+    def load_view(self, key, view_name):
+        frames = self._load(key, "views", [view_name])
+        return None if frames is None else frames.get(view_name)
+
+    def store_view(self, key, view_name, df):
+        self._store(key, "views", {view_name: df})
+
+    def load_meta(self, key, name):
+        """Small JSON value stored with an entry (e.g. sheet fingerprints), or None."""
+        entry = self._read_manifest()["entries"].get(key)
+        return None if not entry else entry.get("meta", {}).get(name)
+
+    def store_meta(self, key, name, value):
+        manifest = self._read_manifest()
+        entry = manifest["entries"].setdefault(key, {"sheets": {}, "views": {}, "bytes": 0})
+        entry.setdefault("meta", {})[name] = value
+        entry["last_used"] = time.time()
+        self._write_manifest(manifest)
+
+    def _load(self, key, kind, names=None):
+        manifest = self._read_manifest()
+        entry = manifest["entries"].get(key)
+        if not entry or not entry.get(kind):
+            return None
+        files = entry[kind]
+        wanted = names if names is not None else list(files)
+        if any(name not in files for name in wanted):
+            return None
+        try:
+            frames = {name: read_frame(os.path.join(self._entry_dir(key), files[name])) for name in wanted}
+        except (OSError, ValueError, pickle.UnpicklingError):
+            return None
+        entry["last_used"] = time.time()
+        self._write_manifest(manifest)
+        return frames
+
+    def _store(self, key, kind, frames):
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        manifest = self._read_manifest()
+        entry = manifest["entries"].setdefault(key, {"sheets": {}, "views": {}, "bytes": 0})
+        for name, df in frames.items():
+            old = entry[kind].pop(name, None)
+            if old and os.path.exists(os.path.join(entry_dir, old)):
+                entry["bytes"] -= os.path.getsize(os.path.join(entry_dir, old))
+                os.remove(os.path.join(entry_dir, old))
+            stem = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+            path = write_frame(df, os.path.join(entry_dir, f"{kind}-{stem}"))
+            entry[kind][name] = os.path.basename(path)
+            entry["bytes"] += os.path.getsize(path)
+        entry["last_used"] = time.time()
+        self._evict(manifest, keep=key)
+        self._write_manifest(manifest)
+
+    # ---- Eviction ----
+
+    def size(self):
+        return sum(e.get("bytes", 0) for e in self._read_manifest()["entries"].values())
+
+    def _evict(self, manifest, keep=None):
+        entries = manifest["entries"]
+        total = sum(e.get("bytes", 0) for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entries[key].get("bytes", 0)
+            self._drop(manifest, key)
+
+    def _drop(self, manifest, key):
+        manifest["entries"].pop(key, None)
+        manifest["paths"] = {p: v for p, v in manifest["paths"].items() if v["key"] != key}
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def clear(self):
+        manifest = self._read_manifest()
+        for key in list(manifest["entries"]):
+            self._drop(manifest, key)
+        self._write_manifest(manifest)
+
+
+class FuzzyMatchCache:
+    """
+    Fuzzy-match results kept across runs in one JSON file:
+    {namespace: {lower-cased value: canonical value or None}}. Normalization
+    rules use one namespace each, named with a hash of the rule, so editing a
+    rule's choices or cutoff starts it afresh.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), FUZZY_MATCHES)
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                self.entries = json.load(fh)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+
+    def namespace(self, name):
+        """The (mutable) match table of one rule; call mark_dirty() after adding to it."""
+        return self.entries.setdefault(name, {})
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(self.entries, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -1,9 +1,58 @@
+import os
 import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
-import pandas as pd
-import threading
-import time
-import re
+from tkinter import filedialog, ttk, messagebox, simpledialog
+
+# Only pandas-free modules at startup: the window paints before the data stack
+# (pandas, numpy, openpyxl, pyarrow) is imported, on the worker thread
+from grantFields import FILTER_FIELDS, ID_COLUMN, PREVIEW_COLUMNS
+from grantGrid import VirtualGrid
+from grantMetrics import Metrics, default_metrics_path
+from grantPresets import PresetStore, preset_file_name
+from grantTasks import TaskScheduler
+
+# Dropdown changes closer together than this are filtered once, for the last one
+FILTER_DEBOUNCE_MS = 150
+# Stage records kept in the metrics panel
+METRICS_PANEL_ROWS = 300
+METRICS_COLUMNS = ("Stage", "Seconds", "Rows in", "Rows out", "RSS MiB", "Peak +MiB")
+# After the first paint: build the filter dropdowns, then pre-import the data stack
+FIRST_PAINT_DELAY_MS = 50
+
+def open_workbook_cache():
+    """Parsed-workbook cache for reopening the same export quickly (None if unavailable)."""
+    from grantCache import WorkbookCache
+
+    try:
+        return WorkbookCache()
+    except OSError:
+        return None
+
+def open_client_store():
+    """SQLite client store when GRANT_REPORT_STORE names one (None otherwise or if it cannot be opened)."""
+    if not os.environ.get("GRANT_REPORT_STORE"):
+        return None
+    import sqlite3
+
+    from grantStore import ClientStore
+
+    try:
+        return ClientStore()
+    except (OSError, sqlite3.Error):
+        return None
+
+def open_metrics():
+    """Stage metrics, also appended to the metrics JSON-lines file when it can be opened."""
+    try:
+        return Metrics(default_metrics_path())
+    except OSError:
+        return Metrics()
+
+def open_preset_store():
+    """Saved filter presets (None if the preset file cannot be read)."""
+    try:
+        return PresetStore()
+    except (OSError, ValueError):
+        return None
 
 class GrantReportDemoApp:
     def __init__(self, root):
@@ -17,65 +66,40 @@ class GrantReportDemoApp:
         self.root.option_add("*Font", self.default_font)
         self._setup_style()
 
+        # Loads, view preparation and filtering run on a worker thread (one at a time)
+        self.scheduler = TaskScheduler(self.root)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Reloading an updated export only re-reads the sheets/clients that changed
+        self.metrics = open_metrics()
+        self.metrics.on_record = lambda record: self.scheduler.call_soon(self.add_metrics_row, record)
+        self.engine = None      # GrantReportEngine, created on the worker thread (ensure_engine)
         self.workbook_path = None
-        self.workbook_sheets = {}   # sheet_name -> df
-        self.views = {}             # view_name -> df
         self.current_view_name = None
         self.df_current = None
-        self.df_display = None
+        self.filter_index = {}  # field -> value/token index for df_current
+        self.filter_values = {} # field -> dropdown values for df_current (None = not available)
+        self.filters = None     # FilterEngine over df_current; only used by worker jobs
+        self.positions = None   # row positions of df_current shown in the grid (last filter result)
+        self.total_clients = 0
+        self.autosize_pending = False
+        self.sort_column = None
+        self.sort_ascending = True
 
-        self.id_column = "Legacy Client ID"
-        self.max_preview_rows = 250
+        self.id_column = ID_COLUMN
 
         # Grant-focused filters (single-select dropdowns)
         self.filter_vars = {}   # field -> StringVar
         self.filter_combos = {} # field -> Combobox
-        self.filter_fields = [
-            "Funder",
-            "Type of Victimization",
-            "Gender",
-            "Homelessness",
-            "Program",
-            "Race/Ethnicity",
-            "Victim Type",
-            "Age at Time of Trafficking",
-            "Veteran Status",
-            "LGBTQ/Two-Spirited",
-            "Disability",
-            "Immigrant Status",
-            "Country of Citizenship",
-            "Primary Language",
-        ]
-
-        # Fields that can contain multi-select values separated by '|', ',' or '&'
-        self.multi_select_fields = {
-            "Race/Ethnicity",
-            "Disability",
-            "Victim Type",
-            "Homelessness",
-            "Age at Time of Trafficking",
-        }
-
-        # Keep the preview table “grant-like” (always show these first, if present)
-        self.preview_columns = [
-            self.id_column,
-            "Funder",
-            "Type of Victimization",
-            "Gender",
-            "Homelessness",
-            "Program",
-            "Race/Ethnicity",
-            "Victim Type",
-            "Age at Time of Trafficking",
-            "Veteran Status",
-            "LGBTQ/Two-Spirited",
-            "Disability",
-            "Immigrant Status",
-            "Country of Citizenship",
-            "Primary Language",
-        ]
+        self.option_values = {} # field -> {dropdown label "Value (N)": value}
+        # field -> (dropdown label, spec) for preset selections one dropdown value cannot show
+        self.preset_specs = {}
+        self.preset_store = open_preset_store()
+        self.filter_fields = list(FILTER_FIELDS)
+        self.preview_columns = list(PREVIEW_COLUMNS)
 
         self.create_widgets()
+        self.root.after(FIRST_PAINT_DELAY_MS, self.after_first_paint)
 
     def _setup_style(self):
         style = ttk.Style(self.root)
@@ -127,10 +151,53 @@ class GrantReportDemoApp:
         status_frame.pack(fill="x", padx=10, pady=(0, 6))
         self.lbl_pipeline_status = tk.Label(status_frame, text="Status: waiting for workbook…", fg="#333333")
         self.lbl_pipeline_status.pack(side="left")
+        self.btn_cancel = tk.Button(status_frame, text="Cancel", command=self.cancel_load, state="disabled")
+        self.btn_cancel.pack(side="right")
+        self.progress_bar = ttk.Progressbar(status_frame, mode="determinate", maximum=100, length=220)
+        self.progress_bar.pack(side="right", padx=8)
+        self.btn_metrics = tk.Button(status_frame, text="Metrics ▸", command=self.toggle_metrics_panel)
+        self.btn_metrics.pack(side="right")
+
+        # Per-stage metrics (collapsed until asked for)
+        self.metrics_frame = tk.Frame(self.root)
+        self.metrics_tree = ttk.Treeview(self.metrics_frame, show="headings", columns=METRICS_COLUMNS, height=8)
+        for col, width in zip(METRICS_COLUMNS, (320, 90, 90, 90, 90, 90)):
+            self.metrics_tree.heading(col, text=col)
+            self.metrics_tree.column(col, width=width, anchor="w" if col == "Stage" else "e")
+        self.metrics_tree.pack(side="left", fill="x", expand=True)
+        metrics_scroll = ttk.Scrollbar(self.metrics_frame, orient="vertical", command=self.metrics_tree.yview)
+        metrics_scroll.pack(side="right", fill="y")
+        self.metrics_tree.configure(yscrollcommand=metrics_scroll.set)
+        self.status_frame = status_frame
+
+        # Grant filters: the frame holds its place; its widgets come after the first paint
+        self.filter_frame = tk.LabelFrame(self.root, text="2) Grant Filters", padx=10, pady=10)
+        self.filter_frame.pack(fill="x", padx=10, pady=6)
+        self.filter_widgets_built = False
+
+        # Data Preview Section (Excel-like)
+        preview_outer = tk.LabelFrame(self.root, text="3) Client List Preview (Excel-like)", padx=10, pady=10)
+        preview_outer.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        # Counts bar above the grid
+        counts_frame = tk.Frame(preview_outer)
+        counts_frame.pack(fill="x", pady=(0, 6))
+        self.lbl_counts = tk.Label(counts_frame, text="Filtered clients: 0 of 0", fg="#111111", font=("Arial", 12, "bold"))
+        self.lbl_counts.pack(side="left")
+        self.lbl_rows = tk.Label(counts_frame, text="Rows: 0 of 0", fg="#333333")
+        self.lbl_rows.pack(side="left", padx=14)
+
+        # Grid itself: virtual rows, so every filtered row can be scrolled to
+        self.grid = VirtualGrid(preview_outer, row_height=28, on_sort=self.on_sort_column)
+        self.grid.pack(fill="both", expand=True)
+        self.tree = self.grid.tree
 
-        # Grant filters
-        filter_frame = tk.LabelFrame(self.root, text="2) Grant Filters", padx=10, pady=10)
-        filter_frame.pack(fill="x", padx=10, pady=6)
+    def ensure_filter_widgets(self):
+        """Build the grant filter dropdowns and preset row (once)."""
+        if self.filter_widgets_built:
+            return
+        self.filter_widgets_built = True
+        filter_frame = self.filter_frame
 
         grid = tk.Frame(filter_frame)
         grid.pack(fill="x")
@@ -155,39 +222,101 @@ class GrantReportDemoApp:
             controls, text="Clear Filters", command=self.clear_grant_filters, state="disabled"
         )
         self.btn_clear_grant_filters.pack(side="left")
+        self.btn_crosstab = tk.Button(
+            controls, text="Cross-tab…", command=self.open_crosstab_window, state="disabled"
+        )
+        self.btn_crosstab.pack(side="left", padx=(8, 0))
+        self.btn_export = tk.Button(
+            controls, text="Export List…", command=self.export_client_list, state="disabled"
+        )
+        self.btn_export.pack(side="left", padx=(8, 0))
         self.lbl_active_filters = tk.Label(controls, text="Active filters: (none)", fg="#555555")
         self.lbl_active_filters.pack(side="left", padx=12)
 
-        # Data Preview Section (Excel-like)
-        preview_outer = tk.LabelFrame(self.root, text="3) Client List Preview (Excel-like)", padx=10, pady=10)
-        preview_outer.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        # Saved filter presets (one per funder recipe)
+        presets = tk.Frame(filter_frame)
+        presets.pack(fill="x", pady=(8, 0))
+        tk.Label(presets, text="Preset:").pack(side="left")
+        self.combo_preset = ttk.Combobox(presets, state="disabled", width=36)
+        self.combo_preset.pack(side="left", padx=(6, 8))
+        self.combo_preset.bind("<<ComboboxSelected>>", self.apply_preset)
+        self.btn_save_preset = tk.Button(presets, text="Save Preset…", command=self.save_preset, state="disabled")
+        self.btn_save_preset.pack(side="left")
+        self.btn_delete_preset = tk.Button(presets, text="Delete", command=self.delete_preset, state="disabled")
+        self.btn_delete_preset.pack(side="left", padx=(8, 0))
+        self.btn_run_presets = tk.Button(
+            presets, text="Run All Presets…", command=self.run_all_presets, state="disabled"
+        )
+        self.btn_run_presets.pack(side="left", padx=(8, 0))
 
-        # Counts bar above the grid
-        counts_frame = tk.Frame(preview_outer)
-        counts_frame.pack(fill="x", pady=(0, 6))
-        self.lbl_counts = tk.Label(counts_frame, text="Filtered clients: 0 of 0", fg="#111111", font=("Arial", 12, "bold"))
-        self.lbl_counts.pack(side="left")
-        self.lbl_rows = tk.Label(counts_frame, text="Rows: 0 of 0", fg="#333333")
-        self.lbl_rows.pack(side="left", padx=14)
+    def after_first_paint(self):
+        self.ensure_filter_widgets()
+        # Import pandas and the Excel stack while the user picks a file
+        self.scheduler.submit(self.prewarm_job, key="prewarm", on_error=lambda error: None)
 
-        # Grid itself
-        preview_frame = tk.Frame(preview_outer)
-        preview_frame.pack(fill="both", expand=True)
+    def prewarm_job(self, task):
+        self.ensure_engine()
+        try:
+            import openpyxl  # noqa: F401  (read by load_workbook; only imported on first use)
+        except ImportError:
+            pass
 
-        self.tree = ttk.Treeview(preview_frame, show="headings")
-        self.tree.pack(side="left", fill="both", expand=True)
+    def ensure_engine(self):
+        """The report engine, created on first use. Worker thread only: it imports pandas."""
+        if self.engine is None:
+            from grantEngine import GrantReportEngine
 
-        scrollbar_y = ttk.Scrollbar(preview_frame, orient="vertical", command=self.tree.yview)
-        scrollbar_y.pack(side="right", fill="y")
-        scrollbar_x = ttk.Scrollbar(preview_frame, orient="horizontal", command=self.tree.xview)
-        scrollbar_x.pack(side="bottom", fill="x")
-        self.tree.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+            self.engine = GrantReportEngine(
+                log=self.log, cache=open_workbook_cache(), incremental=True, metrics=self.metrics,
+                store=open_client_store(),
+            )
+        return self.engine
 
     def log(self, message):
+        # Engine messages come from the worker thread; widgets are only touched on the Tk thread
+        self.scheduler.call_soon(self.show_status, message)
+
+    def show_status(self, message):
         # Keep the demo clean: show status in a single readable line
-        if hasattr(self, "lbl_pipeline_status"):
-            self.lbl_pipeline_status.config(text=f"Status: {message}")
-        self.root.update()
+        self.lbl_pipeline_status.config(text=f"Status: {message}")
+
+    def show_progress(self, fraction, message=None):
+        self.progress_bar.config(value=round(fraction * 100))
+        if message:
+            self.show_status(f"{message} ({fraction:.0%})")
+
+    def on_task_error(self, error):
+        self.btn_cancel.config(state="disabled")
+        self.show_progress(0.0)
+        self.show_status(f"Error: {error}")
+
+    def toggle_metrics_panel(self):
+        if self.metrics_frame.winfo_ismapped():
+            self.metrics_frame.pack_forget()
+            self.btn_metrics.config(text="Metrics ▸")
+        else:
+            self.metrics_frame.pack(fill="x", padx=10, pady=(0, 6), after=self.status_frame)
+            self.btn_metrics.config(text="Metrics ▾")
+
+    def add_metrics_row(self, record):
+        def cell(value):
+            return "" if value is None else value
+        stage = "  " * record.get("depth", 0) + record["stage"]
+        if record.get("error"):
+            stage += f" [{record['error']}]"
+        row = self.metrics_tree.insert("", "end", values=(
+            stage, f"{record['seconds']:.3f}", cell(record.get("rows_in")), cell(record.get("rows_out")),
+            cell(record.get("rss_mib")), cell(record.get("peak_rss_growth_mib")),
+        ))
+        children = self.metrics_tree.get_children()
+        if len(children) > METRICS_PANEL_ROWS:
+            self.metrics_tree.delete(*children[:len(children) - METRICS_PANEL_ROWS])
+        self.metrics_tree.see(row)
+
+    def on_close(self):
+        self.scheduler.shutdown()
+        self.metrics.close()
+        self.root.destroy()
 
     def load_file(self):
         filename = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx")])
@@ -196,201 +325,46 @@ class GrantReportDemoApp:
 
         self.workbook_path = filename
         self.lbl_status.config(text=f"Loaded: {filename.split('/')[-1]}", fg="green")
-        
-        # Start simulated processing thread
-        threading.Thread(target=self.process_file, args=(filename,), daemon=True).start()
+        self.process_file(filename)
 
     def process_file(self, filename):
-        try:
-            self.log("Reading Apricot Workbook (all tabs)...")
-            xl = pd.ExcelFile(filename)
-            time.sleep(1) # Fake delay for effect
-
-            # Load all sheets
-            self.workbook_sheets = {}
-            for sheet in xl.sheet_names:
-                try:
-                    df = xl.parse(sheet)
-                    self.workbook_sheets[sheet] = df
-                except Exception:
-                    # If a sheet fails, skip it for demo purposes
-                    continue
+        """Load a workbook on the worker thread; the window stays responsive and can cancel it."""
+        self.btn_cancel.config(state="normal")
+        self.scheduler.submit(
+            self.load_job, filename, key="load",
+            on_done=self.on_workbook_loaded, on_error=self.on_task_error, on_progress=self.show_progress,
+        )
 
-            self.log(f"Loaded {len(self.workbook_sheets)} sheets.")
-            self.log("Understanding tabs (columns + common jumbled fields)...")
-            time.sleep(0.5)
-
-            # Build views:
-            # - Individual sheet views
-            # - A combined/merged view (like Fake Report)
-            self.views = {}
-            for sheet_name, df in self.workbook_sheets.items():
-                self.views[f"Sheet: {sheet_name}"] = df
-
-            merged_view = self.build_merged_report_view(xl)
-            if merged_view is not None:
-                self.views["Merged Report View (Fake Report-style)"] = merged_view
-
-            # If "New Client Demographics" exists, expose it prominently (often ~60 clients)
-            if "New Client Demographics" in self.workbook_sheets:
-                self.views["New Client Demographics (combined tab)"] = self.workbook_sheets["New Client Demographics"]
-
-            # Pick a default view
-            if "New Client Demographics (combined tab)" in self.views:
-                self.current_view_name = "New Client Demographics (combined tab)"
-            elif "Merged Report View (Fake Report-style)" in self.views:
-                self.current_view_name = "Merged Report View (Fake Report-style)"
-            else:
-                self.current_view_name = list(self.views.keys())[0] if self.views else None
-
-            # Update GUI
-            self.root.after(0, self.populate_view_selector)
-            self.root.after(0, lambda: self.set_view(self.current_view_name))
-            self.root.after(0, self.enable_grant_filters)
-            self.log("Workbook ready. Use grant filters to drill down.")
-
-        except Exception as e:
-            self.log(f"Error: {str(e)}")
-
-    def build_merged_report_view(self, xl):
-        """
-        Build a merged dataset that resembles the "Fake Report" output:
-        one row per client (deduped) with key demographic columns.
-        """
-        self.log("Creating merged report view (deduplicate to 1 row/client)...")
-
-        # Prefer the already-combined tab when present, but normalize it
-        if "New Client Demographics" in self.workbook_sheets:
-            df = self.workbook_sheets["New Client Demographics"].copy()
-            df = self.ensure_id_column(df)
-            df = self.apply_light_normalizations(df)
-            df = self.dedupe_clients(df)
-            return df
-
-        # Otherwise: merge across known sheets (demo version of the Guide process)
-        sheet_mappings = {
-            "Race - Rows": [self.id_column, "Race/Ethnicity", "Program", "Funder", "Type of Victimization"],
-            "Gender - Rows": [self.id_column, "Gender", "Funder", "Type of Victimization"],
-            "Age of Victim - Rows": [self.id_column, "Date of Birth", "Funder", "Type of Victimization"],
-            "Disability, Veteran, LG - Rows": [
-                self.id_column,
-                "Veteran Status",
-                "LGBTQ/Two-Spirited",
-                "Disability",
-                "Country of Citizenship",
-                "Primary Language",
-                "Immigrant Status",
-            ],
-            "Victimization Type - Rows": [
-                self.id_column,
-                "Type of Victimization",
-                "Victim Type",
-                "Age at Time of Trafficking",
-                "Funder",
-            ],
-            "Homelessness - Rows": [self.id_column, "Homelessness", "Funder", "Type of Victimization"],
-        }
+    def load_job(self, task, filename):
+        # Every engine progress report is also a cancellation point
+        self.ensure_engine()
+        self.engine.progress_callback = task.progress
+        try:
+            self.engine.load_workbook(filename)
+        finally:
+            self.engine.progress_callback = None
+        return self.engine.default_view_name
 
-        merged_df = None
-        loaded_any = False
-        for sheet, cols in sheet_mappings.items():
-            if sheet not in self.workbook_sheets:
-                continue
-            df = self.workbook_sheets[sheet].copy()
-            df = self.ensure_id_column(df)
-            keep_cols = [c for c in cols if c in df.columns]
-            df = df[keep_cols]
-            df = df.drop_duplicates(subset=[self.id_column])
-            loaded_any = True
-            if merged_df is None:
-                merged_df = df
-            else:
-                merged_df = pd.merge(merged_df, df, on=self.id_column, how="outer")
-
-        if not loaded_any or merged_df is None:
-            return None
-
-        merged_df = self.apply_light_normalizations(merged_df)
-        merged_df = self.dedupe_clients(merged_df)
-        return merged_df
-
-    def ensure_id_column(self, df):
-        if self.id_column in df.columns:
-            return df
-        # best-effort: if there is any column that looks like legacy client id
-        for c in df.columns:
-            if str(c).strip().lower() in {"legacy client id", "legacy_client_id", "legacy id"}:
-                df = df.rename(columns={c: self.id_column})
-                return df
-        return df
-
-    def apply_light_normalizations(self, df):
-        df = df.copy()
-
-        if "Type of Victimization" in df.columns:
-            self.log("Normalizing 'Type of Victimization' (comma/ampersand variants)...")
-            df["Type of Victimization"] = df["Type of Victimization"].apply(self.normalize_victimization)
-            time.sleep(0.2)
-
-        if "Country of Citizenship" in df.columns:
-            self.log("Standardizing 'Country of Citizenship' (typos)...")
-            df["Country of Citizenship"] = df["Country of Citizenship"].apply(self.normalize_citizenship)
-            time.sleep(0.2)
-
-        # For demo: keep raw “jumbled” exports but normalize blanks to ""
-        for col in ["Race/Ethnicity", "Disability", "Victim Type", "Homelessness", "Age at Time of Trafficking"]:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda v: "" if v is None or str(v).strip().lower() == "nan" else str(v).strip())
-        return df
-
-    def dedupe_clients(self, df):
-        if self.id_column in df.columns:
-            before_rows = len(df)
-            before_ids = df[self.id_column].nunique(dropna=True)
-            df = df.drop_duplicates(subset=[self.id_column])
-            after_rows = len(df)
-            after_ids = df[self.id_column].nunique(dropna=True)
-            self.log(f"Deduped clients: rows {before_rows} → {after_rows}, unique IDs {before_ids} → {after_ids}")
-            return df
-        # If no ID column, do a full-row dedupe
-        before_rows = len(df)
-        df = df.drop_duplicates()
-        self.log(f"Deduped rows (no ID column): {before_rows} → {len(df)}")
-        return df
-
-    def normalize_victimization(self, value):
-        val_str = str(value).lower()
-        if 'sex trafficking' in val_str and 'labor trafficking' in val_str:
-            return 'Both Sex & Labor Trafficking'
-        elif 'sex trafficking' in val_str:
-            return 'Sex Trafficking'
-        elif 'labor trafficking' in val_str:
-            return 'Labor Trafficking'
-        if value is None or str(value).strip() == "" or str(value).strip().lower() == "nan":
-            return ""
-        # preserve as-is but bucket it
-        return 'Other/Exploitation'
-
-    def normalize_citizenship(self, value):
-        val_str = str(value).strip()
-        if val_str.lower() in ['nicaragua', 'nicaraugua', 'niceragua', 'nicaragua ', 'nicaragua.']:
-            return 'Nicaragua'
-        if val_str.lower() == "nicaragua":
-            return "Nicaragua"
-        return val_str
+    def on_workbook_loaded(self, view_name):
+        self.btn_cancel.config(state="disabled")
+        self.current_view_name = view_name
+        self.populate_view_selector()
+        self.ensure_filter_widgets()
+        self.enable_grant_filters()
+        self.set_view(view_name)
+
+    def cancel_load(self):
+        # Too late once parsing finished: the result is already on its way
+        if self.scheduler.cancel("load"):
+            self.show_progress(0.0)
+            self.show_status("Load cancelled; the previous workbook stays loaded.")
+        self.btn_cancel.config(state="disabled")
 
     def populate_view_selector(self):
-        if not self.views:
-            self.combo_view["values"] = []
-            return
-        names = list(self.views.keys())
-        # Prefer putting key views at top if present
-        preferred = [
-            "New Client Demographics (combined tab)",
-            "Merged Report View (Fake Report-style)",
-        ]
-        ordered = [n for n in preferred if n in names] + [n for n in names if n not in preferred]
+        ordered = self.engine.ordered_view_names()
         self.combo_view["values"] = ordered
+        if not ordered:
+            return
         if self.current_view_name in ordered:
             self.combo_view.set(self.current_view_name)
         else:
@@ -404,6 +378,12 @@ class GrantReportDemoApp:
         for _field, combo in self.filter_combos.items():
             combo.configure(state="readonly")
         self.btn_clear_grant_filters.config(state="normal")
+        self.btn_crosstab.config(state="normal")
+        self.btn_export.config(state="normal")
+        if self.preset_store is not None:
+            self.combo_preset.configure(state="readonly", values=self.preset_store.names())
+            for button in (self.btn_save_preset, self.btn_delete_preset, self.btn_run_presets):
+                button.config(state="normal")
 
     def refresh_filters_for_view(self):
         """Populate each grant filter dropdown with values from the current view."""
@@ -414,45 +394,25 @@ class GrantReportDemoApp:
             combo = self.filter_combos[field]
             var = self.filter_vars[field]
 
-            if field not in self.df_current.columns:
+            values = self.filter_values[field]
+            if values is None:
                 combo.configure(state="disabled")
                 combo["values"] = ["(Not available)"]
                 var.set("(Not available)")
                 continue
 
             combo.configure(state="readonly")
-            series = self.df_current[field].dropna().astype(str)
-            if series.empty:
-                combo["values"] = ["All"]
-                var.set("All")
-                continue
-
-            # For multi-select fields, split on separators so each choice is clean/consistent
-            if field in self.multi_select_fields:
-                tokens = []
-                for v in series:
-                    parts = re.split(r"[|,&]", v)
-                    for p in parts:
-                        p = p.strip()
-                        if p:
-                            tokens.append(p)
-                if tokens:
-                    vals = pd.Series(tokens)
-                else:
-                    vals = series
-            else:
-                vals = series
-
-            top_vals = vals.value_counts().head(100).index.tolist()
-            combo["values"] = ["All"] + top_vals
+            combo["values"] = ["All"] + values
             var.set("All")
+        self.option_values = {}
+        self.preset_specs = {}
 
         self.lbl_active_filters.config(text="Active filters: (none)")
 
     def clear_grant_filters(self):
         for field in self.filter_fields:
             if field in self.filter_vars:
-                if self.filter_vars[field].get().startswith("("):
+                if self.filter_values.get(field) is None:
                     continue
                 self.filter_vars[field].set("All")
         self.apply_grant_filters()
@@ -461,114 +421,401 @@ class GrantReportDemoApp:
         if self.df_current is None:
             return
 
-        df = self.df_current.copy()
-        active = []
+        # Dropdown entries carry a count suffix; filter (and show) the bare value
+        for field, var in self.filter_vars.items():
+            value = self.option_values.get(field, {}).get(var.get())
+            if value is not None:
+                var.set(value)
+
+        selections = self.current_selections()
+        sort = (self.sort_column, self.sort_ascending) if self.sort_column is not None else None
+        # A newer request replaces one still waiting or running; dropdown changes are debounced
+        self.scheduler.submit(
+            self.filter_job, self.current_view_name, self.filters, selections, sort, key="filter",
+            delay_ms=FILTER_DEBOUNCE_MS if event is not None else 0,
+            on_done=self.show_filtered, on_error=self.on_task_error,
+        )
 
-        for field in self.filter_fields:
-            if field not in df.columns:
-                continue
-            selected = self.filter_vars[field].get()
-            if not selected or selected == "All" or selected.startswith("("):
-                continue
-            selected_str = str(selected)
-            col_series = df[field].astype(str)
+    def current_selections(self):
+        """{field: selection} shown in the dropdowns, with preset specs behind their "(…)" labels."""
+        self.preset_specs = {
+            field: (label, spec) for field, (label, spec) in self.preset_specs.items()
+            if self.filter_vars[field].get() == label
+        }
+        selections = {field: var.get() for field, var in self.filter_vars.items()}
+        for field, (_label, spec) in self.preset_specs.items():
+            selections[field] = spec
+        return selections
 
-            if field in self.multi_select_fields:
-                # Match if any token in the jumbled text equals the selected value
-                mask = col_series.apply(
-                    lambda v: selected_str in [p.strip() for p in re.split(r"[|,&]", v) if p.strip()]
-                )
-                df = df[mask]
+    # ---- Presets ----
+
+    def apply_preset(self, event=None):
+        from grantFilters import parse_selection
+
+        name = self.combo_preset.get()
+        if self.df_current is None or not name:
+            return
+        spec = self.preset_store.get(name)
+        self.preset_specs = {}
+        for field, var in self.filter_vars.items():
+            if self.filter_values.get(field) is None:
+                continue
+            values, negate = parse_selection(spec.get(field))
+            if not values:
+                var.set("All")
+            elif len(values) == 1 and not negate:
+                var.set(values[0])
             else:
-                df = df[col_series == selected_str]
-            active.append(f"{field}={selected}")
+                # Lists and NOT have no single dropdown entry: show a label, filter by the spec
+                label = f"({'not ' if negate else ''}{' or '.join(values)})"
+                var.set(label)
+                self.preset_specs[field] = (label, spec[field])
+        self.apply_grant_filters()
+
+    def save_preset(self):
+        from grantFilters import is_unset_selection
+
+        spec = {f: s for f, s in self.current_selections().items() if not is_unset_selection(s)}
+        if not spec:
+            messagebox.showinfo("Save preset", "Pick at least one grant filter first.")
+            return
+        name = simpledialog.askstring("Save preset", "Preset name (e.g. the funder):", parent=self.root)
+        if not name or not name.strip():
+            return
+        self.preset_store.save(name.strip(), spec)
+        self.combo_preset.configure(values=self.preset_store.names())
+        self.combo_preset.set(name.strip())
+        self.log(f"Saved preset '{name.strip()}'.")
+
+    def delete_preset(self):
+        name = self.combo_preset.get()
+        if name and messagebox.askyesno("Delete preset", f"Delete preset '{name}'?"):
+            self.preset_store.delete(name)
+            self.combo_preset.configure(values=self.preset_store.names())
+            self.combo_preset.set("")
+
+    def run_all_presets(self):
+        """Counts for every saved preset over the current view (one filter pass each, shared masks)."""
+        if self.df_current is None or not self.preset_store.presets:
+            return
+        presets = dict(self.preset_store.presets)
+        self.scheduler.submit(
+            self.presets_job, self.df_current, presets, self.filter_index, key="presets",
+            on_done=self.open_presets_window, on_error=self.on_task_error,
+        )
 
-        self.df_display = df
-        self.refresh_table()
-        self.update_counts_footer()
+    def presets_job(self, task, df, presets, index):
+        return df, presets, self.engine.evaluate_presets(df, presets, index)
+
+    def open_presets_window(self, result):
+        from grantExport import EXPORT_FORMATS
+        from grantPresets import results_frame
+
+        df, presets, results = result
+        win = tk.Toplevel(self.root)
+        win.title(f"Presets: {self.current_view_name}")
+        win.geometry("900x420")
+        top = tk.Frame(win)
+        top.pack(fill="x", padx=10, pady=8)
+        tk.Label(top, text=f"{len(results)} presets over {len(df)} rows").pack(side="left")
+        combo_format = ttk.Combobox(top, state="readonly", width=10, values=[e.lstrip(".") for e in EXPORT_FORMATS])
+        combo_format.set("xlsx")
+
+        def export_all():
+            folder = filedialog.askdirectory(title="Folder for the preset client lists")
+            if not folder:
+                return
+            ext = combo_format.get()
+            paths = {name: os.path.join(folder, f"{preset_file_name(name)}.{ext}") for name in presets}
+            self.scheduler.submit(
+                self.presets_export_job, df, presets, results, paths, os.path.join(folder, f"presets.{ext}"),
+                key="export", on_done=self.on_exported, on_error=self.on_task_error, on_progress=self.show_progress,
+            )
+
+        tk.Button(top, text="Export All…", command=export_all).pack(side="right")
+        combo_format.pack(side="right", padx=6)
+
+        summary = results_frame(results)
+        tree = ttk.Treeview(win, show="headings", columns=list(summary.columns))
+        tree.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        for col, width in zip(summary.columns, (260, 80, 80, 440)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width, anchor="w")
+        for row in summary.itertuples(index=False, name=None):
+            tree.insert("", "end", values=row)
+
+    def presets_export_job(self, task, df, presets, results, paths, summary_path):
+        from grantExport import export_frame
+        from grantPresets import results_frame
+
+        # All client lists in one pass over the view, then the counts summary
+        progress = lambda f: task.progress(f, "Exporting presets")
+        self.engine.write_presets(df, presets, paths, progress=progress, results=results)
+        self.log(export_frame(results_frame(results), summary_path).describe())
+        return summary_path
+
+    def filter_job(self, task, view_name, filters, selections, sort):
+        # Only fields whose selection changed get their mask recomputed
+        with self.metrics.stage("filter", rows_in=len(filters.df), view=view_name) as stage:
+            filters.update(selections)
+            if filters.sort != sort:
+                filters.sort_by(*(sort or (None,)))
+            positions = filters.positions()
+            stage.rows_out = len(positions)
+        task.check()
+        clients, rows = self.engine.filtered_counts(view_name, filters)
+        task.check()
+        return {
+            "filters": filters,
+            "positions": positions,
+            "clients": clients,
+            "rows": rows,
+            "dropdown_counts": self.engine.dropdown_counts(view_name, filters),
+            "active": filters.active_labels(),
+        }
+
+    def show_filtered(self, result):
+        if result["filters"] is not self.filters:
+            return   # computed for a view that is no longer shown
+        self.positions = result["positions"]
+        active = result["active"]
+        with self.metrics.stage("table_refresh", rows_in=len(self.positions)):
+            self.refresh_table()
+        self.update_counts_footer(result["clients"], result["rows"])
+        self.refresh_dropdown_counts(result["dropdown_counts"])
         self.lbl_active_filters.config(text="Active filters: " + (", ".join(active) if active else "(none)"))
+        if self.autosize_pending:
+            self.autosize_pending = False
+            with self.metrics.stage("autosize"):
+                self.autosize_treeview_columns()
+
+    def ask_export_path(self, title, initialfile):
+        return filedialog.asksaveasfilename(
+            title=title,
+            initialfile=initialfile,
+            defaultextension=".xlsx",
+            filetypes=[("Excel Workbook", "*.xlsx"), ("CSV", "*.csv"), ("Parquet", "*.parquet")],
+        )
 
-    def update_counts_footer(self):
-        if self.df_current is None or self.df_display is None:
+    def export_client_list(self):
+        """Write every filtered row (not just the preview), in grid order, in the background."""
+        if self.positions is None:
+            return
+        path = self.ask_export_path("Export filtered client list", "client_list.xlsx")
+        if not path:
+            return
+        self.scheduler.submit(
+            self.export_job, self.df_current, self.positions, path, key="export",
+            on_done=self.on_exported, on_error=self.on_task_error, on_progress=self.show_progress,
+        )
+
+    def export_job(self, task, df, positions, path):
+        self.engine.write_results(df, path, positions=positions, progress=lambda f: task.progress(f, "Exporting"))
+        return path
+
+    def on_exported(self, path):
+        self.show_progress(1.0)
+        messagebox.showinfo("Export complete", f"Saved {path}")
+
+    def open_crosstab_window(self):
+        """Unique clients by two grant fields over the filtered rows (multi-select values count in each bucket)."""
+        from grantAggregate import pivot
+        from grantExport import export_frame
+
+        if self.filters is None:
+            return
+        fields = [f for f in self.filter_fields if f in self.df_current.columns]
+        if not fields:
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Cross-tab: unique clients")
+        win.geometry("900x480")
+
+        top = tk.Frame(win)
+        top.pack(fill="x", padx=10, pady=8)
+        tk.Label(top, text="Rows:").pack(side="left")
+        combo_rows = ttk.Combobox(top, state="readonly", width=28, values=fields)
+        combo_rows.pack(side="left", padx=(4, 14))
+        tk.Label(top, text="Columns:").pack(side="left")
+        combo_cols = ttk.Combobox(top, state="readonly", width=28, values=["(none)"] + fields)
+        combo_cols.pack(side="left", padx=4)
+        lbl_note = tk.Label(win, text="", fg="#555555")
+        lbl_note.pack(fill="x", padx=10)
+
+        tree = ttk.Treeview(win, show="headings")
+        tree.pack(fill="both", expand=True, padx=10, pady=(4, 10))
+        shown = {}   # the last table drawn, for export
+
+        def export_job(task, table, path):
+            self.log(export_frame(table, path).describe())
+            return path
+
+        def export():
+            if "table" not in shown:
+                return
+            path = self.ask_export_path("Export cross-tab", "crosstab.xlsx")
+            if path:
+                self.scheduler.submit(
+                    export_job, shown["table"], path, key="export",
+                    on_done=self.on_exported, on_error=self.on_task_error,
+                )
+
+        tk.Button(top, text="Export…", command=export).pack(side="right")
+
+        def crosstab_job(task, df, group, filters):
+            return group, self.engine.crosstab(df, group, filters), filters.active_labels()
+
+        def refresh(event=None):
+            row_field, col_field = combo_rows.get(), combo_cols.get()
+            group = [row_field] if col_field in ("", "(none)", row_field) else [row_field, col_field]
+            lbl_note.config(text="Counting…")
+            self.scheduler.submit(
+                crosstab_job, self.df_current, group, self.filters, key="crosstab",
+                on_done=show, on_error=self.on_task_error,
+            )
+
+        def show(result):
+            group, table, active = result
+            shown["table"] = table
+            row_field, col_field = group[0], group[-1]
+            value = "Clients" if "Clients" in table.columns else "Rows"
+            if len(group) > 1:
+                wide = pivot(table, row_field, col_field, value)
+                headers = [row_field] + [str(c) for c in wide.columns]
+                rows = [[label] + list(values) for label, values in zip(wide.index, wide.to_numpy().tolist())]
+            else:
+                headers = [row_field, value]
+                rows = table[[row_field, value]].to_numpy().tolist()
+            tree.delete(*tree.get_children())
+            tree["columns"] = headers
+            for h in headers:
+                tree.heading(h, text=h)
+                tree.column(h, width=max(90, min(220, len(h) * 9)), anchor="w")
+            for r in rows:
+                tree.insert("", "end", values=r)
+            lbl_note.config(text=f"{value} over the filtered rows: " + (", ".join(active) if active else "(no filters)"))
+
+        combo_rows.bind("<<ComboboxSelected>>", refresh)
+        combo_cols.bind("<<ComboboxSelected>>", refresh)
+        combo_rows.set(fields[0])
+        combo_cols.set(fields[1] if len(fields) > 1 else "(none)")
+        refresh()
+
+    def update_counts_footer(self, shown_clients=0, shown_rows=0):
+        if self.df_current is None or self.filters is None:
             self.lbl_counts.config(text="Filtered clients: 0 of 0")
             self.lbl_rows.config(text="Rows: 0 of 0")
             return
 
         total_rows = len(self.df_current)
-        shown_rows = len(self.df_display)
-
-        total_clients = (
-            self.df_current[self.id_column].nunique(dropna=True)
-            if self.id_column in self.df_current.columns
-            else total_rows
-        )
-        shown_clients = (
-            self.df_display[self.id_column].nunique(dropna=True)
-            if self.id_column in self.df_display.columns
-            else shown_rows
-        )
+        total_clients = self.total_clients
 
         self.lbl_counts.config(text=f"Filtered clients: {shown_clients} of {total_clients}")
-        if shown_rows > self.max_preview_rows:
-            self.lbl_rows.config(text=f"Rows: {shown_rows} of {total_rows} (preview shows first {self.max_preview_rows})")
-        else:
-            self.lbl_rows.config(text=f"Rows: {shown_rows} of {total_rows}")
+        self.lbl_rows.config(text=f"Rows: {shown_rows} of {total_rows}")
+
+    def refresh_dropdown_counts(self, counts):
+        """Show next to each dropdown value how many clients picking it would leave."""
+        self.option_values = {}
+        for field, field_counts in counts.items():
+            values = self.filter_values[field]
+            labels = {(f"{v} ({field_counts[v]})" if v in field_counts else v): v for v in values}
+            self.option_values[field] = labels
+            self.filter_combos[field]["values"] = ["All"] + list(labels)
 
     def set_view(self, view_name):
-        if not view_name or view_name not in self.views:
+        if self.engine is None or not view_name or view_name not in self.engine.views:
             return
         self.current_view_name = view_name
-        self.df_current = self.views[view_name].copy()
-        self.df_current = self.ensure_id_column(self.df_current)
-        self.df_current = self.apply_light_normalizations(self.df_current)
-        self.df_current = self.dedupe_clients(self.df_current)
+        # Results for the previous view are of no use any more
+        self.scheduler.cancel("filter")
+        self.scheduler.submit(
+            self.view_job, view_name, key="view",
+            on_done=self.show_view, on_error=self.on_task_error, on_progress=self.show_progress,
+        )
+
+    def view_job(self, task, view_name):
+        """Worker: everything a view needs before it is shown (memoized by the engine: switching back is free)."""
+        steps = [
+            ("Preparing view", self.engine.prepare_view),
+            ("Indexing filter values", self.engine.view_filter_index),
+            ("Listing filter values", self.engine.view_filter_values),
+            ("Precomputing counts", self.engine.view_cube),
+        ]
+        for i, (message, step) in enumerate(steps):
+            task.progress(i / len(steps), message)
+            step(view_name)
+        df = self.engine.prepare_view(view_name)
+        index = self.engine.view_filter_index(view_name)
+        return {
+            "view_name": view_name,
+            "df": df,
+            "index": index,
+            "values": self.engine.view_filter_values(view_name),
+            "filters": self.engine.filter_engine(df, index),
+            "total_clients": self.engine.count_clients(df),
+        }
 
-        self.df_display = self.df_current.copy()
+    def show_view(self, state):
+        self.show_progress(1.0)
+        self.show_status("Workbook ready. Use grant filters to drill down.")
+        self.current_view_name = state["view_name"]
+        self.df_current = state["df"]
+        self.filter_index = state["index"]
+        self.filter_values = state["values"]
+        self.filters = state["filters"]
+        self.total_clients = state["total_clients"]
+        self.positions = None
+        self.sort_column = None
+        self.sort_ascending = True
+        self.grid.set_columns(self.engine.report_columns(self.df_current))
 
         self.refresh_filters_for_view()
+        self.autosize_pending = True
         self.apply_grant_filters()
-        self.autosize_treeview_columns()
 
     # (Removed: generic “Column/Value” stackable filters and long overview text.
     # This demo uses grant-focused dropdown filters and an Excel-like preview grid.)
 
     def refresh_table(self):
-        if self.df_display is None:
+        if self.positions is None:
             return
+        # The grid pulls only the rows it is about to draw
+        self.grid.set_source(len(self.positions), self.fetch_grid_rows)
 
-        # Clear existing
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-            
-        # Set columns (grant-style)
-        cols = [c for c in self.preview_columns if c in self.df_display.columns]
-        if not cols:
-            cols = list(self.df_display.columns)
-        self.tree["columns"] = cols
-        for col in cols:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=140, anchor="w")
+    def fetch_grid_rows(self, start, stop):
+        # DataFrame.take or, for a stored view, a query for just these rows
+        window = self.df_current.take(self.positions[start:stop])
+        return window[self.grid.columns].itertuples(index=False, name=None)
 
-        # Add rows
-        df_to_show = self.df_display.head(self.max_preview_rows)
-        for _index, row in df_to_show.iterrows():
-            self.tree.insert("", "end", values=[row.get(c, "") for c in cols])
+    def on_sort_column(self, column):
+        """Heading click: sort the backing rows by that column (click again to reverse)."""
+        if self.filters is None:
+            return
+        if self.sort_column == column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            if self.sort_column is not None:
+                self.grid.set_heading_text(self.sort_column, self.sort_column)
+            self.sort_column = column
+            self.sort_ascending = True
+        self.grid.set_heading_text(column, f"{column} {'▲' if self.sort_ascending else '▼'}")
+        self.apply_grant_filters()
 
     def autosize_treeview_columns(self):
         """Best-effort column sizing so the grid looks like an Excel export (readable)."""
-        if self.df_display is None:
+        if self.positions is None:
             return
-        cols = self.tree["columns"]
+        cols = self.grid.columns
         if not cols:
             return
-        sample = self.df_display.head(40)
+        sample = self.df_current.take(self.positions[:40])
         for c in cols:
             max_len = max(10, len(str(c)))
             if c in sample.columns:
                 for v in sample[c].astype(str).tolist():
                     max_len = max(max_len, min(len(v), 55))
             px = min(420, max(120, max_len * 7))
-            self.tree.column(c, width=px)
+            self.grid.set_column_width(c, px)
 
 if __name__ == "__main__":
     root = tk.Tk()
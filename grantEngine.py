@@ -0,0 +1,1077 @@
+"""
+Headless grant report engine.
+
+Everything the demo GUI does to an Apricot export (read the workbook, build the
+merged client view, normalize, de-duplicate, apply grant filters, write the
+client list) lives here without any Tk dependency, so it can run on a report
+server or from the command line:
+
+    python grantEngine.py export.xlsx --filter "Funder=OVC" --output clients.csv
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from grantAggregate import CLIENTS, CUBE_MAX_BYTES, CUBE_MAX_DIMS, AggregateCube, crosstab, pivot
+from grantCache import CACHE_VERSION, FUZZY_MATCHES, FuzzyMatchCache, WorkbookCache, file_digest
+from grantExport import EXPORT_FORMATS, export_frame, export_masks
+from grantFields import FILTER_FIELDS, ID_COLUMN, MULTI_SELECT_FIELDS, PREVIEW_COLUMNS
+from grantFilters import FilterEngine, is_unset_selection
+from grantIndex import build_index
+from grantIncremental import ClientChanges, client_fingerprints, diff_clients
+from grantLoader import DEFAULT_CHUNK_ROWS, categorize_columns, load_sheets, sheet_fingerprints
+from grantMetrics import Metrics
+from grantNormalize import NormalizationRules, merge_rules
+from grantPresets import check_presets, evaluate_presets, load_presets, preset_file_name, read_spec_file, results_frame
+from grantStore import ClientStore, StoreView
+
+# Sheets merged into the report view when there is no combined demographics tab
+SHEET_MAPPINGS = {
+    "Race - Rows": [ID_COLUMN, "Race/Ethnicity", "Program", "Funder", "Type of Victimization"],
+    "Gender - Rows": [ID_COLUMN, "Gender", "Funder", "Type of Victimization"],
+    "Age of Victim - Rows": [ID_COLUMN, "Date of Birth", "Funder", "Type of Victimization"],
+    "Disability, Veteran, LG - Rows": [
+        ID_COLUMN,
+        "Veteran Status",
+        "LGBTQ/Two-Spirited",
+        "Disability",
+        "Country of Citizenship",
+        "Primary Language",
+        "Immigrant Status",
+    ],
+    "Victimization Type - Rows": [
+        ID_COLUMN,
+        "Type of Victimization",
+        "Victim Type",
+        "Age at Time of Trafficking",
+        "Funder",
+    ],
+    "Homelessness - Rows": [ID_COLUMN, "Homelessness", "Funder", "Type of Victimization"],
+}
+
+# Columns several "- Rows" sheets share are coalesced in the merged view: the first
+# non-blank value wins, trying these sheets first and then SHEET_MAPPINGS order
+COALESCE_PRIORITY = {
+    "Type of Victimization": ["Victimization Type - Rows"],
+}
+
+# Header spellings ensure_id_column accepts for the client ID
+ID_ALIASES = {"legacy client id", "legacy_client_id", "legacy id"}
+
+DEMOGRAPHICS_SHEET = "New Client Demographics"
+DEMOGRAPHICS_VIEW = "New Client Demographics (combined tab)"
+MERGED_VIEW = "Merged Report View (Fake Report-style)"
+SHEET_VIEW_PREFIX = "Sheet: "
+
+# Share of load_workbook progress taken by sheet parsing (the rest is building views)
+LOAD_PARSE_SHARE = 0.8
+# What load_workbook replaces; a failed or cancelled load puts it back
+LOAD_STATE = (
+    "workbook_path", "cache_key", "workbook_sheets", "sheet_fingerprints", "sheet_timings",
+    "views", "default_view_name",
+)
+
+MAX_FILTER_VALUES = 100
+
+
+class GrantReportEngine:
+    def __init__(self, log=None, cache=None, workers=None, streaming=False, chunk_size=DEFAULT_CHUNK_ROWS,
+                 project=True, incremental=False, cube_max_dims=CUBE_MAX_DIMS, cube_max_bytes=CUBE_MAX_BYTES,
+                 progress=None, metrics=None, rules=None, store=None):
+        # log: optional callable(message) used for progress/status lines
+        self.log_callback = log
+        # metrics: Metrics recording each pipeline stage (default: kept in memory only)
+        self.metrics = metrics if metrics is not None else Metrics()
+        # progress: optional callable(fraction, message) for percent-complete; raising from it cancels a load
+        self.progress_callback = progress
+        # cache: optional WorkbookCache; parsed sheets + merged view are reused across runs
+        self.cache = cache
+        self.cache_key = None
+        # workers: sheet-parsing processes (None = automatic, 1 = in-process)
+        self.workers = workers
+        # streaming: read only the report's columns, chunk by chunk (exports larger than RAM)
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        # project: only load the columns the report uses (filters, preview, ID, Date of Birth)
+        self.project = project
+        # incremental: reloading a changed export only re-parses changed sheets and re-merges changed clients
+        self.incremental = incremental
+        # cube_max_dims: fields per precomputed count cuboid (0 = no cube, always count on the fly)
+        self.cube_max_dims = cube_max_dims
+        self.cube_max_bytes = cube_max_bytes
+        # rules: normalization rule spec ({column: rule}; None = grantNormalize.DEFAULT_RULES), compiled
+        # once; fuzzy matches are kept in the workbook cache's directory across runs
+        fuzzy_cache = FuzzyMatchCache(os.path.join(cache.cache_dir, FUZZY_MATCHES)) if cache is not None else None
+        self.rules = NormalizationRules(rules, fuzzy_cache)
+        # store: optional grantStore.ClientStore. Each workbook's prepared views are written into it
+        # once and then filtered and counted there; reopening the workbook skips the Excel parsing
+        self.store = store
+        self.sheet_timings = {}     # sheet_name -> parse seconds for the last load
+        self.sheet_fingerprints = {}   # sheet_name -> content fingerprint for the last load
+
+        self.workbook_path = None
+        self.workbook_sheets = {}   # sheet_name -> df
+        self.views = {}             # view_name -> df
+        self.default_view_name = None
+        # Per-view work memoized while the view's frame is loaded (keyed by id(): views can share
+        # a frame); entries hold (view df, result) so a recycled id() is never mistaken for a hit
+        self._prepared = {}         # id(view df) -> (view df, prepared df)
+        self._filter_indexes = {}   # id(view df) -> (view df, {field: index})
+        self._filter_values = {}    # id(view df) -> (view df, {field: dropdown values or None})
+        self._cubes = {}            # id(view df) -> (view df, AggregateCube or None)
+
+        self.id_column = ID_COLUMN
+        self.filter_fields = list(FILTER_FIELDS)
+        self.multi_select_fields = set(MULTI_SELECT_FIELDS)
+        self.preview_columns = list(PREVIEW_COLUMNS)
+
+    def log(self, message):
+        if self.log_callback is not None:
+            self.log_callback(message)
+
+    def report_progress(self, fraction, message=None):
+        if self.progress_callback is not None:
+            self.progress_callback(fraction, message)
+
+    def sheet_progress(self, done, total):
+        self.report_progress(LOAD_PARSE_SHARE * done / max(total, 1), f"Parsed {done} of {total} sheets")
+
+    # ---- Loading ----
+
+    def load_workbook(self, filename):
+        """
+        Parse every tab of an Apricot export and build the selectable views.
+        If loading fails or is cancelled, the previously loaded workbook stays.
+        """
+        saved = {name: getattr(self, name) for name in LOAD_STATE}
+        try:
+            with self.metrics.stage("load_workbook", workbook=os.path.basename(filename)) as stage:
+                views = self._load_workbook(filename)
+                stage.rows_out = sum(len(df) for df in self.workbook_sheets.values())
+            return views
+        except BaseException:
+            for name, value in saved.items():
+                setattr(self, name, value)
+            raise
+
+    def _load_workbook(self, filename):
+        self.report_progress(0.0, "Reading workbook...")
+        previous = self.previous_load(filename) if self.incremental else None
+        self.workbook_path = filename
+        self.cache_key = self.workbook_cache_key(filename) if self.cache is not None else None
+        store_key = self.store_key(filename) if self.store is not None else None
+        if store_key and self.store.has_workbook(store_key):
+            with self.metrics.stage("open_store") as stage:
+                self.workbook_sheets = {}
+                self.sheet_fingerprints = {}
+                self.open_store_views(store_key)
+                stage.rows_out = sum(len(view) for view in self.views.values())
+            self.log(f"Opened {len(self.views)} views from the client store (no Excel parsing).")
+            self.report_progress(1.0, "Views ready.")
+            return self.views
+        fingerprints = sheet_fingerprints(filename) if self.incremental else None
+        with self.metrics.stage("read_workbook") as stage:
+            sheets = self.cache.load_sheets(self.cache_key) if self.cache_key else None
+            stage.info["cached"] = sheets is not None
+            if sheets is not None:
+                self.workbook_sheets = sheets
+                self.log(f"Loaded {len(self.workbook_sheets)} sheets (cached).")
+            else:
+                if previous is not None and fingerprints:
+                    self.workbook_sheets = self.reparse_changed_sheets(filename, previous, fingerprints)
+                else:
+                    self.workbook_sheets = self.parse_workbook(filename)
+                self.log(f"Loaded {len(self.workbook_sheets)} sheets.")
+                # Sheets may be parsed in worker processes: record their times as measured there
+                for sheet, seconds in self.sheet_timings.items():
+                    df = self.workbook_sheets.get(sheet)
+                    self.metrics.record(
+                        "parse_sheet", seconds, rows_out=None if df is None else len(df), sheet=sheet, rss_mib=None
+                    )
+                if self.cache_key:
+                    self.cache.store_sheets(self.cache_key, self.workbook_sheets)
+            stage.rows_out = sum(len(df) for df in self.workbook_sheets.values())
+        self.sheet_fingerprints = fingerprints or {}
+        if self.cache_key and fingerprints:
+            self.cache.store_meta(self.cache_key, "sheet_fingerprints", fingerprints)
+
+        self.report_progress(LOAD_PARSE_SHARE, "Building views...")
+        with self.metrics.stage("build_views") as stage:
+            self.build_views(previous)
+            stage.rows_out = len(self.views.get(MERGED_VIEW, ()))
+        if store_key:
+            self.write_store(store_key, filename)
+        self.report_progress(1.0, "Views ready.")
+        return self.views
+
+    def previous_load(self, filename):
+        """
+        What the last load of this workbook path left behind, for incremental
+        reloads: {"sheets", "fingerprints", "merged"} from this engine or, failing
+        that, from the cache entry of the path's previous contents. None if unknown.
+        """
+        path = os.path.abspath(filename)
+        if self.workbook_path and os.path.abspath(self.workbook_path) == path and self.sheet_fingerprints:
+            merged = self.views.get(MERGED_VIEW)
+            return {
+                "sheets": self.workbook_sheets,
+                "fingerprints": self.sheet_fingerprints,
+                # A stored merged view is not patched in memory; it is rebuilt from the sheets
+                "merged": None if isinstance(merged, StoreView) else merged,
+            }
+        if self.cache is None or not self.cache.previous_key(path):
+            return None
+        key = self.cache.previous_key(path) + self.cache_key_suffix()
+        fingerprints = self.cache.load_meta(key, "sheet_fingerprints")
+        sheets = self.cache.load_sheets(key) if fingerprints else None
+        if sheets is None:
+            return None
+        return {"sheets": sheets, "fingerprints": fingerprints, "merged": self.cache.load_view(key, MERGED_VIEW)}
+
+    def reparse_changed_sheets(self, filename, previous, fingerprints):
+        """Parse only the sheets whose fingerprint changed; reuse the previous frames of the rest."""
+        old_sheets, old_fingerprints = previous["sheets"], previous["fingerprints"]
+        changed = [
+            s for s, fp in fingerprints.items()
+            if fp is None or fp != old_fingerprints.get(s) or s not in old_sheets
+        ]
+        self.log(f"{len(fingerprints) - len(changed)} sheet(s) unchanged; re-reading {len(changed)}.")
+        parsed, self.sheet_timings = load_sheets(
+            filename,
+            workers=self.workers,
+            log=self.log,
+            columns=self.load_columns(),
+            streaming=self.streaming,
+            chunk_size=self.chunk_size,
+            only=set(changed),
+            progress=self.sheet_progress,
+        ) if changed else ({}, {})
+        # Workbook order; sheets the projection skips are absent from both
+        return {
+            s: parsed[s] if s in parsed else old_sheets[s]
+            for s in fingerprints
+            if s in parsed or (s not in changed and s in old_sheets)
+        }
+
+    def workbook_cache_key(self, filename):
+        """Cache key for a workbook as this engine loads it (content hash + loading mode)."""
+        return self.cache.key(filename) + self.cache_key_suffix()
+
+    def cache_key_suffix(self):
+        # Projected sheets only hold the report columns; keep them apart from full parses
+        suffix = "-streamed" if self.streaming else "-projected" if self.project else ""
+        # Cached merged views were normalized with these rules
+        if not self.rules.is_default():
+            suffix += f"-rules{self.rules.fingerprint()}"
+        return suffix
+
+    # ---- Client store ----
+
+    def store_key(self, filename):
+        """Store key for a workbook as this engine loads it (the cache key, or the same built here)."""
+        if self.cache_key:
+            return self.cache_key
+        return f"v{CACHE_VERSION}-{file_digest(filename)}{self.cache_key_suffix()}"
+
+    def write_store(self, key, filename):
+        """
+        Write every view, prepared (with its filter index and values), into the
+        store, then answer them from there. Views are prepared one at a time and
+        let go once written; no count cube is built, counts are queries.
+        """
+        names = self.ordered_view_names()
+        share = 1 - LOAD_PARSE_SHARE
+        with self.metrics.stage("write_store", rows_in=sum(len(self.views[n]) for n in names)) as stage:
+            self.store.drop_workbook(key)   # what an interrupted write left behind
+            for i, name in enumerate(names):
+                message = f"Storing view {i + 1} of {len(names)}..."
+                progress = lambda f, i=i: self.report_progress(
+                    LOAD_PARSE_SHARE + share * (i + f) / len(names), message
+                )
+                progress(0.0)
+                view = self.views[name]
+                self.store.write_view(
+                    key, name, i, self.prepare_view(name), self.view_filter_index(name),
+                    self.view_filter_values(name), self.id_column, self.multi_select_fields, progress=progress,
+                )
+                for memo in (self._prepared, self._filter_indexes, self._filter_values, self._cubes):
+                    memo.pop(id(view), None)
+            self.store.finish_workbook(key, filename, self.default_view_name)
+            stage.rows_out = len(names)
+        self.log(f"Wrote {len(names)} views to the client store.")
+        self.open_store_views(key)
+
+    def open_store_views(self, key):
+        views = self.store.open_views(key)
+        default = self.store.default_view(key)
+        self.views = views
+        self.default_view_name = default if default in views else next(iter(views), None)
+        for memo in (self._prepared, self._filter_indexes, self._filter_values, self._cubes):
+            memo.clear()
+
+    def parse_workbook(self, filename):
+        self.log("Reading Apricot Workbook (all tabs)...")
+        # Sheets that fail to parse are skipped (same as the demo did)
+        sheets, self.sheet_timings = load_sheets(
+            filename,
+            workers=self.workers,
+            log=self.log,
+            columns=self.load_columns(),
+            streaming=self.streaming,
+            chunk_size=self.chunk_size,
+            progress=self.sheet_progress,
+        )
+        return sheets
+
+    def load_columns(self):
+        """Projection handed to load_sheets: per sheet when streaming, else on every sheet."""
+        if self.streaming:
+            return self.report_sheet_columns()
+        if self.project:
+            return self.report_columns_wanted()
+        return None
+
+    def report_columns_wanted(self):
+        return list(dict.fromkeys(self.preview_columns + ["Date of Birth"] + sorted(ID_ALIASES)))
+
+    def report_sheet_columns(self):
+        """{sheet: columns} the report reads: the merge mappings plus the demographics tab."""
+        columns = {sheet: list(cols) + sorted(ID_ALIASES) for sheet, cols in SHEET_MAPPINGS.items()}
+        columns[DEMOGRAPHICS_SHEET] = self.preview_columns + ["Date of Birth"] + sorted(ID_ALIASES)
+        return columns
+
+    def build_views(self, previous=None):
+        """
+        Build views:
+        - Individual sheet views
+        - A combined/merged view (like Fake Report)
+        previous: an earlier load of the same workbook (previous_load); its merged
+        view is patched for the changed clients instead of rebuilt.
+        """
+        self.log("Understanding tabs (columns + common jumbled fields)...")
+        self.views = {}
+        for sheet_name, df in self.workbook_sheets.items():
+            if len(df.columns) == 0 and self.load_columns() is not None:
+                self.log(f"Sheet '{sheet_name}' has none of the report columns; no view.")
+                continue
+            self.views[f"{SHEET_VIEW_PREFIX}{sheet_name}"] = df
+
+        merged_view = self.cache.load_view(self.cache_key, MERGED_VIEW) if self.cache_key else None
+        if merged_view is None:
+            if previous is not None and previous.get("merged") is not None:
+                merged_view = self.patch_merged_report_view(previous)
+            if merged_view is None:
+                merged_view = self.build_merged_report_view()
+            if merged_view is not None and self.cache_key:
+                self.cache.store_view(self.cache_key, MERGED_VIEW, merged_view)
+        if merged_view is not None:
+            self.views[MERGED_VIEW] = merged_view
+            # Built normalized and de-duplicated: a second pass would re-map its values
+            self._prepared[id(merged_view)] = (merged_view, merged_view)
+
+        # If "New Client Demographics" exists, expose it prominently (often ~60 clients)
+        if DEMOGRAPHICS_SHEET in self.workbook_sheets:
+            self.views[DEMOGRAPHICS_VIEW] = self.workbook_sheets[DEMOGRAPHICS_SHEET]
+
+        # Pick a default view
+        if DEMOGRAPHICS_VIEW in self.views:
+            self.default_view_name = DEMOGRAPHICS_VIEW
+        elif MERGED_VIEW in self.views:
+            self.default_view_name = MERGED_VIEW
+        else:
+            self.default_view_name = list(self.views.keys())[0] if self.views else None
+
+        # Memoized work stays valid for frames that are still loaded (unchanged sheets)
+        live = {id(df): df for df in self.views.values()}
+        for memo in (self._prepared, self._filter_indexes, self._filter_values, self._cubes):
+            for key in [k for k, (df, _result) in memo.items() if live.get(k) is not df]:
+                del memo[key]
+        return self.views
+
+    def ordered_view_names(self):
+        """View names with the key report views first."""
+        names = list(self.views.keys())
+        preferred = [DEMOGRAPHICS_VIEW, MERGED_VIEW]
+        return [n for n in preferred if n in names] + [n for n in names if n not in preferred]
+
+    def resolve_view_name(self, name):
+        """Accept a full view name, a bare sheet name, or the shortcuts 'merged'/'demographics'."""
+        if not name:
+            return self.default_view_name
+        if name in self.views:
+            return name
+        shortcuts = {"merged": MERGED_VIEW, "demographics": DEMOGRAPHICS_VIEW}
+        if name.lower() in shortcuts and shortcuts[name.lower()] in self.views:
+            return shortcuts[name.lower()]
+        if f"{SHEET_VIEW_PREFIX}{name}" in self.views:
+            return f"{SHEET_VIEW_PREFIX}{name}"
+        raise KeyError(f"Unknown view: {name}")
+
+    # ---- Merged view + cleanup ----
+
+    def build_merged_report_view(self, only_ids=None):
+        """
+        Build a merged dataset that resembles the "Fake Report" output:
+        one row per client (deduped) with key demographic columns.
+        only_ids: build just the rows of these client IDs (incremental patching).
+        """
+        self.log("Creating merged report view (deduplicate to 1 row/client)...")
+
+        def restrict(df):
+            if only_ids is None or self.id_column not in df.columns:
+                return df
+            return df[df[self.id_column].isin(only_ids).to_numpy()]
+
+        # Prefer the already-combined tab when present, but normalize it
+        if DEMOGRAPHICS_SHEET in self.workbook_sheets:
+            df = restrict(self.ensure_id_column(self.workbook_sheets[DEMOGRAPHICS_SHEET]))
+            df = self.apply_light_normalizations(df)
+            df = self.dedupe_clients(df)
+            return df
+
+        # Otherwise: merge across known sheets (demo version of the Guide process)
+        frames = {}
+        for sheet, cols in SHEET_MAPPINGS.items():
+            if sheet not in self.workbook_sheets:
+                continue
+            df = self.ensure_id_column(self.workbook_sheets[sheet])
+            if self.id_column not in df.columns:
+                self.log(f"Not merging '{sheet}': no {self.id_column} column")
+                continue
+            keep_cols = [c for c in cols if c in df.columns]
+            frames[sheet] = restrict(df[keep_cols]).drop_duplicates(subset=[self.id_column])
+
+        if not frames:
+            return None
+
+        with self.metrics.stage("merge", rows_in=sum(len(df) for df in frames.values()), sheets=len(frames)) as stage:
+            merged_df = self.merge_sheets(frames)
+            stage.rows_out = len(merged_df)
+        merged_df = self.apply_light_normalizations(merged_df)
+        merged_df = self.dedupe_clients(merged_df)
+        return merged_df
+
+    def merge_sheets(self, frames):
+        """
+        Full outer join of {sheet: df} (one row per ID each) on the ID column in
+        one pass: the IDs of every sheet are factorized together once (sorted,
+        like an outer merge), then each column is scattered into its output
+        rows with a single reindex. Columns found on several sheets are
+        coalesced (COALESCE_PRIORITY) instead of suffixed _x/_y.
+        """
+        sheets = list(frames)
+        if len(sheets) == 1:
+            return frames[sheets[0]]
+
+        codes, uniques = self.merge_keys([frames[s] for s in sheets])
+
+        # positions[sheet][row] = that sheet's row for the output row, -1 when absent
+        positions = {}
+        start = 0
+        for sheet in sheets:
+            stop = start + len(frames[sheet])
+            rows = np.full(len(uniques), -1, dtype=np.int64)
+            rows[codes[start:stop]] = np.arange(stop - start)
+            positions[sheet] = rows
+            start = stop
+
+        def spread(sheet, col):
+            column = frames[sheet][col].reset_index(drop=True)
+            return column.reindex(positions[sheet]).reset_index(drop=True)
+
+        merged = {self.id_column: pd.Series(uniques, dtype=object)}
+        for sheet in sheets:
+            for col in frames[sheet].columns:
+                if col in merged:
+                    continue
+                sources = [s for s in sheets if col in frames[s].columns]
+                preferred = [s for s in COALESCE_PRIORITY.get(col, []) if s in sources]
+                sources = preferred + [s for s in sources if s not in preferred]
+                merged[col] = self.coalesce([spread(s, col) for s in sources])
+        return categorize_columns(pd.DataFrame(merged))
+
+    def merge_keys(self, frames):
+        """Factorize the IDs of all frames together: (codes, merged view's ID order)."""
+        ids = np.concatenate([df[self.id_column].to_numpy(dtype=object) for df in frames])
+        try:
+            return pd.factorize(ids, sort=True, use_na_sentinel=False)
+        except TypeError:
+            # IDs of mixed types do not sort: keep first-seen order
+            return pd.factorize(ids, use_na_sentinel=False)
+
+    def merged_view_sources(self, sheets):
+        """{sheet: columns the merged view reads (None = all)} for a set of loaded sheets."""
+        if DEMOGRAPHICS_SHEET in sheets:
+            return {DEMOGRAPHICS_SHEET: None}
+        return {sheet: cols for sheet, cols in SHEET_MAPPINGS.items() if sheet in sheets}
+
+    def patch_merged_report_view(self, previous):
+        """
+        Update the previous merged view for the clients whose rows changed on
+        the source sheets, instead of rebuilding it. Returns None when the
+        sheets changed shape (tabs or columns added/removed) and a full
+        rebuild is needed.
+        """
+        old_sheets, old_merged = previous["sheets"], previous["merged"]
+        sources = self.merged_view_sources(self.workbook_sheets)
+        if not sources or sources != self.merged_view_sources(old_sheets):
+            return None
+        if self.id_column not in old_merged.columns:
+            return None
+
+        changes = ClientChanges()
+        for sheet, cols in sources.items():
+            if self.workbook_sheets[sheet] is old_sheets[sheet]:
+                continue   # sheet was not re-read
+            new = self.ensure_id_column(self.workbook_sheets[sheet])
+            old = self.ensure_id_column(old_sheets[sheet])
+            if list(new.columns) != list(old.columns) or self.id_column not in new.columns:
+                return None
+            changes.update(diff_clients(
+                client_fingerprints(old, self.id_column, cols),
+                client_fingerprints(new, self.id_column, cols),
+            ))
+        if not changes:
+            self.log("Merged view: no client changed.")
+            return old_merged
+
+        self.log(f"Patching merged view: {changes.describe()} client(s)...")
+        affected = changes.affected()
+        patch = self.build_merged_report_view(only_ids=affected)
+        kept = old_merged[~old_merged[self.id_column].isin(affected).to_numpy()]
+        combined = pd.concat([kept, patch]) if patch is not None else kept
+
+        # Put rows back where a full rebuild would: first-appearance order on a
+        # single tab (keeping its row labels), else sorted by ID
+        frames = [self.ensure_id_column(self.workbook_sheets[sheet]) for sheet in sources]
+        if len(frames) == 1:
+            first = frames[0].drop_duplicates(subset=[self.id_column])
+            order, labels = first[self.id_column].to_numpy(dtype=object), first.index
+        else:
+            order = self.merge_keys(frames)[1]
+            labels = pd.RangeIndex(len(order))
+        positions = pd.Index(combined[self.id_column].to_numpy(dtype=object)).get_indexer(order)
+        if (positions < 0).any():
+            return None
+        merged = combined.iloc[positions]
+        merged.index = labels
+        # Categoricals with different categories come back from concat as object
+        return categorize_columns(merged)
+
+    @staticmethod
+    def coalesce(columns):
+        """First non-blank (missing or whitespace-only) value per row across columns."""
+        if len(columns) == 1:
+            return columns[0]
+        def is_blank(cells):
+            # Few distinct values: test each once
+            codes, uniques = pd.factorize(cells)
+            blank_values = np.array([str(u).strip() == "" for u in uniques] + [True])
+            return blank_values[codes]
+
+        values = columns[0].to_numpy(dtype=object).copy()
+        blank = is_blank(values)
+        for column in columns[1:]:
+            if not blank.any():
+                break
+            # Only rows still blank are looked at again
+            values[blank] = column.to_numpy(dtype=object)[blank]
+            blank[blank] = is_blank(values[blank])
+        return pd.Series(values, index=columns[0].index)
+
+    def ensure_id_column(self, df):
+        if self.id_column in df.columns:
+            return df
+        # best-effort: if there is any column that looks like legacy client id
+        for c in df.columns:
+            if str(c).strip().lower() in ID_ALIASES:
+                df = df.rename(columns={c: self.id_column})
+                return df
+        return df
+
+    def apply_light_normalizations(self, df):
+        # Columns are replaced, never edited in place, so a shallow copy keeps the input intact
+        df = df.copy(deep=False)
+
+        columns = [col for col in self.rules.columns if col in df.columns]
+        if columns:
+            self.log(f"Normalizing {', '.join(columns)}...")
+        for col in columns:
+            with self.metrics.stage(f"normalize:{col}", rows_in=len(df)) as stage:
+                df[col] = self.rules.apply(col, df[col])
+                stage.rows_out = len(df)
+        self.rules.save_matches()
+        return df
+
+    def dedupe_clients(self, df):
+        with self.metrics.stage("dedupe", rows_in=len(df)) as stage:
+            df = self._dedupe_clients(df)
+            stage.rows_out = len(df)
+        return df
+
+    def _dedupe_clients(self, df):
+        if self.id_column in df.columns:
+            before_rows = len(df)
+            before_ids = df[self.id_column].nunique(dropna=True)
+            df = df.drop_duplicates(subset=[self.id_column])
+            after_rows = len(df)
+            after_ids = df[self.id_column].nunique(dropna=True)
+            self.log(f"Deduped clients: rows {before_rows} → {after_rows}, unique IDs {before_ids} → {after_ids}")
+            return df
+        # If no ID column, do a full-row dedupe
+        before_rows = len(df)
+        df = df.drop_duplicates()
+        self.log(f"Deduped rows (no ID column): {before_rows} → {len(df)}")
+        return df
+
+    def prepare_view(self, view_name):
+        """
+        Return the normalized, de-duplicated frame behind a view. Built once per
+        loaded workbook and shared: callers must not modify it.
+        """
+        view = self.views[view_name]
+        if isinstance(view, StoreView):
+            return view   # prepared before it was stored
+        if id(view) not in self._prepared:
+            with self.metrics.stage("prepare_view", rows_in=len(view), view=view_name) as stage:
+                df = self.ensure_id_column(view)
+                df = self.apply_light_normalizations(df)
+                df = self.dedupe_clients(df)
+                stage.rows_out = len(df)
+            self._prepared[id(view)] = (view, df)
+        return self._prepared[id(view)][1]
+
+    def view_filter_index(self, view_name):
+        """build_filter_index of a prepared view, memoized like prepare_view."""
+        view = self.views[view_name]
+        if isinstance(view, StoreView):
+            return {}   # filtered in the store
+        if id(view) not in self._filter_indexes:
+            df = self.prepare_view(view_name)
+            with self.metrics.stage("filter_index", rows_in=len(df), view=view_name):
+                index = self.build_filter_index(df)
+            self._filter_indexes[id(view)] = (view, index)
+        return self._filter_indexes[id(view)][1]
+
+    def view_filter_values(self, view_name):
+        """{field: dropdown values (None when missing)} for a view, memoized like prepare_view."""
+        view = self.views[view_name]
+        if isinstance(view, StoreView):
+            return view.filter_values()
+        if id(view) not in self._filter_values:
+            df = self.prepare_view(view_name)
+            index = self.view_filter_index(view_name)
+            values = {field: self.filter_values(df, field, index) for field in self.filter_fields}
+            self._filter_values[id(view)] = (view, values)
+        return self._filter_values[id(view)][1]
+
+    def view_cube(self, view_name):
+        """AggregateCube of a prepared view (None when disabled), memoized like prepare_view."""
+        view = self.views[view_name]
+        if isinstance(view, StoreView):
+            return None   # counted in the store
+        if id(view) not in self._cubes:
+            cube = None
+            if self.cube_max_dims > 0:
+                df = self.prepare_view(view_name)
+                index = self.view_filter_index(view_name)
+                with self.metrics.stage("count_cube", rows_in=len(df), view=view_name):
+                    cube = AggregateCube(
+                        df,
+                        self.filter_fields,
+                        self.multi_select_fields,
+                        index=index,
+                        id_column=self.id_column,
+                        max_dims=self.cube_max_dims,
+                        max_bytes=self.cube_max_bytes,
+                    )
+                if cube.skipped:
+                    self.log(f"Count cube: {cube.skipped} field combinations over budget; counted on demand.")
+            self._cubes[id(view)] = (view, cube)
+        return self._cubes[id(view)][1]
+
+    # ---- Filtering ----
+
+    def build_filter_index(self, df):
+        """Value/token indexes for the filter fields of a prepared view (build once per view)."""
+        return {
+            field: build_index(df[field], field in self.multi_select_fields)
+            for field in self.filter_fields
+            if field in df.columns
+        }
+
+    def filter_values(self, df, field, index=None):
+        """
+        Dropdown choices for a field: the most common values (or, for multi-select
+        fields, the most common individual tokens). None when the field is missing.
+        """
+        if field not in df.columns:
+            return None
+        if df[field].notna().sum() == 0:
+            return []
+        field_index = (index or {}).get(field) or build_index(df[field], field in self.multi_select_fields)
+        return field_index.top_values(MAX_FILTER_VALUES)
+
+    def filter_engine(self, df, index=None):
+        """Incremental FilterEngine over a prepared view (index from build_filter_index)."""
+        if isinstance(df, StoreView):
+            return df.filters(metrics=self.metrics)
+        return FilterEngine(df, self.filter_fields, self.multi_select_fields, index, metrics=self.metrics)
+
+    def apply_filters(self, df, selections, index=None):
+        """
+        Apply a filter spec ({field: value, [values] or {"not": value}}) to a
+        prepared view.
+        Returns (filtered_df, ["field=value", ...] for the filters that applied).
+        For an in-memory view; filter_view leaves the rows where they are.
+        """
+        filters = self.filter_view(df, selections, index)
+        return filters.frame(), filters.active_labels()
+
+    def filter_view(self, df, selections, index=None):
+        """A filter spec applied to a prepared view, as its FilterEngine (no rows materialized)."""
+        filters = self.filter_engine(df, index)
+        with self.metrics.stage("filter", rows_in=len(df)) as stage:
+            filters.update(selections)
+            stage.rows_out = filters.count()
+        return filters
+
+    def crosstab(self, df, fields, filters=None, index=None):
+        """
+        Unique clients and rows per combination of `fields` (multi-select
+        fields count once per listed value) over a prepared view, or over the
+        rows a FilterEngine currently passes.
+        """
+        if isinstance(df, StoreView):
+            return df.crosstab(fields, filters.selections if filters is not None else None)
+        positions = None
+        if filters is not None:
+            positions = filters.positions()
+            index = filters.index
+        return crosstab(
+            df, fields, self.multi_select_fields, index=index, positions=positions, id_column=self.id_column
+        )
+
+    def filtered_counts(self, view_name, filters):
+        """(unique clients, rows) passing a view's FilterEngine: from the cube when it can answer."""
+        cube = self.view_cube(view_name)
+        selections = filters.single_selections()
+        if cube is not None and selections is not None:
+            counts = cube.lookup(selections)
+            if counts is not None:
+                return counts
+        if self.id_column in filters.df.columns:
+            return filters.count_unique(self.id_column), filters.count()
+        return filters.count(), filters.count()
+
+    def dropdown_counts(self, view_name, filters):
+        """
+        {field: {value: unique clients}} for the dropdown values of a view: what
+        picking each value would give next to the other fields' selections,
+        counted the way the filter matches it. Values that do not filter when
+        picked (blank, "(...)") get no count.
+        """
+        with self.metrics.stage("dropdown_counts", rows_in=len(filters.df), view=view_name):
+            return self._dropdown_counts(view_name, filters)
+
+    def _dropdown_counts(self, view_name, filters):
+        cube = self.view_cube(view_name)
+        selections = filters.single_selections()
+        df = filters.df
+        counts = {}
+        for field, values in self.view_filter_values(view_name).items():
+            if not values:
+                continue
+            field_counts = {}
+            if cube is not None and selections is not None:
+                field_counts = cube.value_counts(field, selections, values) or {}
+            values = [v for v in values if not is_unset_selection(v)]
+            rest = [v for v in values if v not in field_counts]
+            if rest:
+                # Not precomputed: count this field's buckets over the rows the other filters pass
+                if isinstance(df, StoreView):
+                    table = df.crosstab([field], filters.selections_without(field))
+                else:
+                    table = crosstab(
+                        df, [field], self.multi_select_fields, index=filters.index,
+                        positions=np.flatnonzero(filters.mask_without(field)), id_column=self.id_column,
+                    )
+                value_col = CLIENTS if CLIENTS in table.columns else "Rows"
+                found = dict(zip(table[field], table[value_col]))
+                missing = filters.missing_tokens(field)
+                for value in rest:
+                    if value.strip() and value not in missing:
+                        field_counts[value] = int(found.get(value, 0))
+                    else:
+                        # Blank in the cross-tab, or also matched on missing cells: count the filter itself
+                        field_counts[value] = self.value_clients(filters, field, value)
+            counts[field] = {v: field_counts[v] for v in values}
+        return counts
+
+    def value_clients(self, filters, field, value):
+        """Unique clients (rows without an ID column) picking `value` for `field` would leave."""
+        df = filters.df
+        if isinstance(df, StoreView):
+            selections = {**filters.selections_without(field), field: ((value,), False)}
+            return df.count_unique(self.id_column, selections) if df.id_column else df.count(selections)
+        mask = filters.mask_without(field) & filters.value_mask(field, value)
+        if self.id_column in df.columns:
+            return filters.count_unique(self.id_column, mask)
+        return int(np.count_nonzero(mask))
+
+    def count_clients(self, df):
+        if isinstance(df, StoreView):
+            return df.count_clients()
+        if self.id_column in df.columns:
+            return df[self.id_column].nunique(dropna=True)
+        return len(df)
+
+    # ---- Memory ----
+
+    def memory_report(self):
+        """
+        Per view: (view, rows, columns, bytes, bytes as object dtype). The last
+        figure is what the same columns would take without Categoricals.
+        """
+        report = []
+        for name in self.ordered_view_names():
+            df = self.views[name]
+            if isinstance(df, StoreView):
+                continue   # on disk
+            used = int(df.memory_usage(deep=True).sum())
+            as_object = used
+            for col in df.columns:
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    as_object += int(df[col].astype(object).memory_usage(deep=True, index=False))
+                    as_object -= int(df[col].memory_usage(deep=True, index=False))
+            report.append((name, len(df), len(df.columns), used, as_object))
+        return report
+
+    def format_memory_report(self):
+        lines = []
+        for name, rows, n_cols, used, as_object in self.memory_report():
+            saved = 1 - used / as_object if as_object else 0
+            lines.append(
+                f"{name}: {rows} rows x {n_cols} cols, {used / 1024 ** 2:.2f} MiB "
+                f"(object dtype: {as_object / 1024 ** 2:.2f} MiB, {saved:.0%} saved)"
+            )
+        return lines
+
+    # ---- Output ----
+
+    def report_columns(self, df):
+        cols = [c for c in self.preview_columns if c in df.columns]
+        return cols or list(df.columns)
+
+    def write_results(self, df, path, positions=None, progress=None):
+        """
+        Write a client list (the rows at `positions`, e.g. FilterEngine.positions(),
+        or all of df); the format follows the extension (.csv/.xlsx/.parquet).
+        Streamed in chunks; progress: optional callable(fraction), raising stops it.
+        """
+        with self.metrics.stage("export", rows_in=len(df), path=path) as stage:
+            stats = export_frame(df, path, self.report_columns(df), positions=positions, progress=progress)
+            stage.rows_out = stats.rows
+        self.log(stats.describe())
+        return path
+
+    def evaluate_presets(self, df, presets, index=None):
+        """Counts and client-list masks of many presets ({name: filter spec}) over one view -> {name: PresetResult}."""
+        return evaluate_presets(self.filter_engine(df, index), presets, self.id_column, self.filter_fields)
+
+    def write_presets(self, df, presets, paths, index=None, progress=None, results=None):
+        """
+        Export one filtered client list per preset ({name: filter spec}) to
+        paths ({name: output path}) in a single pass over the view.
+        results: evaluate_presets output to reuse. Returns {name: ExportStats}.
+        """
+        results = results or self.evaluate_presets(df, presets, index)
+        masks = {name: results[name].mask for name in presets}
+        with self.metrics.stage("export_presets", rows_in=len(df), presets=len(presets)) as stage:
+            stats = export_masks(df, masks, paths, self.report_columns(df), progress=progress)
+            stage.rows_out = sum(s.rows for s in stats.values())
+        for name in presets:
+            self.log(f"[{name}] {stats[name].describe()}")
+        return stats
+
+
+def load_filter_spec(path):
+    """Read a JSON (or YAML) filter spec: {"Funder": "OVC", "Race/Ethnicity": ["Asian", "White"], ...}."""
+    spec = read_spec_file(path)
+    if not isinstance(spec, dict):
+        raise ValueError(f"Filter spec must be a JSON object: {path}")
+    return spec
+
+
+def load_rules(path):
+    """Normalization rules file (JSON/YAML, {column: rule}) merged over the default rules."""
+    return merge_rules(read_spec_file(path))
+
+
+def parse_filter_args(items):
+    spec = {}
+    for item in items or []:
+        field, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Filter must look like FIELD=VALUE: {item}")
+        spec[field.strip()] = value.strip()
+    return spec
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Build filtered grant client lists from Apricot Excel exports (no GUI)."
+    )
+    parser.add_argument("workbooks", nargs="+", help="Apricot export(s) (.xlsx)")
+    parser.add_argument("--view", help="View to report on (default: demographics tab, else merged view)")
+    parser.add_argument("--spec", help="JSON filter spec file")
+    parser.add_argument("--filter", action="append", default=[], metavar="FIELD=VALUE",
+                        help="Grant filter; repeatable, overrides --spec")
+    parser.add_argument("--output", help="Output file (.csv/.xlsx/.parquet) for a single workbook")
+    parser.add_argument("--output-dir", help="Directory for per-workbook outputs")
+    parser.add_argument("--format", choices=[ext.lstrip(".") for ext in EXPORT_FORMATS], default="csv",
+                        help="Output format used with --output-dir (default: csv)")
+    parser.add_argument("--preset", action="append", default=[], metavar="SPEC",
+                        help="Also evaluate the filter spec in this JSON/YAML file as a preset named after it; "
+                             "repeatable")
+    parser.add_argument("--presets", action="append", default=[], metavar="FILE",
+                        help="Evaluate every named preset in this JSON/YAML preset file; repeatable. Counts are "
+                             "printed; with --output-dir each preset's list is written (all in one pass)")
+    parser.add_argument("--cache-dir", help="Reuse parsed workbooks from this cache directory")
+    parser.add_argument("--store", metavar="FILE",
+                        help="SQLite client store: views are written into it once and filtered/counted there; "
+                             "reopening a stored workbook skips the Excel parsing")
+    parser.add_argument("--workers", type=int,
+                        help="Processes used to parse sheets (default: automatic, 1 = no pool)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Stream only the report columns in row chunks (exports larger than RAM)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Rows per chunk in --streaming mode (default: {DEFAULT_CHUNK_ROWS})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --cache-dir: re-read only the sheets and clients that changed since the last load")
+    parser.add_argument("--rules", metavar="FILE",
+                        help="JSON/YAML normalization rules ({column: {exact, regex, choices, fuzzy, ...}}) "
+                             "merged over the built-in ones; a column set to null is left as exported")
+    parser.add_argument("--all-columns", action="store_true",
+                        help="Load every column of every sheet instead of just the report columns")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Print the memory used by each view (and the Categorical savings)")
+    parser.add_argument("--crosstab", metavar="FIELD[,FIELD...]",
+                        help="Print unique clients per combination of these fields (after filtering)")
+    parser.add_argument("--crosstab-output",
+                        help="Write the --crosstab table (long format) to this .csv/.xlsx/.parquet")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Append per-stage timings, memory and row counts to this JSON-lines file "
+                             "and print where the time went")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="With --metrics: also record each stage's peak Python allocations (slow)")
+    parser.add_argument("--list-views", action="store_true", help="Print the available views and exit")
+    parser.add_argument("--quiet", action="store_true", help="Only print errors")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.output and len(args.workbooks) > 1:
+        print("--output takes a single workbook; use --output-dir for several", file=sys.stderr)
+        return 2
+    try:
+        presets = {os.path.splitext(os.path.basename(p))[0]: load_filter_spec(p) for p in args.preset}
+        for preset_file in args.presets:
+            presets.update(load_presets(preset_file, FILTER_FIELDS))
+        check_presets(presets)
+    except (OSError, ValueError) as e:
+        print(f"Bad preset: {e}", file=sys.stderr)
+        return 2
+
+    spec = load_filter_spec(args.spec) if args.spec else {}
+    spec.update(parse_filter_args(args.filter))
+    for field in spec:
+        if field not in FILTER_FIELDS:
+            print(f"Ignoring unknown filter field: {field}", file=sys.stderr)
+    log = None if args.quiet else (lambda message: print(message, file=sys.stderr))
+
+    cache = WorkbookCache(args.cache_dir) if args.cache_dir else None
+    store = ClientStore(args.store) if args.store else None
+    rules = load_rules(args.rules) if args.rules else None
+    metrics = Metrics(args.metrics, trace_memory=args.trace_memory) if args.metrics else None
+    failures = 0
+    for path in args.workbooks:
+        engine = GrantReportEngine(
+            log=log,
+            cache=cache,
+            workers=args.workers,
+            streaming=args.streaming,
+            chunk_size=args.chunk_size,
+            project=not args.all_columns,
+            incremental=args.incremental,
+            metrics=metrics,
+            rules=rules,
+            store=store,
+        )
+        try:
+            engine.load_workbook(path)
+            if args.memory_report:
+                print("\n".join(engine.format_memory_report()))
+            if args.list_views:
+                print("\n".join(engine.ordered_view_names()))
+                continue
+            view_name = engine.resolve_view_name(args.view)
+            if view_name is None:
+                raise ValueError("Workbook has no readable sheets")
+            df_current = engine.prepare_view(view_name)
+            # Filtered rows stay in the view (or the store): counts, cross-tabs and exports go by position
+            filters = engine.filter_view(df_current, spec, engine.view_filter_index(view_name))
+            positions = filters.positions() if filters.is_filtered() else None
+            active = filters.active_labels()
+            print(
+                f"{os.path.basename(path)} [{view_name}] "
+                f"{', '.join(active) or '(no filters)'}: "
+                f"{engine.filtered_counts(view_name, filters)[0]} of {engine.count_clients(df_current)} clients"
+            )
+            if args.crosstab:
+                fields = [f.strip() for f in args.crosstab.split(",") if f.strip()]
+                table = engine.crosstab(df_current, fields, filters)
+                fields = [f for f in fields if f in table.columns]
+                shown = pivot(table, fields[0], fields[1:]) if len(fields) > 1 else table.set_index(fields)
+                print(shown.to_string())
+                if args.crosstab_output:
+                    engine.log(export_frame(table, args.crosstab_output).describe())
+            if args.output:
+                engine.write_results(df_current, args.output, positions=positions)
+            elif args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                stem = os.path.splitext(os.path.basename(path))[0]
+                output = os.path.join(args.output_dir, f"{stem}.{args.format}")
+                engine.write_results(df_current, output, positions=positions)
+            if presets:
+                results = engine.evaluate_presets(df_current, presets, engine.view_filter_index(view_name))
+                for result in results.values():
+                    print(f"  {result.describe()}")
+                if args.output_dir:
+                    os.makedirs(args.output_dir, exist_ok=True)
+                    stem = os.path.splitext(os.path.basename(path))[0]
+                    paths = {
+                        name: os.path.join(args.output_dir, f"{stem}-{preset_file_name(name)}.{args.format}")
+                        for name in presets
+                    }
+                    engine.write_presets(df_current, presets, paths, results=results)
+                    summary = os.path.join(args.output_dir, f"{stem}-presets.csv")
+                    engine.log(export_frame(results_frame(results), summary).describe())
+        except Exception as e:
+            failures += 1
+            print(f"{path}: error: {e}", file=sys.stderr)
+    if metrics is not None:
+        metrics.close()
+        if not args.quiet:
+            print(f"Metrics appended to {args.metrics}; time by stage:", file=sys.stderr)
+            for stage, calls, seconds in metrics.summary():
+                print(f"  {stage:40} {calls:>5} x {seconds:9.3f}s", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
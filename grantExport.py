@@ -0,0 +1,249 @@
+"""
+Streaming export of client lists and cross-tabs to CSV, XLSX and Parquet.
+
+Rows are written chunk by chunk straight from the view: a filtered list is
+exported from its row positions, so neither the filtered frame nor the whole
+output is ever held in memory at once. XLSX goes through openpyxl's
+write-only workbook (constant memory; rows past Excel's sheet limit continue
+on a new sheet) and Parquet through pyarrow's ParquetWriter, one row group per
+chunk. Files are written under a temporary name and moved into place when
+complete, so a failed or cancelled export never leaves a truncated file.
+
+Several filter presets can be exported in one pass: the view is read once,
+chunk by chunk, and every chunk is split between the presets' writers.
+
+A view is a DataFrame or a stored view (grantStore.StoreView); a stored view
+is read one chunk of rows at a time from its database.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from grantCache import pa
+from grantNormalize import as_text
+
+EXPORT_FORMATS = (".csv", ".xlsx", ".parquet")
+EXPORT_CHUNK_ROWS = 50_000
+# Excel's row limit, less the header row
+XLSX_MAX_ROWS = 1_048_576 - 1
+XLSX_SHEET_TITLE = "Clients"
+
+
+def export_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported output format: {ext or path} (use {', '.join(EXPORT_FORMATS)})")
+    return ext
+
+
+class ExportStats:
+    def __init__(self, path, rows=0, seconds=0.0):
+        self.path = path
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def bytes(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def describe(self):
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"Wrote {self.rows} rows to {self.path} in {self.seconds:.2f}s "
+            f"({self.rows / seconds:,.0f} rows/s, {self.bytes / 1024 ** 2 / seconds:.1f} MiB/s)"
+        )
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.handle = open(path, "w", newline="", encoding="utf-8")
+        pd.DataFrame(columns=list(columns)).to_csv(self.handle, index=False)
+
+    def write(self, chunk):
+        chunk.to_csv(self.handle, header=False, index=False)
+
+    def close(self):
+        self.handle.close()
+
+
+class XlsxWriter:
+    """openpyxl write-only workbook: rows are serialized as they are appended."""
+
+    def __init__(self, path, columns):
+        import openpyxl
+
+        self.path = path
+        self.columns = list(columns)
+        self.book = openpyxl.Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def new_sheet(self):
+        n = len(self.book.worksheets)
+        self.sheet = self.book.create_sheet(XLSX_SHEET_TITLE if n == 0 else f"{XLSX_SHEET_TITLE} ({n + 1})")
+        self.sheet.append(self.columns)
+        self.sheet_rows = 0
+
+    def write(self, chunk):
+        # Missing cells are left empty; Timestamps are datetimes openpyxl understands
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if self.sheet is None or self.sheet_rows >= XLSX_MAX_ROWS:
+                self.new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            self.new_sheet()
+        self.book.save(self.path)
+
+
+class ParquetWriter:
+    """
+    One row group per chunk. Text (object) columns are written as strings, so
+    a column mixing numbers and text still fits one Arrow type.
+    """
+
+    def __init__(self, path, columns):
+        if pa is None:
+            raise ValueError("Parquet export needs pyarrow")
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.columns = list(columns)
+        self.pq = pq
+        self.writer = None
+        self.schema = None
+        self.text_columns = []
+
+    def write(self, chunk):
+        if self.writer is None:
+            self.text_columns = [c for c in chunk.columns if chunk[c].dtype == object]
+            schema = pa.Schema.from_pandas(chunk.iloc[:0], preserve_index=False)
+            for col in self.text_columns:
+                schema = schema.set(schema.get_field_index(col), pa.field(col, pa.string()))
+            self.schema = schema
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+        try:
+            table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            # Numbers among the text: stringify those columns' cells
+            chunk = chunk.copy(deep=False)
+            for col in self.text_columns:
+                chunk[col] = as_text(chunk[col]).where(chunk[col].notna(), None)
+            table = pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None:
+            # No rows at all: still write the (empty) table with its columns
+            self.write(pd.DataFrame({c: pd.Series(dtype=object) for c in self.columns}))
+        self.writer.close()
+
+
+WRITERS = {".csv": CsvWriter, ".xlsx": XlsxWriter, ".parquet": ParquetWriter}
+
+
+def open_writer(path, columns):
+    """A writer for `path` (format by extension) writing to a temporary file; see finish_writer."""
+    part = f"{path}.part"
+    return part, WRITERS[export_format(path)](part, columns)
+
+
+def finish_writer(part, path, writer, ok):
+    """Close a writer and move its file into place, or discard it when the export did not complete."""
+    try:
+        writer.close()
+    except Exception:
+        # Closing a discarded export may fail too; only a complete one reports it
+        if ok:
+            ok = False
+            raise
+    finally:
+        if ok:
+            os.replace(part, path)
+        elif os.path.exists(part):
+            os.remove(part)
+
+
+def iter_chunks(n_rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, n_rows, chunk_rows):
+        yield start, min(start + chunk_rows, n_rows)
+
+
+def read_rows(df, rows, columns):
+    """The rows of a view at `rows` (a slice or positions), just `columns`."""
+    if isinstance(df, pd.DataFrame):
+        return df.iloc[rows, df.columns.get_indexer(columns)]
+    if isinstance(rows, slice):
+        rows = np.arange(rows.start, rows.stop)
+    return df.take(rows, columns)
+
+
+def export_frame(df, path, columns=None, positions=None, chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """
+    Write the rows of df at `positions` (all rows when None), in that order,
+    to path (.csv/.xlsx/.parquet). Only one chunk of rows is materialized at
+    a time. progress: optional callable(fraction); raising from it stops the
+    export. Returns ExportStats.
+    """
+    columns = list(columns) if columns is not None else list(df.columns)
+    n_rows = len(df) if positions is None else len(positions)
+    start_time = time.perf_counter()
+    part, writer = open_writer(path, columns)
+    ok = False
+    try:
+        for start, stop in iter_chunks(n_rows, chunk_rows):
+            rows = slice(start, stop) if positions is None else positions[start:stop]
+            writer.write(read_rows(df, rows, columns))
+            if progress is not None:
+                progress(stop / n_rows)
+        ok = True
+    finally:
+        finish_writer(part, path, writer, ok)
+    return ExportStats(path, n_rows, time.perf_counter() - start_time)
+
+
+def export_masks(df, masks, paths, columns=None, chunk_rows=EXPORT_CHUNK_ROWS, progress=None):
+    """
+    Several exports of one view in a single pass: masks and paths are
+    {name: boolean row mask} and {name: output path}. The view is read once,
+    chunk by chunk (only the rows some mask selects), and each chunk's rows go
+    to every export whose mask selects them. Returns {name: ExportStats}.
+    """
+    columns = list(columns) if columns is not None else list(df.columns)
+    start_time = time.perf_counter()
+    opened = {}
+    rows = dict.fromkeys(masks, 0)
+    ok = False
+    try:
+        for name in masks:
+            opened[name] = open_writer(paths[name], columns)
+        for start, stop in iter_chunks(len(df), chunk_rows):
+            picks = {name: np.asarray(mask[start:stop], dtype=bool) for name, mask in masks.items()}
+            wanted = np.logical_or.reduce([np.zeros(stop - start, dtype=bool)] + list(picks.values()))
+            if wanted.any():
+                chunk = read_rows(df, slice(start, stop) if wanted.all() else start + np.flatnonzero(wanted), columns)
+                for name, picked in picks.items():
+                    picked = picked[wanted]
+                    if picked.any():
+                        opened[name][1].write(chunk[picked])
+                        rows[name] += int(picked.sum())
+            if progress is not None:
+                progress(stop / max(len(df), 1))
+        ok = True
+    finally:
+        # Every writer is closed (or its .part file removed) even when another one fails
+        errors = []
+        for name, (part, writer) in opened.items():
+            try:
+                finish_writer(part, paths[name], writer, ok)
+            except Exception as e:
+                errors.append(e)
+        if errors and ok:
+            raise errors[0]
+    seconds = time.perf_counter() - start_time
+    return {name: ExportStats(paths[name], rows[name], seconds) for name in masks}
@@ -0,0 +1,37 @@
+"""
+Report fields shared by the engine and the GUI.
+
+Kept free of pandas and the other data libraries, so the window can be built
+from them before the (slow to import) data stack is loaded.
+"""
+ID_COLUMN = "Legacy Client ID"
+
+# Grant-focused filters (single-select dropdowns in the GUI)
+FILTER_FIELDS = [
+    "Funder",
+    "Type of Victimization",
+    "Gender",
+    "Homelessness",
+    "Program",
+    "Race/Ethnicity",
+    "Victim Type",
+    "Age at Time of Trafficking",
+    "Veteran Status",
+    "LGBTQ/Two-Spirited",
+    "Disability",
+    "Immigrant Status",
+    "Country of Citizenship",
+    "Primary Language",
+]
+
+# Fields that can contain multi-select values separated by '|', ',' or '&'
+MULTI_SELECT_FIELDS = {
+    "Race/Ethnicity",
+    "Disability",
+    "Victim Type",
+    "Homelessness",
+    "Age at Time of Trafficking",
+}
+
+# Keep the preview/export “grant-like” (always show these first, if present)
+PREVIEW_COLUMNS = [ID_COLUMN] + FILTER_FIELDS
@@ -0,0 +1,243 @@
+"""
+Composable grant filters over one prepared view.
+
+A filter spec maps a field to what should match:
+
+    {"Funder": "OVC",                                   # equals (or lists) OVC
+     "Race/Ethnicity": ["Asian", "White"],              # Asian OR White
+     "Gender": {"not": "Male"}}                         # anything but Male
+
+Unset selections ("All", "", "(Not available)") do not filter.
+"""
+from collections import OrderedDict
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from grantIndex import build_index
+from grantNormalize import as_text
+
+MAX_CACHED_MASKS = 128
+
+
+def is_unset_selection(selected):
+    """'All', blanks and placeholder values like '(Not available)' do not filter."""
+    return not selected or selected == "All" or str(selected).startswith("(")
+
+
+def parse_selection(spec):
+    """Normalize one field's spec to (values, negate); values is () when unset."""
+    negate = False
+    if isinstance(spec, dict):
+        if "not" in spec:
+            negate = True
+            spec = spec["not"]
+        else:
+            spec = spec.get("any")
+    if spec is None:
+        values = ()
+    elif isinstance(spec, str):
+        values = (spec,)
+    else:
+        values = tuple(spec)
+    values = tuple(dict.fromkeys(str(v) for v in values if not is_unset_selection(v)))
+    return values, negate
+
+
+def describe_selection(field, values, negate):
+    return f"{field}{'!=' if negate else '='}{' or '.join(values)}"
+
+
+class FilterEngine:
+    """
+    Incremental filter state for one view.
+
+    Boolean masks are cached per (field, value). Each field keeps the OR of its
+    selected values (inverted for NOT), and the view mask is the AND of the
+    field masks, so changing one dropdown only recomputes that field. Rows are
+    materialized lazily: only the window being displayed or exported.
+    """
+
+    def __init__(self, df, filter_fields, multi_select_fields, index=None, metrics=None):
+        self.df = df
+        self.metrics = metrics           # optional grantMetrics.Metrics timing each mask built
+        self.filter_fields = [f for f in filter_fields if f in df.columns]
+        self.multi_select_fields = multi_select_fields
+        self.index = dict(index or {})   # field -> TokenIndex/ValueIndex
+        self.selections = {}             # field -> (values, negate)
+        self._value_masks = OrderedDict()
+        self._selection_masks = OrderedDict()   # (field, values, negate) -> field mask
+        self._field_masks = {}
+        self._unique_codes = {}
+        self._sort_codes = {}
+        self.sort = None                 # (column, ascending) applied to positions()
+        self._mask = None
+        self._positions = None
+
+    def field_index(self, field):
+        if field not in self.index:
+            self.index[field] = build_index(self.df[field], field in self.multi_select_fields)
+        return self.index[field]
+
+    def value_mask(self, field, value):
+        key = (field, value)
+        if key in self._value_masks:
+            self._value_masks.move_to_end(key)
+            return self._value_masks[key]
+        mask = self.field_index(field).mask(value)
+        self._value_masks[key] = mask
+        if len(self._value_masks) > MAX_CACHED_MASKS:
+            self._value_masks.popitem(last=False)
+        return mask
+
+    def selection_mask(self, field, values, negate=False):
+        """One field's mask for a selection; cached, so specs sharing a field selection share it."""
+        key = (field, values, negate)
+        if key in self._selection_masks:
+            self._selection_masks.move_to_end(key)
+            return self._selection_masks[key]
+        if self.metrics is None:
+            mask = self.build_selection_mask(field, values, negate)
+        else:
+            with self.metrics.stage(f"filter:{field}", rows_in=len(self.df)) as stage:
+                mask = self.build_selection_mask(field, values, negate)
+                stage.rows_out = int(np.count_nonzero(mask))
+        self._selection_masks[key] = mask
+        if len(self._selection_masks) > MAX_CACHED_MASKS:
+            self._selection_masks.popitem(last=False)
+        return mask
+
+    def build_selection_mask(self, field, values, negate):
+        mask = reduce(np.logical_or, (self.value_mask(field, v) for v in values))
+        return ~mask if negate else mask
+
+    def set_selection(self, field, spec):
+        """Change one field's selection. Returns True when the filter changed."""
+        if field not in self.filter_fields:
+            return False
+        values, negate = parse_selection(spec)
+        selection = (values, negate) if values else None
+        if self.selections.get(field) == selection:
+            return False
+
+        if selection is None:
+            self.selections.pop(field, None)
+            self._field_masks.pop(field, None)
+        else:
+            self.selections[field] = selection
+            self._field_masks[field] = self.selection_mask(field, values, negate)
+        self._mask = None
+        self._positions = None
+        return True
+
+    def update(self, selections):
+        """Apply a full spec ({field: selection}); filter fields left out are cleared."""
+        changed = False
+        for field in self.filter_fields:
+            changed = self.set_selection(field, selections.get(field)) or changed
+        return changed
+
+    def clear(self):
+        return self.update({})
+
+    def is_filtered(self):
+        return bool(self.selections)
+
+    def mask(self):
+        if self._mask is None:
+            masks = [self._field_masks[f] for f in self.filter_fields if f in self._field_masks]
+            if masks:
+                self._mask = reduce(np.logical_and, masks)
+            else:
+                self._mask = np.ones(len(self.df), dtype=bool)
+        return self._mask
+
+    def mask_without(self, field):
+        """Rows passing every filter except `field`'s (what its dropdown values are counted over)."""
+        masks = [self._field_masks[f] for f in self.filter_fields if f in self._field_masks and f != field]
+        if not masks:
+            return np.ones(len(self.df), dtype=bool)
+        return reduce(np.logical_and, masks)
+
+    def missing_tokens(self, field):
+        """Values of `field` its filter also matches on missing cells."""
+        return self.field_index(field).missing_tokens
+
+    def single_selections(self):
+        """{field: value} when every active filter is one plain value (cube-answerable), else None."""
+        if any(negate or len(values) != 1 for values, negate in self.selections.values()):
+            return None
+        return {field: values[0] for field, (values, _negate) in self.selections.items()}
+
+    def sort_by(self, column, ascending=True):
+        """Order positions() by a column (None to restore view order). Blanks sort last."""
+        self.sort = (column, ascending) if column is not None else None
+        self._positions = None
+
+    def sort_codes(self, column):
+        """Per-row rank of a column's value (ties share a code, missing is -1)."""
+        if column not in self._sort_codes:
+            series = self.df[column]
+            try:
+                codes, _uniques = pd.factorize(series, sort=True)
+            except TypeError:
+                # Mixed types (numbers and text) don't order: rank the printed text
+                text = as_text(series).where(series.notna(), None)
+                codes, _uniques = pd.factorize(text, sort=True)
+            self._sort_codes[column] = codes
+        return self._sort_codes[column]
+
+    def positions(self):
+        """Row positions (into the view) that pass every filter, in sort order."""
+        if self._positions is None:
+            positions = np.flatnonzero(self.mask())
+            if self.sort is not None:
+                column, ascending = self.sort
+                codes = self.sort_codes(column)[positions]
+                n_codes = codes.max() + 1 if len(codes) else 0
+                keys = codes if ascending else n_codes - 1 - codes
+                keys = np.where(codes < 0, n_codes, keys)
+                positions = positions[np.argsort(keys, kind="stable")]
+            self._positions = positions
+        return self._positions
+
+    def count(self):
+        return len(self.positions())
+
+    def count_unique(self, column, mask=None):
+        """
+        nunique(dropna=True) of a column over the filtered rows (or the rows of
+        a boolean mask), without materializing them.
+        """
+        if column not in self._unique_codes:
+            codes, uniques = pd.factorize(self.df[column])
+            self._unique_codes[column] = (codes, len(uniques))
+        codes, n_unique = self._unique_codes[column]
+        if mask is not None:
+            picked = codes[mask]
+        else:
+            picked = codes[self.positions()] if self.is_filtered() else codes
+        seen = np.zeros(n_unique, dtype=bool)
+        seen[picked[picked >= 0]] = True
+        return int(seen.sum())
+
+    def take(self, start, stop):
+        """Materialize filtered rows [start, stop)."""
+        return self.df.iloc[self.positions()[start:stop]]
+
+    def head(self, n):
+        return self.take(0, n)
+
+    def frame(self):
+        """The whole filtered frame (for export)."""
+        if not self.is_filtered() and self.sort is None:
+            return self.df
+        return self.df.iloc[self.positions()]
+
+    def active_labels(self):
+        return [
+            describe_selection(field, *self.selections[field])
+            for field in self.filter_fields
+            if field in self.selections
+        ]
@@ -0,0 +1,132 @@
+"""
+Virtual-scrolling grid for the client list preview.
+
+ttk.Treeview slows down with every item it holds, so the grid keeps a fixed
+pool of items (one per visible line) and refills their values from the backing
+data whenever the user scrolls. Memory and redraw cost stay constant whether
+the filtered view has 50 rows or 5 million.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualGrid:
+    def __init__(self, parent, row_height=28, on_sort=None):
+        self.row_height = row_height
+        self.on_sort = on_sort   # callable(column) when a heading is clicked
+
+        self.columns = []
+        self.row_count = 0
+        self.fetch_rows = None   # callable(start, stop) -> list of row value sequences
+        self.first = 0
+        self.visible_rows = 20
+        self._items = []
+
+        self.frame = tk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, show="headings", selectmode="browse")
+        self.scrollbar_y = ttk.Scrollbar(self.frame, orient="vertical", command=self.yview)
+        self.scrollbar_x = ttk.Scrollbar(self.frame, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.scrollbar_x.set)
+
+        self.scrollbar_y.pack(side="right", fill="y")
+        self.scrollbar_x.pack(side="bottom", fill="x")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self._scroll_by(-1))
+        self.tree.bind("<Down>", lambda e: self._scroll_by(1))
+        self.tree.bind("<Prior>", lambda e: self._scroll_by(-self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self._scroll_by(self.visible_rows))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(self.row_count))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # ---- Data ----
+
+    def set_columns(self, columns):
+        self.columns = list(columns)
+        self.tree["columns"] = self.columns
+        for col in self.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self._on_heading(c))
+            self.tree.column(col, width=140, anchor="w")
+
+    def set_heading_text(self, column, text):
+        self.tree.heading(column, text=text)
+
+    def set_column_width(self, column, width):
+        self.tree.column(column, width=width)
+
+    def set_source(self, row_count, fetch_rows, keep_position=False):
+        """Point the grid at new backing data and redraw the visible window."""
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        if not keep_position:
+            self.first = 0
+        self.scroll_to(self.first)
+
+    def clear(self):
+        self.set_source(0, None)
+
+    # ---- Scrolling ----
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')."""
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.row_count))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if len(args) > 2 and args[2] == "pages":
+                step *= self.visible_rows
+            self._scroll_by(step)
+
+    def scroll_to(self, first):
+        last_page = max(0, self.row_count - self.visible_rows)
+        self.first = max(0, min(int(first), last_page))
+        self.redraw()
+
+    def _scroll_by(self, rows):
+        self.scroll_to(self.first + rows)
+        return "break"
+
+    def _on_mousewheel(self, event):
+        if event.delta:
+            self._scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_resize(self, event):
+        # First line is the heading row
+        rows = max(1, event.height // self.row_height - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.scroll_to(self.first)
+
+    def _on_heading(self, column):
+        if self.on_sort is not None:
+            self.on_sort(column)
+
+    # ---- Rendering ----
+
+    def redraw(self):
+        stop = min(self.first + self.visible_rows, self.row_count)
+        rows = list(self.fetch_rows(self.first, stop)) if self.fetch_rows and stop > self.first else []
+
+        # Grow/shrink the item pool to the window size; items are reused, never rebuilt
+        while len(self._items) < len(rows):
+            self._items.append(self.tree.insert("", "end", values=()))
+        if len(self._items) > len(rows):
+            self.tree.delete(*self._items[len(rows):])
+            del self._items[len(rows):]
+        for iid, values in zip(self._items, rows):
+            self.tree.item(iid, values=list(values))
+
+        if self.row_count:
+            self.scrollbar_y.set(self.first / self.row_count, stop / self.row_count)
+        else:
+            self.scrollbar_y.set(0, 1)
@@ -0,0 +1,61 @@
+"""
+Change detection between two loads of the same export.
+
+Sheets are compared by content fingerprints (grantLoader.sheet_fingerprints:
+each worksheet's XML with shared strings and number formats resolved), so
+tabs whose cells did not change are not parsed again, even though saving an
+edit elsewhere rewrites the workbook's shared string table. For a tab that
+did change, every client is fingerprinted by a hash of its first row (the
+row de-duplication keeps), which tells which clients were added, changed or
+removed. Only those clients are re-normalized and re-merged; the rest of the
+previous merged view is kept as is.
+"""
+import numpy as np
+import pandas as pd
+
+
+class ClientChanges:
+    def __init__(self, added=(), changed=(), removed=()):
+        self.added = pd.Index(added, dtype=object)
+        self.changed = pd.Index(changed, dtype=object)
+        self.removed = pd.Index(removed, dtype=object)
+
+    def affected(self):
+        """Every client ID whose merged row has to be rebuilt (or dropped)."""
+        return self.added.append(self.changed).append(self.removed).unique()
+
+    def update(self, other):
+        """Fold in the changes found on another tab."""
+        self.added = self.added.append(other.added).unique()
+        self.changed = self.changed.append(other.changed).unique()
+        self.removed = self.removed.append(other.removed).unique()
+        return self
+
+    def __bool__(self):
+        return bool(len(self.added) or len(self.changed) or len(self.removed))
+
+    def describe(self):
+        return f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed"
+
+
+def client_fingerprints(df, id_column, columns=None):
+    """
+    Hash of each client's first row over `columns` (all when None), as a
+    Series indexed by client ID. Missing IDs share one entry, like dedupe.
+    """
+    columns = [c for c in (columns or df.columns) if c in df.columns]
+    first = df.drop_duplicates(subset=[id_column])
+    hashes = pd.util.hash_pandas_object(first[columns], index=False).to_numpy()
+    return pd.Series(hashes, index=pd.Index(first[id_column].to_numpy(dtype=object)))
+
+
+def diff_clients(old, new):
+    """Compare two client_fingerprints results -> ClientChanges."""
+    in_old = new.index.isin(old.index)
+    common = new.index[in_old]
+    differs = old.reindex(common).to_numpy() != new.to_numpy()[in_old]
+    return ClientChanges(
+        added=new.index[~in_old],
+        changed=common[np.asarray(differs, dtype=bool)],
+        removed=old.index[~old.index.isin(new.index)],
+    )
@@ -0,0 +1,139 @@
+"""
+Value/token indexes for the grant filter columns.
+
+A view is indexed once when it is selected. Filtering on a value (or, for
+multi-select columns like "White|Black", on a token) and building the dropdown
+counts then never re-scan or re-split the cell text.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+from grantNormalize import as_text
+
+MULTI_SELECT_SEPARATORS = r"[|,&]"
+
+
+def split_multi_select(value):
+    return [p.strip() for p in re.split(MULTI_SELECT_SEPARATORS, value) if p.strip()]
+
+
+class TokenIndex:
+    """
+    Token -> row bitmap index for one multi-select column.
+
+    Rows are factorized into their distinct cell values and each distinct value
+    is split into tokens once. Membership is kept as a sparse
+    (distinct value x token) matrix, so the bitmap for a token is one take over
+    the per-row codes. Masks are positional: they line up with the rows of the
+    series the index was built from.
+    """
+
+    def __init__(self, series):
+        self.name = series.name
+        self.n_rows = len(series)
+        missing = series.isna().to_numpy()
+
+        # Categorical columns factorize over their integer codes, not the strings
+        codes, uniques = pd.factorize(series)
+        if isinstance(uniques.dtype, pd.CategoricalDtype):
+            uniques = uniques.astype(object)
+        if infer_dtype(uniques, skipna=False) not in ("string", "empty"):
+            # Mixed types (1 vs 1.0 hash together): factorize on the printed text
+            codes, uniques = pd.factorize(as_text(series))
+
+        # Missing cells print as "None"/"nan"; give them their own slots
+        texts = [str(u) for u in uniques] + ["None", "nan"]
+        unset = codes < 0
+        if unset.any():
+            values = series.to_numpy(dtype=object)[unset]
+            codes[unset] = np.where(np.equal(values, None), len(uniques), len(uniques) + 1)
+        self.row_codes = codes
+        self.value_texts = texts
+
+        # Rows per distinct value; missing cells never show up in the dropdown counts
+        self.value_counts = np.bincount(codes[~missing], minlength=len(texts))
+
+        # Split each distinct value once: (value, token) pairs in first-appearance order
+        self.tokens = []
+        token_ids = {}
+        pair_values, pair_tokens = [], []
+        for value_id, text in enumerate(texts):
+            for token in self.tokenize(text):
+                token_id = token_ids.setdefault(token, len(self.tokens))
+                if token_id == len(self.tokens):
+                    self.tokens.append(token)
+                pair_values.append(value_id)
+                pair_tokens.append(token_id)
+        self.token_ids = token_ids
+        pair_values = np.asarray(pair_values, dtype=np.int64)
+        pair_tokens = np.asarray(pair_tokens, dtype=np.int64)
+
+        # CSR layout: distinct values holding each token
+        order = np.argsort(pair_tokens, kind="stable")
+        self._values_by_token = pair_values[order]
+        self._offsets = np.searchsorted(pair_tokens[order], np.arange(len(self.tokens) + 1))
+
+        # Token occurrences (a token repeated inside one cell counts twice, like the dropdown did)
+        self.token_counts = np.zeros(len(self.tokens), dtype=np.int64)
+        np.add.at(self.token_counts, pair_tokens, self.value_counts[pair_values])
+
+        # Tokens a filter also matches on missing cells (their "None"/"nan" text)
+        n_missing = np.bincount(codes[missing], minlength=len(texts))
+        self.missing_tokens = {
+            token for value_id in (len(uniques), len(uniques) + 1) if n_missing[value_id]
+            for token in self.tokenize(texts[value_id])
+        }
+
+    def tokenize(self, text):
+        return split_multi_select(text)
+
+    def values_with(self, token):
+        """Distinct-value ids whose cell text contains the token."""
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            return np.empty(0, dtype=np.int64)
+        return self._values_by_token[self._offsets[token_id]:self._offsets[token_id + 1]]
+
+    def mask(self, token):
+        """Boolean row mask: rows whose cell lists the token."""
+        return self.mask_any((token,))
+
+    def mask_any(self, tokens):
+        """Boolean row mask: rows listing at least one of the tokens."""
+        has_token = np.zeros(len(self.value_texts), dtype=bool)
+        for token in tokens:
+            has_token[self.values_with(token)] = True
+        return has_token[self.row_codes]
+
+    def counts(self):
+        """Token value counts, ordered like Series.value_counts() on the split tokens."""
+        counted = self.token_counts > 0
+        if counted.any():
+            keys = [t for t, keep in zip(self.tokens, counted) if keep]
+            result = pd.Series(self.token_counts[counted], index=keys)
+        else:
+            # No tokens at all: fall back to whole-cell values (e.g. all blank)
+            counted = self.value_counts > 0
+            keys = [t for t, keep in zip(self.value_texts, counted) if keep]
+            result = pd.Series(self.value_counts[counted], index=keys)
+        return result.sort_values(ascending=False)
+
+    def top_values(self, limit):
+        return self.counts().head(limit).index.tolist()
+
+
+class ValueIndex(TokenIndex):
+    """
+    Same index for a single-select column: the whole cell text (as str() prints
+    it, unstripped) is the only token, so masks match `astype(str) == value`.
+    """
+
+    def tokenize(self, text):
+        return [text]
+
+
+def build_index(series, multi_select):
+    return TokenIndex(series) if multi_select else ValueIndex(series)
@@ -0,0 +1,364 @@
+"""
+Workbook loading.
+
+The "- Rows" tabs and "New Client Demographics" are independent, so large
+exports are parsed one sheet per process: every worker opens the workbook
+itself (openpyxl read-only mode only reads the sheet it is asked for) and
+sends its frame back as compact Arrow IPC bytes.
+
+Streaming mode never materializes a whole sheet: rows come from openpyxl's
+read-only iterator, only the requested columns are kept, and every chunk of
+rows is converted to typed columns before the next one is read. Cell values
+and NA strings are handled like read_excel; the one difference is that text
+cells that merely look numeric ("00123") stay text.
+
+Text columns with few distinct values (Funder, Gender, Program, ...) are
+stored as pandas Categoricals: one small int code per row instead of one
+Python string object per cell.
+"""
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import pickle
+import posixpath
+import re
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+from pandas.io.parsers import TextParser
+
+from grantCache import pa, table_to_frame
+
+# Below this size a process pool costs more (interpreter + pandas start-up) than it saves
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+DEFAULT_CHUNK_ROWS = 50_000
+# Text columns with at most this many distinct values per row become Categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def list_sheets(path):
+    with pd.ExcelFile(path) as xl:
+        return list(xl.sheet_names)
+
+
+# Workbook parts every sheet's cell values depend on (text, number formats)
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# re.split patterns: every 4th piece is a shared string index / a cell style index.
+_SHARED_STRING_CELL = re.compile(rb'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+_STYLED_CELL = re.compile(rb'(<c\b[^>]*?\bs=")(\d+)(")')
+
+
+def _shared_strings(zf, infos):
+    """Text of every entry in the shared string table."""
+    if "xl/sharedStrings.xml" not in infos:
+        return []
+    table = ET.fromstring(zf.read("xl/sharedStrings.xml"))
+    return ["".join(t.text or "" for t in si.iter(f"{_NS_MAIN}t")) for si in table.iter(f"{_NS_MAIN}si")]
+
+
+def _cell_formats(zf, infos):
+    """Number format of every cell style (cellXfs entry), as text."""
+    if "xl/styles.xml" not in infos:
+        return []
+    styles = ET.fromstring(zf.read("xl/styles.xml"))
+    codes = {fmt.get("numFmtId"): fmt.get("formatCode", "") for fmt in styles.iter(f"{_NS_MAIN}numFmt")}
+    xfs = styles.find(f"{_NS_MAIN}cellXfs")
+    if xfs is None:
+        return []
+    return [codes.get(xf.get("numFmtId", "0"), xf.get("numFmtId", "0")) for xf in xfs.iter(f"{_NS_MAIN}xf")]
+
+
+def _resolve(xml, pattern, table):
+    """Replace the indexes `pattern` captures by the (escaped) table entries they point at."""
+    pieces = pattern.split(xml)
+    for i in range(2, len(pieces), 4):
+        index = int(pieces[i])
+        if index < len(table):
+            pieces[i] = escape(table[index], {'"': "&quot;"}).encode("utf-8", "surrogatepass")
+    return b"".join(pieces)
+
+
+def sheet_fingerprints(path):
+    """
+    {sheet_name: fingerprint}: a hash of each worksheet part with its shared
+    string indexes replaced by the strings and its cell styles by their number
+    formats. Editing one tab leaves the other tabs' fingerprints alone even
+    though the shared string table and styles.xml are rewritten on save (and
+    renumbered, as openpyxl does). Fonts, fills and the like are ignored; they
+    do not change the values read. The XML is scanned, not parsed, so this is
+    far cheaper than loading. Returns None when the file is not a readable
+    .xlsx.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = {info.filename: info for info in zf.infolist()}
+            workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+            rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+            strings = _shared_strings(zf, infos)
+            formats = _cell_formats(zf, infos)
+            properties = workbook.find(f"{_NS_MAIN}workbookPr")
+            date1904 = b"1904" if properties is not None and properties.get("date1904") in ("1", "true") else b""
+
+            targets = {rel.get("Id"): rel.get("Target", "") for rel in rels.iter(f"{_NS_PKG_REL}Relationship")}
+            fingerprints = {}
+            for sheet in workbook.iter(f"{_NS_MAIN}sheet"):
+                target = targets.get(sheet.get(f"{_NS_REL}id"), "")
+                part = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+                if part not in infos:
+                    fingerprints[sheet.get("name")] = None
+                    continue
+                xml = zf.read(part)
+                if strings:
+                    xml = _resolve(xml, _SHARED_STRING_CELL, strings)
+                xml = _resolve(xml, _STYLED_CELL, formats)
+                digest = hashlib.sha1(date1904)
+                digest.update(xml)
+                fingerprints[sheet.get("name")] = digest.hexdigest()
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError, zlib.error):
+        return None
+    return fingerprints
+
+
+def pack_frame(df):
+    """Serialize a frame for the trip back from a worker (Arrow IPC when available)."""
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return "arrow", sink.getvalue().to_pybytes()
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    return "pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_frame(payload):
+    kind, data = payload
+    if kind == "arrow":
+        return table_to_frame(pa.ipc.open_stream(data).read_all())
+    return pickle.loads(data)
+
+
+def header_key(name):
+    return str(name).strip().lower()
+
+
+def convert_cell(value):
+    """The conversions pandas' openpyxl reader applies to cell values."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def categorize_columns(df, max_ratio=CATEGORY_MAX_RATIO):
+    """
+    Store low-cardinality text columns as Categoricals (in place; returns df).
+    Only all-text columns qualify, so the categories sort like the values did.
+    """
+    for col in df.columns[df.dtypes == object]:
+        series = df[col]
+        n_values = series.count()
+        if not n_values or infer_dtype(series, skipna=True) != "string":
+            continue
+        if series.nunique(dropna=True) <= max_ratio * n_values:
+            df[col] = series.astype("category")
+    return df
+
+
+def parse_chunk(rows, names):
+    if not rows:
+        return pd.DataFrame({name: pd.Series(dtype=object) for name in names})
+    width = len(names)
+    rows = [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+    # dtype=object: NA strings become NaN but text is never coerced to numbers, so
+    # the result does not depend on where chunk boundaries fall
+    return TextParser(rows, header=None, names=names, dtype=object).read().infer_objects()
+
+
+def stream_sheet(path, sheet, columns=None, chunk_size=DEFAULT_CHUNK_ROWS):
+    """
+    Read one sheet row by row (openpyxl read_only/iter_rows), keeping only the
+    columns whose header matches `columns` (case/space-insensitive; all when
+    None). Rows are typed chunk_size at a time, so peak memory is one chunk of
+    raw cell values plus the finished output columns.
+    """
+    import openpyxl
+
+    wanted = None if columns is None else {header_key(c) for c in columns}
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = book[sheet]
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+
+        # Header: the first row, named the way read_excel names it
+        header = None
+        for raw in rows:
+            header = [convert_cell(v) for v in raw]
+            break
+        if header is None:
+            return pd.DataFrame()
+        while header and header[-1] == "":
+            header.pop()
+        names = list(TextParser([header], header=0).read().columns) if header else []
+        keep = [i for i, name in enumerate(names) if wanted is None or header_key(name) in wanted]
+        keep_names = [names[i] for i in keep]
+
+        chunks, buffer = [], []
+        blank_rows = 0
+        buffer_has_values = False
+        for raw in rows:
+            # Blank rows are kept, except trailing ones: hold them until data follows
+            if all(v is None or v == "" for v in raw):
+                blank_rows += 1
+                continue
+            if blank_rows:
+                buffer.extend([""] * len(keep) for _ in range(blank_rows))
+                blank_rows = 0
+            width = len(raw)
+            if wanted is None and width > len(names) and any(v is not None and v != "" for v in raw[len(names):]):
+                # Data wider than the header: read_excel names the extra columns "Unnamed: i"
+                while raw[width - 1] is None or raw[width - 1] == "":
+                    width -= 1
+                names.extend(f"Unnamed: {i}" for i in range(len(names), width))
+                keep = list(range(len(names)))
+                keep_names = list(names)
+            row = [convert_cell(raw[i]) if i < width else "" for i in keep]
+            buffer_has_values = buffer_has_values or any(v != "" for v in row)
+            buffer.append(row)
+            # The parser cannot type a chunk that is blank in every kept column
+            if len(buffer) >= chunk_size and buffer_has_values:
+                chunks.append(parse_chunk(buffer, keep_names))
+                buffer, buffer_has_values = [], False
+        if buffer_has_values or not chunks:
+            chunks.append(parse_chunk(buffer if buffer_has_values else [], keep_names))
+            if buffer and not buffer_has_values:
+                chunks[-1] = chunks[-1].reindex(pd.RangeIndex(len(buffer)), fill_value=np.nan)
+        elif buffer:
+            # Rows blank in the kept columns: pad the last chunk like read_excel would
+            chunks[-1] = chunks[-1].reindex(pd.RangeIndex(len(chunks[-1]) + len(buffer)))
+    finally:
+        book.close()
+    if len(chunks) == 1:
+        return chunks[0]
+    # Columns that were all-blank in some chunk come back as object; settle the final dtype
+    return pd.concat(chunks, ignore_index=True).infer_objects()
+
+
+def read_sheet(path, sheet, columns=None, streaming=False, chunk_size=DEFAULT_CHUNK_ROWS):
+    if streaming:
+        df = stream_sheet(path, sheet, columns, chunk_size)
+    elif columns is None:
+        df = pd.read_excel(path, sheet_name=sheet)
+    else:
+        wanted = {header_key(c) for c in columns}
+        df = pd.read_excel(path, sheet_name=sheet, usecols=lambda name: header_key(name) in wanted)
+    return categorize_columns(df)
+
+
+def parse_sheet(path, sheet, columns=None, streaming=False, chunk_size=DEFAULT_CHUNK_ROWS):
+    """Worker: parse one sheet. Returns (sheet, packed frame or None, seconds, error)."""
+    start = time.perf_counter()
+    try:
+        df = read_sheet(path, sheet, columns, streaming, chunk_size)
+    except Exception as e:
+        return sheet, None, time.perf_counter() - start, str(e)
+    return sheet, pack_frame(df), time.perf_counter() - start, None
+
+
+def resolve_workers(path, n_sheets, workers=None):
+    """workers=None picks automatically: in-process for small files, else one per sheet/core."""
+    if workers is None:
+        if os.path.getsize(path) < PARALLEL_MIN_BYTES:
+            return 1
+        workers = os.cpu_count() or 1
+    return max(1, min(int(workers), n_sheets))
+
+
+def load_sheets(path, workers=None, log=None, columns=None, streaming=False, chunk_size=DEFAULT_CHUNK_ROWS,
+                only=None, progress=None):
+    """
+    Parse every sheet of a workbook (or just the sheets named in `only`).
+    Sheets that fail to parse are skipped.
+
+    columns: optional projection, either [column names] kept on every sheet or
+    {sheet_name: [column names]}, in which case sheets missing from it are not
+    read at all. streaming: read row chunks with openpyxl
+    instead of materializing each sheet (see stream_sheet).
+    progress: optional callable(sheets_done, n_sheets) called as sheets finish;
+    an exception it raises (e.g. a cancelled load) stops the remaining sheets.
+    Returns ({sheet_name: df} in workbook order, {sheet_name: seconds}).
+    """
+    log = log or (lambda message: None)
+    progress = progress or (lambda done, total: None)
+    sheet_names = list_sheets(path)
+    if only is not None:
+        sheet_names = [s for s in sheet_names if s in only]
+    if isinstance(columns, dict):
+        skipped = [s for s in sheet_names if s not in columns]
+        if skipped:
+            log(f"Not reading {len(skipped)} sheet(s) the report does not use: {', '.join(skipped)}")
+        sheet_names = [s for s in sheet_names if s in columns]
+    workers = resolve_workers(path, len(sheet_names), workers) if sheet_names else 1
+
+    def sheet_columns(sheet):
+        return columns[sheet] if isinstance(columns, dict) else columns
+
+    results = {}
+    if workers <= 1:
+        xl = None if streaming or columns is not None else pd.ExcelFile(path)
+        for sheet in sheet_names:
+            start = time.perf_counter()
+            try:
+                if xl is not None:
+                    df = categorize_columns(xl.parse(sheet))
+                else:
+                    df = read_sheet(path, sheet, sheet_columns(sheet), streaming, chunk_size)
+                results[sheet] = (df, time.perf_counter() - start, None)
+            except Exception as e:
+                results[sheet] = (None, time.perf_counter() - start, str(e))
+            log(f"Parsed '{sheet}' in {results[sheet][1]:.2f}s")
+            progress(len(results), len(sheet_names))
+    else:
+        log(f"Parsing {len(sheet_names)} sheets with {workers} worker processes...")
+        # spawn, not fork: the GUI process holds a Tk/X connection
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(parse_sheet, path, sheet, sheet_columns(sheet), streaming, chunk_size)
+                for sheet in sheet_names
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    sheet, payload, seconds, error = future.result()
+                    df = unpack_frame(payload) if payload is not None else None
+                    results[sheet] = (df, seconds, error)
+                    log(f"Parsed '{sheet}' in {seconds:.2f}s")
+                    progress(len(results), len(sheet_names))
+            except BaseException:
+                # Stopped early: sheets not started yet are not parsed for nothing
+                for future in futures:
+                    future.cancel()
+                raise
+
+    sheets, timings = {}, {}
+    for sheet in sheet_names:
+        df, seconds, error = results[sheet]
+        timings[sheet] = seconds
+        if error is not None:
+            log(f"Skipped sheet '{sheet}': {error}")
+            continue
+        sheets[sheet] = df
+    return sheets, timings
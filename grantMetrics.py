@@ -0,0 +1,246 @@
+"""
+Per-stage pipeline metrics.
+
+Every stage of a load or filter run (read workbook, parse each sheet, merge,
+each normalization, dedupe, each filter mask, table refresh, autosize,
+export) is wrapped in Metrics.stage(), which records:
+
+    stage, seconds, rows_in, rows_out,
+    rss_mib (resident memory after the stage), peak_rss_growth_mib (how much
+    the process's peak RSS rose during it), alloc_peak_mib (peak Python
+    allocations above the stage's start; only with trace_memory, which slows
+    pandas down a lot), the enclosing stage and any extra fields.
+
+Records are kept in memory (the GUI's metrics panel) and, given a path,
+appended to a JSON-lines file as they complete:
+
+    {"run": "20261017-101500-4242", "stage": "merge", "seconds": 0.412, "rows_in": 120000, ...}
+
+Once the file reaches max_bytes it is moved to <path>.1 (replacing the older
+one) and a new file is started, so the log takes at most about twice that.
+
+Stages nest per thread. Sheets parsed in worker processes are recorded
+afterwards from their parse times (record()), without memory figures.
+"""
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_psutil = None   # psutil module, False when not installed; imported on first use
+
+METRICS_FILE = "metrics.jsonl"
+MAX_RECORDS = 2000
+MAX_FILE_BYTES = 5 * 1024 ** 2
+MIB = 1024 ** 2
+
+
+def default_metrics_path():
+    return os.environ.get(
+        "GRANT_REPORT_METRICS",
+        os.path.join(os.path.expanduser("~"), ".config", "grant-report", METRICS_FILE),
+    )
+
+
+def load_psutil():
+    """psutil if installed (optional, and slow to import, so only when /proc is missing)."""
+    global _psutil
+    if _psutil is None:
+        try:
+            import psutil
+        except ImportError:
+            psutil = False
+        _psutil = psutil
+    return _psutil or None
+
+
+def rss_bytes():
+    """Resident memory of this process now (None when it cannot be read)."""
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    psutil = load_psutil()
+    return psutil.Process().memory_info().rss if psutil is not None else None
+
+
+def peak_rss_bytes():
+    """Highest resident memory this process has reached (None when unknown)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    psutil = load_psutil()
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+def mib(n_bytes):
+    return None if n_bytes is None else round(n_bytes / MIB, 2)
+
+
+class Stage:
+    """An open stage: set rows_out (and info entries) before it ends."""
+
+    def __init__(self, name, rows_in, info, parent):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.info = info
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.alloc_start = 0
+        self.alloc_peak = 0
+
+
+class Metrics:
+    def __init__(self, path=None, trace_memory=False, keep=MAX_RECORDS, max_bytes=MAX_FILE_BYTES):
+        # path: JSON-lines file records are appended to (None = memory only)
+        # max_bytes: size at which the file is rotated to <path>.1 (None = never)
+        # trace_memory: measure Python allocations per stage with tracemalloc (slow)
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.records = collections.deque(maxlen=keep)
+        self.on_record = None   # optional callable(record); called on the recording thread
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.handle = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.handle = open(path, "a", encoding="utf-8")
+            self._rotate_if_full()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _rotate_if_full(self):
+        """Move a full file to <path>.1 and start a new one."""
+        if not self.max_bytes or self.handle.tell() < self.max_bytes:
+            return
+        self.handle.close()
+        try:
+            os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass   # e.g. open in another process on Windows: keep appending
+        self.handle = open(self.path, "a", encoding="utf-8")
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _fold_alloc_peak(self, stack):
+        # reset_peak() is global: carry the peak so far into every open stage before resetting
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in stack:
+            stage.alloc_peak = max(stage.alloc_peak, peak)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None, **info):
+        """Time and measure the enclosed block as one record; yields the Stage."""
+        stack = self._stack()
+        stage = Stage(name, rows_in, info, stack[-1] if stack else None)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            self._fold_alloc_peak(stack)
+            tracemalloc.reset_peak()
+            stage.alloc_start = tracemalloc.get_traced_memory()[0]
+        stack.append(stage)
+        peak_before = peak_rss_bytes()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield stage
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            record = {}
+            if tracing:
+                self._fold_alloc_peak(stack + [stage])
+                record["alloc_peak_mib"] = mib(stage.alloc_peak - stage.alloc_start)
+            peak_after = peak_rss_bytes()
+            if peak_before is not None and peak_after is not None:
+                record["peak_rss_growth_mib"] = mib(peak_after - peak_before)
+            if error is not None:
+                record["error"] = error
+            self.record(
+                name, seconds, rows_in=stage.rows_in, rows_out=stage.rows_out,
+                parent=stage.parent.name if stage.parent else None, depth=stage.depth,
+                **record, **stage.info,
+            )
+
+    def record(self, name, seconds, rows_in=None, rows_out=None, **info):
+        """Add a finished stage measured elsewhere (e.g. a sheet parsed in a worker process)."""
+        if "depth" not in info:
+            stack = self._stack()
+            info["parent"] = stack[-1].name if stack else None
+            info["depth"] = len(stack)
+        record = {
+            "run": self.run_id,
+            "time": round(time.time(), 3),
+            "stage": name,
+            "seconds": round(seconds, 6),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rss_mib": mib(rss_bytes()),
+        }
+        record.update(info)
+        with self._lock:
+            self.records.append(record)
+            if self.handle is not None:
+                try:
+                    self.handle.write(json.dumps(record, default=str) + "\n")
+                    self.handle.flush()
+                    self._rotate_if_full()
+                except OSError:
+                    # A full disk must not stop the pipeline; keep the in-memory records
+                    self.handle = None
+        if self.on_record is not None:
+            self.on_record(record)
+        return record
+
+    def summary(self):
+        """[(stage, calls, total seconds)] over the kept records, slowest first (nested stages included)."""
+        totals = {}
+        for record in list(self.records):
+            calls, seconds = totals.get(record["stage"], (0, 0.0))
+            totals[record["stage"]] = (calls + 1, seconds + record["seconds"])
+        return sorted(((s, c, t) for s, (c, t) in totals.items()), key=lambda row: -row[2])
+
+    def close(self):
+        with self._lock:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+
+def format_record(record):
+    """One readable line: "merge: 0.41s, 120000 -> 30000 rows, RSS 512.0 MiB (peak +40.0)"."""
+    text = f"{record['stage']}: {record['seconds']:.3f}s"
+    if record.get("rows_in") is not None or record.get("rows_out") is not None:
+        rows_in, rows_out = record.get("rows_in"), record.get("rows_out")
+        text += f", {rows_in if rows_in is not None else '?'} -> {rows_out if rows_out is not None else '?'} rows"
+    if record.get("rss_mib") is not None:
+        text += f", RSS {record['rss_mib']:.1f} MiB"
+        if record.get("peak_rss_growth_mib"):
+            text += f" (peak +{record['peak_rss_growth_mib']:.1f})"
+    if record.get("alloc_peak_mib") is not None:
+        text += f", alloc peak {record['alloc_peak_mib']:.1f} MiB"
+    if record.get("error"):
+        text += f" [{record['error']}]"
+    return text
@@ -0,0 +1,362 @@
+"""
+Column normalizations for Apricot exports.
+
+What each column is cleaned to is declared in a rule set (DEFAULT_RULES, or a
+JSON/YAML rules file merged over it) instead of code: exact spellings,
+regexes and fuzzy matches against canonical choices, per column. A rule set
+is compiled once (regexes compiled, lookup tables lower-cased) into
+NormalizationRules. Fuzzy matching is opt-in per rule: it rewrites values
+nothing else matched, so the default rules leave it off.
+
+Exports repeat a few dozen distinct values across hundreds of thousands of
+rows, so rules are evaluated once per distinct value (pd.factorize) and the
+answers broadcast back with a single take. Answers are memoized per rule
+across calls, and fuzzy matches (the expensive part) can be kept across runs
+in a FuzzyMatchCache.
+
+The scalar functions are the original per-cell normalizers, kept as the
+reference: the *_series functions apply the default rules and must give
+identical output.
+"""
+import difflib
+import hashlib
+import json
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+# Values shorter than this are never fuzzy-matched (too little to go on)
+FUZZY_MIN_LENGTH = 4
+DEFAULT_FUZZY_CUTOFF = 0.85
+# Distinct values memoized per rule before the memo starts over
+MAX_MEMO_VALUES = 100_000
+
+RULE_KEYS = {"blank", "missing", "strip", "exact", "regex", "choices", "fuzzy", "default"}
+
+# Lower-cased misspellings -> canonical country name
+CITIZENSHIP_FIXES = {
+    "nicaragua": "Nicaragua",
+    "nicaraugua": "Nicaragua",
+    "niceragua": "Nicaragua",
+    "nicaragua.": "Nicaragua",
+}
+
+MULTI_SELECT_BLANKS = {"blank": ""}
+
+COUNTRIES = [
+    "Afghanistan", "Albania", "Algeria", "Angola", "Argentina", "Armenia", "Australia", "Austria",
+    "Azerbaijan", "Bahamas", "Bangladesh", "Belarus", "Belgium", "Belize", "Benin", "Bolivia",
+    "Bosnia and Herzegovina", "Brazil", "Bulgaria", "Burkina Faso", "Burma", "Burundi", "Cambodia",
+    "Cameroon", "Canada", "Chad", "Chile", "China", "Colombia", "Congo", "Costa Rica", "Croatia", "Cuba",
+    "Czech Republic", "Democratic Republic of the Congo", "Dominica", "Dominican Republic", "Ecuador",
+    "Egypt", "El Salvador", "Eritrea", "Ethiopia", "Fiji", "France", "Gambia", "Georgia", "Germany",
+    "Ghana", "Greece", "Guatemala", "Guinea", "Guyana", "Haiti", "Honduras", "Hungary", "India",
+    "Indonesia", "Iran", "Iraq", "Ireland", "Israel", "Italy", "Ivory Coast", "Jamaica", "Japan",
+    "Jordan", "Kazakhstan", "Kenya", "Kyrgyzstan", "Laos", "Lebanon", "Liberia", "Libya", "Lithuania",
+    "Madagascar", "Malawi", "Malaysia", "Mali", "Marshall Islands", "Mauritania", "Mexico", "Moldova",
+    "Mongolia", "Morocco", "Mozambique", "Nepal", "Netherlands", "New Zealand", "Nicaragua", "Niger",
+    "Nigeria", "North Korea", "Pakistan", "Panama", "Papua New Guinea", "Paraguay", "Peru", "Philippines",
+    "Poland", "Portugal", "Romania", "Russia", "Rwanda", "Samoa", "Saudi Arabia", "Senegal", "Serbia",
+    "Sierra Leone", "Somalia", "South Africa", "South Korea", "South Sudan", "Spain", "Sri Lanka",
+    "Sudan", "Syria", "Taiwan", "Tajikistan", "Tanzania", "Thailand", "Togo", "Tonga", "Trinidad and Tobago",
+    "Tunisia", "Turkey", "Turkmenistan", "Uganda", "Ukraine", "United Kingdom", "Uruguay", "USA",
+    "Uzbekistan", "Venezuela", "Vietnam", "Yemen", "Zambia", "Zimbabwe",
+]
+
+LANGUAGES = [
+    "English", "Spanish", "French", "Portuguese", "Haitian Creole", "Mandarin", "Cantonese", "Vietnamese",
+    "Tagalog", "Korean", "Japanese", "Arabic", "Russian", "Ukrainian", "Hindi", "Punjabi", "Urdu",
+    "Bengali", "Nepali", "Thai", "Khmer", "Burmese", "Somali", "Amharic", "Tigrinya", "Swahili", "Farsi",
+    "Dari", "Pashto", "K'iche'", "Mam", "Q'anjob'al", "American Sign Language",
+]
+
+# Per-column rules, applied to each distinct (stringified) value in this order:
+#   blank    output for blank cells (None, whitespace, "nan"); left out = not special
+#   missing  "keep": None/NaN cells stay missing instead of being normalized as text
+#   strip    trim surrounding whitespace (default true)
+#   exact    {spelling: output}, matched case-insensitively on the trimmed value
+#   regex    [[pattern, output], ...]; the first pattern found (case-insensitive)
+#            wins and the output may use its groups (\1)
+#   choices  canonical values, or the name of a built-in list ("countries",
+#            "languages"); any casing of one maps to it
+#   fuzzy    {"cutoff": 0.85}: the closest choice (difflib ratio) for values
+#            nothing above matched; "choices" narrows the candidates (e.g. to
+#            the names whose misspellings turn up). Off unless set: a valid
+#            value missing from the choices would be rewritten to a neighbour
+#   default  output when nothing matched; left out = the trimmed value
+DEFAULT_RULES = {
+    "Type of Victimization": {
+        "blank": "",
+        "regex": [
+            ["(?=.*sex trafficking)(?=.*labor trafficking)", "Both Sex & Labor Trafficking"],
+            ["sex trafficking", "Sex Trafficking"],
+            ["labor trafficking", "Labor Trafficking"],
+        ],
+        "default": "Other/Exploitation",
+    },
+    "Country of Citizenship": {
+        "exact": CITIZENSHIP_FIXES,
+    },
+    "Primary Language": {
+        "missing": "keep",
+        "exact": {"asl": "American Sign Language", "creole": "Haitian Creole", "persian": "Farsi"},
+        "choices": "languages",
+    },
+    # Multi-select fields keep their raw "jumbled" text; only blanks become ""
+    "Race/Ethnicity": MULTI_SELECT_BLANKS,
+    "Disability": MULTI_SELECT_BLANKS,
+    "Victim Type": MULTI_SELECT_BLANKS,
+    "Homelessness": MULTI_SELECT_BLANKS,
+    "Age at Time of Trafficking": MULTI_SELECT_BLANKS,
+}
+
+CHOICE_LISTS = {"countries": COUNTRIES, "languages": LANGUAGES}
+
+
+def as_text(series):
+    """str(value) for every cell (None -> 'None', NaN -> 'nan'), as an object Series."""
+    text = series.astype(str).astype(object)
+    missing = text.isna()
+    if missing.any():
+        # newer pandas keeps missing values through astype(str); stringify just those
+        text[missing] = series[missing].map(str)
+    return text
+
+
+def map_distinct(series, transform):
+    """
+    Run a vectorized transform over the distinct values of a column and map the
+    results back onto every row. None and NaN stay distinct (str() differs).
+    """
+    if series.empty:
+        return transform(series)
+    categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    # On a Categorical this only walks the integer codes
+    codes, uniques = pd.factorize(series)
+    if categorical:
+        uniques = uniques.astype(object)
+    if infer_dtype(uniques, skipna=False) not in ("string", "empty"):
+        # e.g. 1 and 1.0 share a hash bucket but print differently: no shortcut
+        return transform(series.astype(object) if categorical else series)
+    table = pd.Series(list(uniques) + [None, np.nan], dtype=object)
+    labels = transform(table).to_numpy(dtype=object)
+    missing = codes < 0
+    if missing.any():
+        values = series.to_numpy(dtype=object)[missing]
+        codes[missing] = np.where(np.equal(values, None), len(uniques), len(uniques) + 1)
+    if categorical:
+        # Categorical in, Categorical out: re-code the labels instead of building strings per row
+        label_codes, label_uniques = pd.factorize(labels, sort=True)
+        result = pd.Categorical.from_codes(label_codes[codes], categories=label_uniques)
+        return pd.Series(result, index=series.index, name=series.name)
+    return pd.Series(labels[codes], index=series.index, name=series.name)
+
+
+def is_missing(value):
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+class ColumnRule:
+    """One column's compiled rule: maps a cell's text to its normalized value."""
+
+    def __init__(self, column, spec, fuzzy_cache=None):
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown normalization rule key(s) for {column}: {', '.join(sorted(unknown))}")
+        self.column = column
+        self.blank = spec.get("blank")
+        self.keep_missing = spec.get("missing") == "keep"
+        self.strip = spec.get("strip", True)
+        self.default = spec.get("default")
+        choices = self.choice_list(spec.get("choices", []))
+        # Exact spellings win over the choices' own casing
+        self.exact = {c.lower(): c for c in choices}
+        self.exact.update({str(k).strip().lower(): v for k, v in spec.get("exact", {}).items()})
+        try:
+            self.regex = [
+                (re.compile(pattern, re.IGNORECASE | re.DOTALL), output) for pattern, output in spec.get("regex", [])
+            ]
+        except (re.error, TypeError, ValueError) as e:
+            raise ValueError(f"Bad normalization regex for {column}: {e}")
+        fuzzy = spec.get("fuzzy")
+        self.fuzzy_cutoff = None
+        self.fuzzy_keys = {}
+        self.fuzzy_matches = {}
+        self.fuzzy_cache = fuzzy_cache
+        targets = self.choice_list(fuzzy.get("choices", choices)) if fuzzy else []
+        if targets:
+            self.fuzzy_cutoff = float(fuzzy.get("cutoff", DEFAULT_FUZZY_CUTOFF))
+            self.fuzzy_keys = {c.lower(): c for c in targets}
+            if fuzzy_cache is not None:
+                # One namespace per rule: changed choices or cutoff never reuse stale matches
+                digest = hashlib.sha1(
+                    json.dumps([sorted(self.fuzzy_keys), self.fuzzy_cutoff]).encode("utf-8")
+                ).hexdigest()[:12]
+                self.fuzzy_matches = fuzzy_cache.namespace(f"{column}:{digest}")
+        self.memo = {}
+
+    def choice_list(self, choices):
+        if isinstance(choices, str):
+            if choices not in CHOICE_LISTS:
+                raise ValueError(
+                    f"Unknown choice list for {self.column}: {choices} (built in: {', '.join(CHOICE_LISTS)})"
+                )
+            choices = CHOICE_LISTS[choices]
+        return [str(c) for c in choices]
+
+    def fuzzy_match(self, key):
+        if key in self.fuzzy_matches:
+            return self.fuzzy_matches[key]
+        found = difflib.get_close_matches(key, list(self.fuzzy_keys), n=1, cutoff=self.fuzzy_cutoff)
+        match = self.fuzzy_keys[found[0]] if found else None
+        self.fuzzy_matches[key] = match
+        if self.fuzzy_cache is not None:
+            self.fuzzy_cache.mark_dirty()
+        return match
+
+    def resolve(self, text):
+        """Normalized value for a cell's str() (None for a None cell)."""
+        raw = "None" if text is None else text
+        stripped = raw.strip()
+        value = stripped if self.strip else raw
+        key = stripped.lower()
+        if self.blank is not None and (text is None or key in ("", "nan")):
+            return self.blank
+        if key in self.exact:
+            return self.exact[key]
+        for pattern, output in self.regex:
+            match = pattern.search(value)
+            if match:
+                return match.expand(output)
+        if self.fuzzy_cutoff is not None and text is not None and key != "nan" and len(key) >= FUZZY_MIN_LENGTH:
+            match = self.fuzzy_match(key)
+            if match is not None:
+                return match
+        return self.default if self.default is not None else value
+
+    def value(self, text):
+        if text not in self.memo:
+            if len(self.memo) >= MAX_MEMO_VALUES:
+                self.memo.clear()
+            self.memo[text] = self.resolve(text)
+        return self.memo[text]
+
+    def value_of(self, cell):
+        """The rule applied to one cell."""
+        if self.keep_missing and is_missing(cell):
+            return np.nan
+        return self.value(None if cell is None else str(cell))
+
+    def map_values(self, series):
+        """The rule over a Series: each distinct text is resolved once."""
+        if series.empty:
+            return series.copy()
+        text = as_text(series)
+        none = (series.isna() & text.eq("None")).to_numpy()
+        codes, uniques = pd.factorize(text)
+        labels = np.array([self.value(u) for u in uniques], dtype=object)
+        out = labels[codes]
+        if none.any():
+            out[none] = self.value(None)
+        if self.keep_missing:
+            out[series.isna().to_numpy()] = np.nan
+        return pd.Series(out, index=series.index, name=series.name)
+
+    def apply(self, series):
+        return map_distinct(series, self.map_values)
+
+
+class NormalizationRules:
+    """A compiled rule set: {column: ColumnRule}."""
+
+    def __init__(self, rules=None, fuzzy_cache=None):
+        self.spec = DEFAULT_RULES if rules is None else rules
+        self.fuzzy_cache = fuzzy_cache
+        self.rules = {
+            column: ColumnRule(column, spec, fuzzy_cache) for column, spec in self.spec.items() if spec is not None
+        }
+
+    @property
+    def columns(self):
+        return list(self.rules)
+
+    def __getitem__(self, column):
+        return self.rules[column]
+
+    def apply(self, column, series):
+        return self.rules[column].apply(series)
+
+    def fingerprint(self):
+        """Short hash of the rule spec (part of cache keys for non-default rules)."""
+        return hashlib.sha1(json.dumps(self.spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:10]
+
+    def is_default(self):
+        return self.spec is DEFAULT_RULES or self.spec == DEFAULT_RULES
+
+    def save_matches(self):
+        """Persist new fuzzy matches (no-op without a cache)."""
+        if self.fuzzy_cache is not None:
+            try:
+                self.fuzzy_cache.save()
+            except OSError:
+                # Only a speed-up; the next run recomputes the matches
+                pass
+
+
+def merge_rules(overrides, base=None):
+    """Rules file contents ({column: rule or null to drop it}) over the default rules."""
+    if not isinstance(overrides, dict):
+        raise ValueError("Normalization rules must map column names to rules")
+    overrides = overrides.get("rules", overrides)
+    merged = dict(DEFAULT_RULES if base is None else base)
+    for column, spec in overrides.items():
+        if spec is not None and not isinstance(spec, dict):
+            raise ValueError(f"Normalization rule for {column} must be a mapping")
+        merged[column] = spec
+    return {column: spec for column, spec in merged.items() if spec is not None}
+
+
+DEFAULT_NORMALIZATION = NormalizationRules()
+
+
+def normalize_victimization(value):
+    val_str = str(value).lower()
+    if 'sex trafficking' in val_str and 'labor trafficking' in val_str:
+        return 'Both Sex & Labor Trafficking'
+    elif 'sex trafficking' in val_str:
+        return 'Sex Trafficking'
+    elif 'labor trafficking' in val_str:
+        return 'Labor Trafficking'
+    if value is None or str(value).strip() == "" or str(value).strip().lower() == "nan":
+        return ""
+    # preserve as-is but bucket it
+    return 'Other/Exploitation'
+
+
+def normalize_citizenship(value):
+    val_str = str(value).strip()
+    return CITIZENSHIP_FIXES.get(val_str.lower(), val_str)
+
+
+def normalize_blank(value):
+    return "" if value is None or str(value).strip().lower() == "nan" else str(value).strip()
+
+
+def normalize_victimization_series(series):
+    """normalize_victimization over a column, once per distinct value."""
+    return DEFAULT_NORMALIZATION.apply("Type of Victimization", series)
+
+
+def normalize_citizenship_series(series):
+    """normalize_citizenship over a column, once per distinct value."""
+    return DEFAULT_NORMALIZATION.apply("Country of Citizenship", series)
+
+
+def normalize_blank_series(series):
+    """normalize_blank over a column: strip values, None/'nan' become ''."""
+    return DEFAULT_NORMALIZATION.apply("Race/Ethnicity", series)
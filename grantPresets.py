@@ -0,0 +1,167 @@
+"""
+Named filter presets: each funder's fixed filter recipe, stored as a
+declarative spec instead of being re-picked in the dropdowns every month.
+
+A preset file (JSON, or YAML when PyYAML is installed) maps preset names to
+filter specs in the usual form (see grantFilters):
+
+    {"presets": {
+        "OVC - sex trafficking, homeless": {
+            "Funder": "OVC",
+            "Type of Victimization": "Sex Trafficking",
+            "Homelessness": "Yes"},
+        "HHS - non-male": {"Funder": "HHS", "Gender": {"not": "Male"}}}}
+
+A file holding a single spec is one preset named after the file.
+
+evaluate_presets runs many presets against one prepared view with a single
+FilterEngine. Masks are cached per (field, value) and per field selection,
+so presets sharing "Funder=OVC" compute that mask once, and counts and row
+positions for dozens of presets cost little more than one filter each.
+"""
+import json
+import os
+
+from grantFields import FILTER_FIELDS
+
+PRESETS_FILE = "presets.json"
+
+
+def default_presets_path():
+    return os.environ.get(
+        "GRANT_REPORT_PRESETS",
+        os.path.join(os.path.expanduser("~"), ".config", "grant-report", PRESETS_FILE),
+    )
+
+
+def is_yaml_path(path):
+    return os.path.splitext(path)[1].lower() in (".yaml", ".yml")
+
+
+def require_yaml(path):
+    # PyYAML is optional (presets are JSON then) and only imported for YAML files
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError(f"{path} is YAML, which needs PyYAML (pip install pyyaml)")
+    return yaml
+
+
+def read_spec_file(path):
+    """Parse a JSON or YAML file (by extension)."""
+    with open(path, "r", encoding="utf-8") as fh:
+        if not is_yaml_path(path):
+            return json.load(fh)
+        return require_yaml(path).safe_load(fh)
+
+
+def check_presets(presets, filter_fields=FILTER_FIELDS):
+    """Raise ValueError for a preset filtering on a field that is not a filter field (it would match everyone)."""
+    for name, spec in presets.items():
+        for field in spec:
+            if field not in filter_fields:
+                raise ValueError(f"Preset {name!r} filters on unknown field {field!r}")
+
+
+def load_presets(path, filter_fields=None):
+    """
+    {name: filter spec} from a preset file. A mapping without a "presets" key
+    is one spec (named after the file) when its keys are filter fields.
+    Every spec is checked against the filter fields (default FILTER_FIELDS).
+    """
+    filter_fields = FILTER_FIELDS if filter_fields is None else filter_fields
+    data = read_spec_file(path)
+    if not isinstance(data, dict):
+        raise ValueError(f"Preset file must hold a mapping: {path}")
+    if "presets" in data:
+        presets = data["presets"]
+    elif set(data) <= set(filter_fields):
+        presets = {os.path.splitext(os.path.basename(path))[0]: data}
+    else:
+        presets = data
+    if not isinstance(presets, dict) or not all(isinstance(spec, dict) for spec in presets.values()):
+        raise ValueError(f"Presets must map names to filter specs: {path}")
+    presets = {str(name): spec for name, spec in presets.items()}
+    check_presets(presets, filter_fields)
+    return presets
+
+
+def preset_file_name(name):
+    """A preset name made safe for use in a file name."""
+    return "".join(c if c.isalnum() or c in "-_. " else "_" for c in name).strip() or "preset"
+
+
+def save_presets(path, presets):
+    """Write {name: spec} as a preset file (YAML for .yaml/.yml), replacing it atomically."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    part = f"{path}.part"
+    with open(part, "w", encoding="utf-8") as fh:
+        if is_yaml_path(path):
+            require_yaml(path).safe_dump({"presets": presets}, fh, sort_keys=False, allow_unicode=True)
+        else:
+            json.dump({"presets": presets}, fh, indent=2, ensure_ascii=False)
+    os.replace(part, path)
+
+
+class PresetStore:
+    """The presets saved from the GUI: a preset file that is re-read and rewritten on change."""
+
+    def __init__(self, path=None):
+        self.path = path or default_presets_path()
+        self.presets = load_presets(self.path) if os.path.exists(self.path) else {}
+
+    def names(self):
+        return sorted(self.presets, key=str.lower)
+
+    def get(self, name):
+        return self.presets[name]
+
+    def save(self, name, spec):
+        self.presets[name] = spec
+        save_presets(self.path, self.presets)
+
+    def delete(self, name):
+        if self.presets.pop(name, None) is not None:
+            save_presets(self.path, self.presets)
+
+
+class PresetResult:
+    def __init__(self, name, active, clients, rows, mask):
+        self.name = name
+        self.active = active    # ["field=value", ...] for the filters that applied
+        self.clients = clients
+        self.rows = rows
+        self.mask = mask        # boolean row mask over the view (the client list)
+
+    def describe(self):
+        return f"{self.name}: {self.clients} clients, {self.rows} rows ({', '.join(self.active) or 'no filters'})"
+
+
+def evaluate_presets(filters, presets, id_column=None, filter_fields=FILTER_FIELDS):
+    """
+    Run {name: spec} presets through one FilterEngine. Presets are visited in
+    spec order so neighbours share field selections; results come back in the
+    given order as {name: PresetResult}. Specs naming a field outside
+    filter_fields raise ValueError before anything runs.
+    """
+    check_presets(presets, filter_fields)
+    order = sorted(presets, key=lambda name: json.dumps(presets[name], sort_keys=True, default=str))
+    results = {}
+    for name in order:
+        filters.update(presets[name])
+        rows = filters.count()
+        clients = filters.count_unique(id_column) if id_column in filters.df.columns else rows
+        results[name] = PresetResult(name, filters.active_labels(), clients, rows, filters.mask())
+    return {name: results[name] for name in presets}
+
+
+def results_frame(results):
+    """One row per preset (name, filters, clients, rows): the summary sheet of a batch run."""
+    import pandas as pd
+
+    return pd.DataFrame({
+        "Preset": list(results),
+        "Filters": ["; ".join(r.active) for r in results.values()],
+        "Clients": [r.clients for r in results.values()],
+        "Rows": [r.rows for r in results.values()],
+    })
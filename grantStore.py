@@ -0,0 +1,498 @@
+"""
+Embedded client store (SQLite) for large exports.
+
+The prepared views of a loaded workbook (normalized, de-duplicated: the sheet
+views, the merged view and the demographics tab) are written once into a
+local SQLite database, keyed like the workbook cache (content hash + loading
+mode). Reopening the same export then skips Excel and pandas entirely:
+filters, counts, dropdown counts and cross-tabs run as queries, and only the
+rows on screen (or being exported) are read back.
+
+Per stored view the database holds:
+
+    v<N>            one row per view row: _pos (its position in the view), the
+                    columns (c0, c1, ...) and, per filter field, the code of its
+                    cell text (k0, k1, ...; indexed, like the client ID)
+    v<N>_tokens     (field, code, token): the dropdown values each code matches
+                    when filtering, the way TokenIndex/ValueIndex match them
+    v<N>_buckets    (field, code, bucket): the buckets each code counts under in
+                    cross-tabs and dropdown counts, as grantAggregate counts them
+
+The dropdown value lists are computed from the frame when the view is written
+and kept with it. Nothing reads a whole view back: counts and cross-tabs are
+GROUP BY queries, and rows are read by position, one window or export chunk
+at a time.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype, is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype,
+)
+
+from grantAggregate import CLIENTS, ROWS, bucket_membership
+from grantCache import default_cache_dir
+from grantFilters import describe_selection, parse_selection
+from grantNormalize import as_text
+
+# Bump when the layout changes: an older database is emptied and refilled
+STORE_VERSION = 3
+STORE_FILE = "clients.sqlite"
+# Workbooks kept; the least recently opened are dropped beyond this
+MAX_STORED_WORKBOOKS = 3
+WRITE_CHUNK_ROWS = 50_000
+# Bound parameters per "_pos IN (...)" lookup (SQLite's default limit is 999 on old builds)
+READ_CHUNK_ROWS = 900
+
+
+def default_store_path():
+    return os.environ.get("GRANT_REPORT_STORE") or os.path.join(default_cache_dir(), STORE_FILE)
+
+
+def storage_column(series):
+    """(kind, values) of one column as SQLite stores it: None for missing, dates as ISO text."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        text = infer_dtype(series.cat.categories, skipna=True) in ("string", "empty")
+        series = series.astype(object)
+    else:
+        text = infer_dtype(series, skipna=True) in ("string", "empty")
+    present = series.notna()
+    if is_bool_dtype(series.dtype):
+        kind = "bool"
+    elif is_integer_dtype(series.dtype):
+        kind = "int"
+    elif is_float_dtype(series.dtype):
+        kind = "float"
+    elif is_datetime64_any_dtype(series.dtype):
+        kind = "datetime"
+        series = series.astype(str)
+    else:
+        kind = "text"
+        if not text:
+            # Mixed types do not order or bind consistently: keep their printed text
+            series = as_text(series)
+    return kind, series.astype(object).where(present, None).tolist()
+
+
+def frame_column(values, kind):
+    """Inverse of storage_column for values read back."""
+    series = pd.Series(values, dtype=object)
+    present = series.notna()
+    if kind == "datetime":
+        return pd.to_datetime(series)
+    if kind in ("int", "bool") and present.all():
+        return series.astype("int64" if kind == "int" else bool)
+    if kind in ("int", "float"):
+        return series.astype(float)
+    # Excel parsing gives NaN for empty text cells
+    return series.where(present, np.nan)
+
+
+class ClientStore:
+    def __init__(self, path=None, keep=MAX_STORED_WORKBOOKS):
+        self.path = path or default_store_path()
+        self.keep = keep
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # One connection per thread: the GUI reads preview rows while the worker queries
+        self._local = threading.local()
+        self._create_schema()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def _create_schema(self):
+        row = None
+        try:
+            row = self.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        except sqlite3.OperationalError:
+            pass
+        if row is not None and int(row[0]) == STORE_VERSION:
+            return
+        # Missing or written by another version: start over
+        conn = self.connection()
+        tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        conn.execute("BEGIN")
+        for name in tables:
+            if not name.startswith("sqlite_"):
+                conn.execute(f'DROP TABLE "{name}"')
+        conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE workbooks (key TEXT PRIMARY KEY, path TEXT, default_view TEXT, written REAL, opened REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE views (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, name TEXT, position INTEGER, "
+            "rows INTEGER, clients INTEGER, info TEXT)"
+        )
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (str(STORE_VERSION),))
+        conn.execute("COMMIT")
+
+    # ---- Workbooks ----
+
+    def has_workbook(self, key):
+        """True when every view of the workbook was written (an interrupted write does not count)."""
+        return self.execute("SELECT 1 FROM workbooks WHERE key = ?", (key,)).fetchone() is not None
+
+    def open_views(self, key):
+        """{view name: StoreView} of a stored workbook, in the order they were written."""
+        self.execute("UPDATE workbooks SET opened = ? WHERE key = ?", (time.time(), key))
+        rows = self.execute(
+            "SELECT id, name, rows, clients, info FROM views WHERE key = ? ORDER BY position", (key,)
+        ).fetchall()
+        return {name: StoreView(self, view_id, name, n_rows, clients, json.loads(info))
+                for view_id, name, n_rows, clients, info in rows}
+
+    def default_view(self, key):
+        row = self.execute("SELECT default_view FROM workbooks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def finish_workbook(self, key, path, default_view):
+        """Mark a workbook complete once all its views are written, and drop the oldest beyond `keep`."""
+        now = time.time()
+        self.execute(
+            "INSERT OR REPLACE INTO workbooks VALUES (?, ?, ?, ?, ?)",
+            (key, os.path.abspath(path), default_view, now, now),
+        )
+        stale = self.execute(
+            "SELECT key FROM workbooks ORDER BY opened DESC LIMIT -1 OFFSET ?", (self.keep,)
+        ).fetchall()
+        for (old_key,) in stale:
+            self.drop_workbook(old_key)
+
+    def drop_workbook(self, key):
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            for (view_id,) in conn.execute("SELECT id FROM views WHERE key = ?", (key,)).fetchall():
+                for suffix in ("", "_tokens", "_buckets"):
+                    conn.execute(f"DROP TABLE IF EXISTS v{view_id}{suffix}")
+            conn.execute("DELETE FROM views WHERE key = ?", (key,))
+            conn.execute("DELETE FROM workbooks WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---- Writing ----
+
+    def write_view(self, key, name, position, df, index, values, id_column=None, multi_select_fields=(),
+                   progress=None):
+        """
+        Write one prepared view (one transaction). index: {field: TokenIndex/ValueIndex}
+        of df's filter fields; values: their dropdown values. progress: optional
+        callable(fraction), raising from it cancels.
+        """
+        columns = list(df.columns)
+        fields = [f for f in index if f in columns]
+        kinds, stored = [], []
+        for i in range(len(columns)):
+            kind, column = storage_column(df.iloc[:, i])
+            kinds.append(kind)
+            stored.append(column)
+        stored += [index[f].row_codes.tolist() for f in fields]
+        info = {
+            "columns": columns,
+            "kinds": kinds,
+            "fields": fields,
+            "multi_select": [f for f in fields if f in multi_select_fields],
+            "id_column": id_column if id_column in columns else None,
+            "values": values,
+            "missing_tokens": {f: sorted(index[f].missing_tokens) for f in fields},
+        }
+        clients = int(df[id_column].nunique(dropna=True)) if info["id_column"] else len(df)
+
+        conn = self.connection()
+        conn.execute("BEGIN")
+        try:
+            view_id = conn.execute(
+                "INSERT INTO views (key, name, position, rows, clients, info) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, name, position, len(df), clients, json.dumps(info, default=str)),
+            ).lastrowid
+            table = f"v{view_id}"
+            sql_columns = [f"c{i}" for i in range(len(columns))] + [f"k{j}" for j in range(len(fields))]
+            # No declared types: values keep the type they were written with
+            conn.execute(f"CREATE TABLE {table} (_pos INTEGER PRIMARY KEY, {', '.join(sql_columns)})")
+            insert = f"INSERT INTO {table} VALUES ({', '.join('?' * (len(sql_columns) + 1))})"
+            for start in range(0, len(df), WRITE_CHUNK_ROWS):
+                stop = min(start + WRITE_CHUNK_ROWS, len(df))
+                conn.executemany(insert, zip(range(start, stop), *(c[start:stop] for c in stored)))
+                if progress is not None:
+                    progress(stop / len(df))
+
+            conn.execute(f"CREATE TABLE {table}_tokens (field INTEGER, code INTEGER, token TEXT)")
+            conn.execute(f"CREATE TABLE {table}_buckets (field INTEGER, code INTEGER, bucket TEXT)")
+            for j, field in enumerate(fields):
+                field_index = index[field]
+                conn.executemany(f"INSERT INTO {table}_tokens VALUES (?, ?, ?)", (
+                    (j, code, token)
+                    for code, text in enumerate(field_index.value_texts)
+                    for token in dict.fromkeys(field_index.tokenize(text))
+                ))
+                buckets, value_ids, bucket_ids = bucket_membership(field_index)
+                conn.executemany(f"INSERT INTO {table}_buckets VALUES (?, ?, ?)", (
+                    (j, code, buckets[bucket]) for code, bucket in zip(value_ids.tolist(), bucket_ids.tolist())
+                ))
+                conn.execute(f"CREATE INDEX {table}_k{j} ON {table} (k{j})")
+            if info["id_column"]:
+                conn.execute(f"CREATE INDEX {table}_id ON {table} (c{columns.index(id_column)})")
+            conn.execute(f"CREATE INDEX {table}_tokens_match ON {table}_tokens (field, token, code)")
+            conn.execute(f"CREATE INDEX {table}_buckets_code ON {table}_buckets (field, code)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return view_id
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class StoreView:
+    """
+    A stored view. Stands in for the prepared frame wherever the engine passes
+    one around (len(), .columns, .take()), and answers filters and counts with
+    queries.
+    """
+
+    def __init__(self, store, view_id, name, n_rows, clients, info):
+        self.store = store
+        self.view_id = view_id
+        self.name = name
+        self.table = f"v{view_id}"
+        self.n_rows = n_rows
+        self.clients = clients
+        self.columns = info["columns"]
+        self.kinds = dict(zip(self.columns, info["kinds"]))
+        self.filter_fields = info["fields"]
+        self.multi_select_fields = set(info["multi_select"])
+        self.id_column = info["id_column"]
+        self.values = info["values"]
+        self.missing_tokens = {f: set(tokens) for f, tokens in info["missing_tokens"].items()}
+
+    def __len__(self):
+        return self.n_rows
+
+    def sql_column(self, column):
+        return f"c{self.columns.index(column)}"
+
+    def code_column(self, field):
+        return f"k{self.filter_fields.index(field)}"
+
+    def filter_values(self):
+        """{field: dropdown values (None when missing)}, as computed when the view was written."""
+        return dict(self.values)
+
+    def count_clients(self):
+        return self.clients
+
+    def filters(self, metrics=None):
+        return StoreFilter(self, metrics)
+
+    def where(self, selections):
+        """(' WHERE ...', params) for {field: (values, negate)} selections."""
+        clauses, params = [], []
+        for field, (values, negate) in selections.items():
+            marks = ", ".join("?" * len(values))
+            clauses.append(
+                f"{self.code_column(field)} {'NOT IN' if negate else 'IN'} "
+                f"(SELECT code FROM {self.table}_tokens WHERE field = ? AND token IN ({marks}))"
+            )
+            params += [self.filter_fields.index(field), *values]
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def positions(self, selections, sort=None):
+        """Positions of the rows passing the selections; sort: (column, ascending), blanks last."""
+        if not selections and sort is None:
+            return np.arange(self.n_rows, dtype=np.int64)
+        where, params = self.where(selections)
+        order = "_pos"
+        if sort is not None:
+            column = self.sql_column(sort[0])
+            order = f"{column} IS NULL, {column}{'' if sort[1] else ' DESC'}, _pos"
+        cursor = self.store.execute(f"SELECT _pos FROM {self.table}{where} ORDER BY {order}", params)
+        return np.fromiter((pos for (pos,) in cursor), dtype=np.int64)
+
+    def count(self, selections):
+        where, params = self.where(selections)
+        return self.store.execute(f"SELECT COUNT(*) FROM {self.table}{where}", params).fetchone()[0]
+
+    def count_unique(self, column, selections):
+        where, params = self.where(selections)
+        return self.store.execute(
+            f"SELECT COUNT(DISTINCT {self.sql_column(column)}) FROM {self.table}{where}", params
+        ).fetchone()[0]
+
+    def crosstab(self, fields, selections=None):
+        """grantAggregate.crosstab over the rows passing the selections, counted in the database."""
+        fields = [f for f in fields if f in self.filter_fields]
+        if not fields:
+            raise ValueError("crosstab needs at least one filter field of the view")
+        where, params = self.where(selections or {})
+        joins = " ".join(
+            f"JOIN {self.table}_buckets b{i} ON b{i}.field = {self.filter_fields.index(f)} "
+            f"AND b{i}.code = {self.code_column(f)}"
+            for i, f in enumerate(fields)
+        )
+        buckets = ", ".join(f"b{i}.bucket" for i in range(len(fields)))
+        counts = f"COUNT(DISTINCT {self.sql_column(self.id_column)}), " if self.id_column else ""
+        rows = self.store.execute(
+            f"SELECT {buckets}, {counts}COUNT(*) FROM {self.table} {joins}{where} "
+            f"GROUP BY {buckets} ORDER BY {buckets}",
+            params,
+        ).fetchall()
+        names = fields + ([CLIENTS] if self.id_column else []) + [ROWS]
+        table = pd.DataFrame.from_records(rows, columns=names)
+        for name in names[len(fields):]:
+            table[name] = table[name].astype(np.int64)
+        return table
+
+    def take(self, positions, columns=None):
+        """The rows at `positions` (in that order) as a DataFrame, like DataFrame.take."""
+        columns = list(self.columns if columns is None else columns)
+        positions = np.asarray(positions, dtype=np.int64)
+        select = f"SELECT _pos, {', '.join(self.sql_column(c) for c in columns)} FROM {self.table}"
+        records = []
+        if len(positions) and positions[-1] - positions[0] + 1 == len(positions) \
+                and (len(positions) == 1 or np.all(np.diff(positions) == 1)):
+            # A run of rows (the unfiltered view, a grid window): one range scan
+            records = self.store.execute(
+                f"{select} WHERE _pos BETWEEN ? AND ?", (int(positions[0]), int(positions[-1]))
+            ).fetchall()
+        else:
+            for start in range(0, len(positions), READ_CHUNK_ROWS):
+                chunk = positions[start:start + READ_CHUNK_ROWS].tolist()
+                records += self.store.execute(
+                    f"{select} WHERE _pos IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        # Rows come back in _pos order; put them in the order asked for
+        if records:
+            order = pd.Index([r[0] for r in records]).get_indexer(positions)
+            cells = list(zip(*(records[i] for i in order)))[1:]
+        else:
+            cells = [()] * len(columns)
+        df = pd.DataFrame({col: frame_column(values, self.kinds[col]) for col, values in zip(columns, cells)})
+        df.index = positions
+        return df
+
+
+class StoreFilter:
+    """FilterEngine's interface over a StoreView: selections become a WHERE clause."""
+
+    def __init__(self, view, metrics=None):
+        self.df = view
+        self.metrics = metrics          # optional grantMetrics.Metrics timing each query
+        self.filter_fields = list(view.filter_fields)
+        self.index = {}
+        self.selections = {}            # field -> (values, negate)
+        self.sort = None
+        self._positions = None
+        self._count = None
+        self._unique = {}
+
+    def set_selection(self, field, spec):
+        """Change one field's selection. Returns True when the filter changed."""
+        if field not in self.filter_fields:
+            return False
+        values, negate = parse_selection(spec)
+        selection = (values, negate) if values else None
+        if self.selections.get(field) == selection:
+            return False
+        if selection is None:
+            self.selections.pop(field, None)
+        else:
+            self.selections[field] = selection
+        self._positions = None
+        self._count = None
+        self._unique = {}
+        return True
+
+    def update(self, selections):
+        """Apply a full spec ({field: selection}); filter fields left out are cleared."""
+        changed = False
+        for field in self.filter_fields:
+            changed = self.set_selection(field, selections.get(field)) or changed
+        return changed
+
+    def clear(self):
+        return self.update({})
+
+    def is_filtered(self):
+        return bool(self.selections)
+
+    def selections_without(self, field):
+        return {f: s for f, s in self.selections.items() if f != field}
+
+    def missing_tokens(self, field):
+        """Values of `field` its filter also matches on missing cells."""
+        return self.df.missing_tokens.get(field, set())
+
+    def single_selections(self):
+        """{field: value} when every active filter is one plain value (cube-answerable), else None."""
+        if any(negate or len(values) != 1 for values, negate in self.selections.values()):
+            return None
+        return {field: values[0] for field, (values, _negate) in self.selections.items()}
+
+    def sort_by(self, column, ascending=True):
+        """Order positions() by a column (None to restore view order). Blanks sort last."""
+        self.sort = (column, ascending) if column is not None else None
+        self._positions = None
+
+    def positions(self):
+        """Row positions (into the view) that pass every filter, in sort order."""
+        if self._positions is None:
+            if self.metrics is None:
+                self._positions = self.df.positions(self.selections, self.sort)
+            else:
+                with self.metrics.stage("store_query", rows_in=len(self.df)) as stage:
+                    self._positions = self.df.positions(self.selections, self.sort)
+                    stage.rows_out = len(self._positions)
+        return self._positions
+
+    def count(self):
+        """Rows passing the filters (counted in the database unless positions() were read)."""
+        if self._positions is not None:
+            return len(self._positions)
+        if self._count is None:
+            self._count = self.df.count(self.selections)
+        return self._count
+
+    def count_unique(self, column):
+        """nunique(dropna=True) of a column over the filtered rows, counted in the database."""
+        if column not in self._unique:
+            self._unique[column] = self.df.count_unique(column, self.selections)
+        return self._unique[column]
+
+    def mask(self):
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[self.positions()] = True
+        return mask
+
+    def take(self, start, stop):
+        """Materialize filtered rows [start, stop)."""
+        return self.df.take(self.positions()[start:stop])
+
+    def head(self, n):
+        return self.take(0, n)
+
+    def active_labels(self):
+        return [
+            describe_selection(field, *self.selections[field])
+            for field in self.filter_fields
+            if field in self.selections
+        ]
@@ -0,0 +1,167 @@
+"""
+Background work for the GUI.
+
+Tk widgets may only be touched from the thread running mainloop. The
+TaskScheduler runs jobs on worker threads fed from a queue; everything a job
+has to tell the window (progress, status lines, its result or error) comes
+back through a second queue that the Tk thread drains with root.after, so no
+callback ever runs off the main thread and nothing calls root.update().
+
+Jobs cancel cooperatively: task.check() and task.progress() raise
+TaskCancelled once the task is cancelled. Jobs submitted under the same key
+supersede each other: a new filter job cancels the previous one (dropped from
+the queue if it had not started, its result discarded if it had), and a
+submit delay debounces bursts of changes so only the last one runs.
+"""
+import queue
+import threading
+
+POLL_MS = 30
+
+
+class TaskCancelled(Exception):
+    """Raised inside a job once its task was cancelled or superseded."""
+
+
+class Task:
+    def __init__(self, scheduler, key, fn, args, on_done=None, on_error=None, on_progress=None):
+        self.scheduler = scheduler
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done          # callable(result), on the Tk thread
+        self.on_error = on_error        # callable(exception), on the Tk thread
+        self.on_progress = on_progress  # callable(fraction, message), on the Tk thread
+        self._cancelled = threading.Event()
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Cancel unless the job already finished (its result then still arrives). Returns whether it took."""
+        with self._lock:
+            if not self._finished:
+                self._cancelled.set()
+            return self._cancelled.is_set()
+
+    def finish(self):
+        """Mark the job done (worker side); False if it was cancelled first."""
+        with self._lock:
+            self._finished = True
+            return not self._cancelled.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, fraction, message=None):
+        """Report percent-complete (0..1); also a cancellation point."""
+        self.check()
+        if self.on_progress is not None:
+            self.scheduler.post(self, self.on_progress, min(max(fraction, 0.0), 1.0), message)
+
+    def span(self, start, stop):
+        """progress() callable mapping a step's own 0..1 onto [start, stop] of this task."""
+        return lambda fraction, message=None: self.progress(start + (stop - start) * fraction, message)
+
+
+class TaskScheduler:
+    def __init__(self, root, workers=1, poll_ms=POLL_MS):
+        # workers: threads running jobs. With one (the default) jobs run one at a time in
+        # submission order, so jobs sharing an engine or FilterEngine never overlap.
+        self.root = root
+        self.poll_ms = poll_ms
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()     # (task or None, callback, args) for the Tk thread
+        self.pending = {}               # key -> latest task submitted under it, until it finishes
+        self.main_thread = threading.current_thread()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, key=None, delay_ms=0, on_done=None, on_error=None, on_progress=None):
+        """
+        Run fn(task, *args) on a worker thread. A task with the same key still
+        pending is cancelled; delay_ms holds the job back (debounce) so a
+        quicker successor can replace it before it starts.
+        """
+        task = Task(self, key, fn, args, on_done, on_error, on_progress)
+        if key is not None:
+            self.cancel(key)
+            self.pending[key] = task
+        if delay_ms:
+            self.root.after(delay_ms, self._enqueue, task)
+        else:
+            self._enqueue(task)
+        return task
+
+    def cancel(self, key):
+        """Cancel the task pending under key. False if there is none or it already finished."""
+        task = self.pending.pop(key, None)
+        return task is not None and task.cancel()
+
+    def is_pending(self, key):
+        return key in self.pending
+
+    def busy(self):
+        return bool(self.pending) or not self.events.empty()
+
+    def call_soon(self, callback, *args):
+        """Run callback on the Tk thread: right away from it, else at the next poll."""
+        if threading.current_thread() is self.main_thread:
+            callback(*args)
+        else:
+            self.events.put((None, callback, args))
+
+    def post(self, task, callback, *args):
+        self.events.put((task, callback, args))
+
+    def shutdown(self):
+        for key in list(self.pending):
+            self.cancel(key)
+        for _thread in self.threads:
+            self.jobs.put(None)
+
+    def _enqueue(self, task):
+        if not task.cancelled:
+            self.jobs.put(task)
+
+    def _work(self):
+        while True:
+            task = self.jobs.get()
+            if task is None:
+                return
+            if task.cancelled:
+                continue
+            try:
+                result = task.fn(task, *task.args)
+            except TaskCancelled:
+                continue
+            except Exception as e:
+                if task.finish():
+                    self.post(task, self._finish, task, task.on_error, e)
+            else:
+                if task.finish():
+                    self.post(task, self._finish, task, task.on_done, result)
+
+    def _finish(self, task, callback, value):
+        if task.key is not None and self.pending.get(task.key) is task:
+            del self.pending[task.key]
+        if callback is not None:
+            callback(value)
+
+    def _poll(self):
+        while True:
+            try:
+                task, callback, args = self.events.get_nowait()
+            except queue.Empty:
+                break
+            # Progress of cancelled/superseded tasks is dropped (their results are never posted)
+            if task is not None and task.cancelled:
+                continue
+            callback(*args)
+        self.root.after(self.poll_ms, self._poll)
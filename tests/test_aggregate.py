@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from grantAggregate import BLANK_BUCKET, CLIENTS, ROWS, crosstab
+from grantFilters import FilterEngine
+
+MULTI_SELECT = {"Disability"}
+
+
+def clients_frame():
+    return pd.DataFrame({
+        "Client Uid": ["1", "2", "3", "4", "5", "6", "7", "7"],
+        "Disability": ["None", "Physical|None", "Physical", np.nan, "  ", "None", "Cognitive, Physical", "None"],
+        "Gender": ["Female", "None", "Male", "Female", np.nan, "Female", "Male", "Male"],
+    })
+
+
+def filtered_clients(df, field, value):
+    filters = FilterEngine(df, ["Disability", "Gender"], MULTI_SELECT)
+    filters.update({field: value})
+    return filters.count_unique("Client Uid"), filters.count()
+
+
+def test_literal_none_is_a_bucket():
+    table = crosstab(clients_frame(), ["Disability"], MULTI_SELECT, id_column="Client Uid")
+    counts = dict(zip(table["Disability"], table[CLIENTS]))
+    assert counts["None"] == 4
+    # Only the missing and whitespace-only cells are blank
+    assert counts[BLANK_BUCKET] == 2
+
+
+def test_crosstab_matches_filter_engine():
+    df = clients_frame()
+    for field in ("Disability", "Gender"):
+        table = crosstab(df, [field], MULTI_SELECT, id_column="Client Uid")
+        for bucket, clients, rows in zip(table[field], table[CLIENTS], table[ROWS]):
+            if bucket == BLANK_BUCKET:
+                continue
+            assert (clients, rows) == filtered_clients(df, field, bucket), (field, bucket)
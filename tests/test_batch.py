@@ -0,0 +1,37 @@
+import os
+
+import pandas as pd
+
+import grantBatch
+from grantBatch import BatchPipeline
+from grantCache import WorkbookCache
+from grantEngine import ID_COLUMN
+
+
+def write(path, ids):
+    df = pd.DataFrame({ID_COLUMN: ids, "Gender": ["Female"] * len(ids)})
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name="Gender - Rows", index=False)
+    return str(path)
+
+
+def test_failed_workbook_is_not_cached_as_combined(tmp_path, monkeypatch):
+    paths = [write(tmp_path / f"{name}.xlsx", [name.upper()]) for name in ("a", "b", "c")]
+    cache = WorkbookCache(str(tmp_path / "cache"))
+    ingest = grantBatch.ingest_workbook
+
+    def locked(path, **options):
+        if os.path.basename(path) == "b.xlsx":
+            return path, None, None, "Permission denied"
+        return ingest(path, **options)
+
+    monkeypatch.setattr(grantBatch, "ingest_workbook", locked)
+    first = BatchPipeline(cache=cache, workers=1, order="name")
+    assert sorted(first.run(paths)[ID_COLUMN]) == ["A", "C"]
+    assert list(first.failed) == [paths[1]]
+
+    # The lock is gone: the rerun must read b.xlsx instead of reusing a cached result without it
+    monkeypatch.setattr(grantBatch, "ingest_workbook", ingest)
+    second = BatchPipeline(cache=cache, workers=1, order="name")
+    assert sorted(second.run(paths)[ID_COLUMN]) == ["A", "B", "C"]
+    assert not second.failed
@@ -0,0 +1,76 @@
+import pytest
+
+from grantEngine import DEMOGRAPHICS_VIEW, MERGED_VIEW, GrantReportEngine
+from grantFilters import is_unset_selection
+from synthetic_workbook import make_sheets
+
+SELECTIONS = [
+    {},
+    {"Funder": "OVC"},
+    {"Funder": "OVC", "Gender": "Female"},
+    {"Disability": "None"},
+    {"Funder": ["OVC", "HHS"], "Gender": {"not": "Male"}},
+]
+
+
+@pytest.fixture(scope="module")
+def sheets():
+    return make_sheets(1500, seed=4)
+
+
+def engine_for(sheets, cube_max_dims):
+    engine = GrantReportEngine(cube_max_dims=cube_max_dims)
+    engine.workbook_sheets = sheets
+    engine.build_views()
+    return engine
+
+
+@pytest.mark.parametrize("cube_max_dims", [0, 2])
+@pytest.mark.parametrize("view", [DEMOGRAPHICS_VIEW, MERGED_VIEW])
+def test_dropdown_counts_match_filtering(sheets, cube_max_dims, view):
+    engine = engine_for(sheets, cube_max_dims)
+    df = engine.prepare_view(view)
+    index = engine.view_filter_index(view)
+    values = engine.view_filter_values(view)
+    for selections in SELECTIONS:
+        filters = engine.filter_engine(df, index)
+        filters.update(selections)
+        counts = engine.dropdown_counts(view, filters)
+        for field, field_values in values.items():
+            if not field_values:
+                continue
+            field_values = [v for v in field_values if not is_unset_selection(v)]
+            assert list(counts[field]) == field_values
+            for value in field_values:
+                filters_for_value = engine.filter_engine(df, index)
+                filters_for_value.update({**selections, field: value})
+                expected = filters_for_value.count_unique(engine.id_column)
+                assert counts[field][value] == expected, (selections, field, value)
+
+
+def test_literal_none_and_nan_are_counted(sheets):
+    engine = engine_for(sheets, 2)
+    df = engine.prepare_view(DEMOGRAPHICS_VIEW)
+    filters = engine.filter_engine(df, engine.view_filter_index(DEMOGRAPHICS_VIEW))
+    counts = engine.dropdown_counts(DEMOGRAPHICS_VIEW, filters)
+    assert counts["Disability"]["None"] > 0
+    for field, field_counts in counts.items():
+        if "nan" in field_counts:
+            assert field_counts["nan"] > 0, field
+
+
+def test_values_missing_cells_also_match(sheets):
+    # "nan" typed into cells next to empty cells: filtering on "nan" matches both
+    df = sheets["New Client Demographics"].head(300).copy()
+    df["Gender"] = df["Gender"].astype(object)
+    df.loc[df.index[:20], "Gender"] = "nan"
+    df.loc[df.index[20:50], "Gender"] = float("nan")
+    for cube_max_dims in (0, 2):
+        engine = GrantReportEngine(cube_max_dims=cube_max_dims)
+        engine.views = {"Clients": df}
+        prepared = engine.prepare_view("Clients")
+        index = engine.view_filter_index("Clients")
+        filters = engine.filter_engine(prepared, index)
+        counts = engine.dropdown_counts("Clients", filters)
+        filters.update({"Gender": "nan"})
+        assert counts["Gender"]["nan"] == filters.count_unique(engine.id_column)
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import grantExport
+from grantExport import CsvWriter, export_masks
+
+
+class FailingClose(CsvWriter):
+    def close(self):
+        super().close()
+        if "bad" in self.handle.name:
+            raise OSError("disk full")
+
+
+def test_every_writer_is_finished_when_one_fails(tmp_path, monkeypatch):
+    monkeypatch.setitem(grantExport.WRITERS, ".csv", FailingClose)
+    df = pd.DataFrame({"Gender": ["Female", "Male", "Female"]})
+    names = ["first", "bad", "last"]
+    masks = {name: np.ones(len(df), dtype=bool) for name in names}
+    paths = {name: str(tmp_path / f"{name}.csv") for name in names}
+    with pytest.raises(OSError, match="disk full"):
+        export_masks(df, masks, paths)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["first.csv", "last.csv"]
+    assert pd.read_csv(paths["last"])["Gender"].tolist() == ["Female", "Male", "Female"]
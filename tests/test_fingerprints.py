@@ -0,0 +1,152 @@
+import zipfile
+from xml.sax.saxutils import escape
+
+import pandas as pd
+import pytest
+
+from grantLoader import sheet_fingerprints
+
+MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+TYPES = "http://schemas.openxmlformats.org/package/2006/content-types"
+SML = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+RELS_TYPE = "application/vnd.openxmlformats-package.relationships+xml"
+
+
+def sheet_xml(rows, style_of, strings):
+    """One worksheet part; text goes to `strings` (value -> index, in order of first use)."""
+    xml = []
+    for r, row in enumerate(rows, 1):
+        cells = []
+        for c, value in enumerate(row):
+            ref = f"{chr(65 + c)}{r}"
+            if isinstance(value, str):
+                index = strings.setdefault(value, len(strings))
+                cells.append(f'<c r="{ref}" s="{style_of(ref)}" t="s"><v>{index}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}" s="{style_of(ref)}"><v>{value}</v></c>')
+        xml.append(f'<row r="{r}">{"".join(cells)}</row>')
+    return f'<worksheet xmlns="{MAIN}"><sheetData>{"".join(xml)}</sheetData></worksheet>'
+
+
+def styles_xml(codes, fonts):
+    """cellXfs: 0 is General, then one per number format code, all on the last font."""
+    num_fmts = "".join(
+        f'<numFmt numFmtId="{164 + i}" formatCode="{escape(code)}"/>'
+        for i, code in enumerate(codes)
+    )
+    xfs = '<xf numFmtId="0" fontId="0"/>' + "".join(
+        f'<xf numFmtId="{164 + i}" fontId="{fonts - 1}"/>' for i in range(len(codes))
+    )
+    return (
+        f'<styleSheet xmlns="{MAIN}"><numFmts>{num_fmts}</numFmts>'
+        f'<fonts>{"<font/>" * fonts}</fonts>'
+        '<fills><fill><patternFill patternType="none"/></fill></fills><borders><border/></borders>'
+        f'<cellStyleXfs><xf/></cellStyleXfs><cellXfs>{xfs}</cellXfs>'
+        '<cellStyles><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>'
+    )
+
+
+def write_workbook(path, sheets, formats=None, fonts=2):
+    """
+    Minimal .xlsx laid out the way Excel saves it: text in one shared string
+    table (numbered in order of first use), styles by cellXfs index.
+    `formats` maps (sheet, cell) to a number format code.
+    """
+    formats = formats or {}
+    codes = sorted(set(formats.values()))
+    strings = {}
+    parts = {}
+    for n, (name, rows) in enumerate(sheets.items(), 1):
+        def style_of(ref, name=name):
+            return codes.index(formats[name, ref]) + 1 if (name, ref) in formats else 0
+        parts[f"xl/worksheets/sheet{n}.xml"] = sheet_xml(rows, style_of, strings)
+    numbers = range(1, len(sheets) + 1)
+
+    items = "".join(f"<si><t>{escape(s)}</t></si>" for s in strings)
+    parts["xl/sharedStrings.xml"] = f'<sst xmlns="{MAIN}">{items}</sst>'
+    parts["xl/styles.xml"] = styles_xml(codes, fonts)
+    parts["xl/workbook.xml"] = (
+        f'<workbook xmlns="{MAIN}" xmlns:r="{REL}"><sheets>'
+        + "".join(
+            f'<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>' for n, name in zip(numbers, sheets)
+        )
+        + "</sheets></workbook>"
+    )
+    parts["xl/_rels/workbook.xml.rels"] = (
+        f'<Relationships xmlns="{PKG}">'
+        + "".join(
+            f'<Relationship Id="rId{n}" Type="{REL}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+            for n in numbers
+        )
+        + f'<Relationship Id="rId{len(sheets) + 1}" Type="{REL}/sharedStrings" '
+        'Target="sharedStrings.xml"/>'
+        + f'<Relationship Id="rId{len(sheets) + 2}" Type="{REL}/styles" Target="styles.xml"/>'
+        + "</Relationships>"
+    )
+    parts["_rels/.rels"] = (
+        f'<Relationships xmlns="{PKG}">'
+        f'<Relationship Id="rId1" Type="{REL}/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    )
+    parts["[Content_Types].xml"] = (
+        f'<Types xmlns="{TYPES}"><Default Extension="rels" ContentType="{RELS_TYPE}"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{SML}.sheet.main+xml"/>'
+        + "".join(
+            f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{SML}.worksheet+xml"/>'
+            for n in numbers
+        )
+        + f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SML}.sharedStrings+xml"/>'
+        + f'<Override PartName="/xl/styles.xml" ContentType="{SML}.styles+xml"/></Types>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in parts.items():
+            zf.writestr(name, xml)
+    return path
+
+
+SHEETS = {
+    "A": [["Client ID", "Gender"], ["1", "Female"], ["2", "Male"]],
+    "B": [["Client ID", "Race"], ["1", 0.5], ["2", "Asian"]],
+}
+
+
+@pytest.fixture
+def original(tmp_path):
+    return sheet_fingerprints(write_workbook(tmp_path / "before.xlsx", SHEETS))
+
+
+def test_workbook_reads(tmp_path):
+    path = write_workbook(tmp_path / "x.xlsx", SHEETS)
+    assert pd.read_excel(path, sheet_name="B")["Race"].tolist() == [0.5, "Asian"]
+
+
+def test_text_edit_changes_only_that_sheet(tmp_path, original):
+    # "Nonbinary" is new and used first, so every index B refers to shifts.
+    sheets = dict(SHEETS, A=[["Client ID", "Gender"], ["1", "Nonbinary"], ["2", "Male"]])
+    after = sheet_fingerprints(write_workbook(tmp_path / "after.xlsx", sheets))
+    assert after["A"] != original["A"]
+    assert after["B"] == original["B"]
+
+
+def test_same_content_same_fingerprints(tmp_path, original):
+    assert sheet_fingerprints(write_workbook(tmp_path / "again.xlsx", SHEETS)) == original
+
+
+def test_number_formats_count_fonts_do_not(tmp_path):
+    before = sheet_fingerprints(write_workbook(tmp_path / "a.xlsx", SHEETS, {("B", "B2"): "0.0"}))
+    font = sheet_fingerprints(
+        write_workbook(tmp_path / "b.xlsx", SHEETS, {("B", "B2"): "0.0"}, fonts=3)
+    )
+    assert font == before
+    percent = sheet_fingerprints(write_workbook(tmp_path / "c.xlsx", SHEETS, {("B", "B2"): "0%"}))
+    assert percent["B"] != before["B"]
+    assert percent["A"] == before["A"]
+
+
+def test_unreadable_file(tmp_path):
+    path = tmp_path / "not.xlsx"
+    path.write_text("not a workbook")
+    assert sheet_fingerprints(path) is None
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from grantCache import WorkbookCache
+from grantEngine import ID_COLUMN, MERGED_VIEW, GrantReportEngine
+
+
+def write(path, race, gender):
+    sheets = {
+        "Race - Rows": pd.DataFrame({ID_COLUMN: ["A", "B", "C"], "Race/Ethnicity": race}),
+        "Gender - Rows": pd.DataFrame({ID_COLUMN: ["A", "B", "D"], "Gender": gender}),
+    }
+    with pd.ExcelWriter(path) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+
+
+def as_objects(df):
+    return df.astype(object).reset_index(drop=True)
+
+
+def test_consecutive_reloads_patch_the_cached_merged_view(tmp_path):
+    path = str(tmp_path / "export.xlsx")
+    cache_dir = str(tmp_path / "cache")
+    write(path, ["White", "Asian", "Black"], ["Female", "Male", "Female"])
+    GrantReportEngine(cache=WorkbookCache(cache_dir), incremental=True).load_workbook(path)
+
+    edits = [
+        (["White", "Asian", "Other"], ["Female", "Male", "Female"]),
+        (["White", "Asian", "Other"], ["Female", "Female", "Female"]),
+    ]
+    for race, gender in edits:
+        write(path, race, gender)
+        messages = []
+        engine = GrantReportEngine(
+            cache=WorkbookCache(cache_dir), incremental=True, log=messages.append
+        )
+        engine.load_workbook(path)
+        assert any(m.startswith("Patching merged view") for m in messages), messages
+        full = GrantReportEngine()
+        full.load_workbook(path)
+        pd.testing.assert_frame_equal(
+            as_objects(engine.views[MERGED_VIEW]), as_objects(full.views[MERGED_VIEW])
+        )
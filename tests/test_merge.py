@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from check_merge import as_objects, make_sheets, pairwise_merge, per_sheet_frames, reference_coalesce
+from grantEngine import DEMOGRAPHICS_SHEET, ID_COLUMN, MERGED_VIEW, SHEET_MAPPINGS, GrantReportEngine
+
+
+@pytest.fixture(scope="module")
+def rows_sheets():
+    return make_sheets(2000, seed=1)
+
+
+def merged_view(sheets):
+    engine = GrantReportEngine()
+    engine.workbook_sheets = sheets
+    return engine.build_merged_report_view()
+
+
+@pytest.mark.parametrize("n_sheets", range(1, len(SHEET_MAPPINGS) + 1))
+def test_merge_sheets_matches_pairwise_outer_merge(rows_sheets, n_sheets):
+    frames = per_sheet_frames(rows_sheets)
+    frames = {name: frames[name] for name in list(frames)[:n_sheets]}
+    merged = GrantReportEngine().merge_sheets(frames)
+    expected = reference_coalesce(frames, pairwise_merge(frames))
+    pd.testing.assert_frame_equal(as_objects(merged), as_objects(expected), check_dtype=False)
+
+
+def test_merged_view_without_demographics_tab(rows_sheets):
+    merged = merged_view(rows_sheets)
+    # One column per report column: shared ones are coalesced, never suffixed
+    columns = list(merged.columns)
+    assert len(columns) == len(set(columns))
+    assert not [c for c in columns if c.endswith(("_x", "_y"))]
+    assert {c for cols in SHEET_MAPPINGS.values() for c in cols} == set(columns)
+    # One row per client found on any sheet (the rows without an ID kept once)
+    ids = pd.concat([df[ID_COLUMN].astype(object) for df in rows_sheets.values()])
+    assert len(merged) == ids.nunique(dropna=True) + int(ids.isna().any())
+    assert merged[ID_COLUMN].dropna().is_unique
+
+
+def test_coalesce_prefers_priority_sheet():
+    sheets = {
+        "Race - Rows": pd.DataFrame({
+            ID_COLUMN: ["A", "B", "C"], "Race/Ethnicity": ["White", "Asian", "Black"],
+            "Funder": ["OVC", "  ", np.nan], "Type of Victimization": ["Labor Trafficking", "", np.nan],
+        }),
+        "Gender - Rows": pd.DataFrame({
+            ID_COLUMN: ["A", "B", "D"], "Gender": ["Female", "Male", "Female"],
+            "Funder": ["HHS", "HHS", "State"], "Type of Victimization": [np.nan, "Sex Trafficking", "Exploitation"],
+        }),
+        "Victimization Type - Rows": pd.DataFrame({
+            ID_COLUMN: ["A", "C"], "Type of Victimization": ["Sex Trafficking", "Sex Trafficking"],
+            "Funder": [np.nan, "OVC"],
+        }),
+    }
+    merged = merged_view(sheets).set_index(ID_COLUMN)
+    assert list(merged.index) == ["A", "B", "C", "D"]
+    assert merged["Funder"].astype(object).tolist() == ["OVC", "HHS", "OVC", "State"]
+    # Victimization Type - Rows wins where it has a value, then SHEET_MAPPINGS order
+    assert merged["Type of Victimization"].astype(object).tolist() == [
+        "Sex Trafficking", "Sex Trafficking", "Sex Trafficking", "Other/Exploitation",
+    ]
+    assert merged.loc["D", "Race/Ethnicity"] == ""
+
+
+def test_demographics_tab_is_used_when_present(rows_sheets):
+    demographics = pd.DataFrame({
+        ID_COLUMN: ["A", "B", "A"], "Funder": ["OVC", "HHS", "OVC"], "Country of Citizenship": [
+            "nicaraugua", "Mexico", "nicaraugua",
+        ],
+    })
+    merged = merged_view({**rows_sheets, DEMOGRAPHICS_SHEET: demographics})
+    assert list(merged.columns) == [ID_COLUMN, "Funder", "Country of Citizenship"]
+    assert merged[ID_COLUMN].tolist() == ["A", "B"]
+    assert merged["Country of Citizenship"].astype(object).tolist() == ["Nicaragua", "Mexico"]
+
+
+def test_merged_view_is_not_prepared_twice(rows_sheets):
+    sheets = dict(rows_sheets)
+    victimization = sheets["Victimization Type - Rows"].copy()
+    victimization["Type of Victimization"] = "Sex Trafficking; Labor Trafficking"
+    sheets["Victimization Type - Rows"] = victimization
+    engine = GrantReportEngine()
+    engine.workbook_sheets = sheets
+    engine.build_views()
+    prepared = engine.prepare_view(MERGED_VIEW)
+    pd.testing.assert_frame_equal(prepared, merged_view(sheets))
+    assert "Both Sex & Labor Trafficking" in set(prepared["Type of Victimization"].astype(object))
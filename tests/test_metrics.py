@@ -0,0 +1,41 @@
+import json
+
+from grantMetrics import Metrics
+
+
+def lines(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_file_is_rotated_at_max_bytes(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    metrics = Metrics(path, max_bytes=2000)
+    for i in range(100):
+        metrics.record("stage", 0.1, rows_in=i)
+    metrics.close()
+    current, previous = lines(path), lines(path + ".1")
+    assert (tmp_path / "metrics.jsonl").stat().st_size < 2000
+    assert (tmp_path / "metrics.jsonl.1").stat().st_size < 2000 + 500
+    # Nothing is lost between the two files; the newest records are kept
+    assert [r["rows_in"] for r in previous + current] == list(range(100 - len(previous + current), 100))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.jsonl", "metrics.jsonl.1"]
+
+
+def test_full_file_is_rotated_on_open(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    path.write_text("x" * 3000)
+    metrics = Metrics(str(path), max_bytes=2000)
+    metrics.record("stage", 0.1)
+    metrics.close()
+    assert (tmp_path / "metrics.jsonl.1").read_text() == "x" * 3000
+    assert [r["stage"] for r in lines(path)] == ["stage"]
+
+
+def test_appends_below_the_cap(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for run in range(2):
+        metrics = Metrics(path)
+        metrics.record("stage", 0.1, rows_in=run)
+        metrics.close()
+    assert [r["rows_in"] for r in lines(path)] == [0, 1]
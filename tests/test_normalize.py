@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from grantNormalize import (
+    NormalizationRules,
+    merge_rules,
+    normalize_blank,
+    normalize_blank_series,
+    normalize_citizenship,
+    normalize_citizenship_series,
+    normalize_victimization,
+    normalize_victimization_series,
+)
+
+VICTIMIZATION_VALUES = [
+    "Sex Trafficking", "Labor Trafficking", "Sex Trafficking, Labor Trafficking",
+    "sex trafficking & labor trafficking", "LABOR TRAFFICKING", "Exploitation", "Other", "", "  ", "nan",
+    "NaN", "None", None, np.nan,
+]
+CITIZENSHIP_VALUES = [
+    "Nicaragua", "nicaraugua", "Niceragua ", "nicaragua.", "NICARAGUA", "Nicaraguaa", "Mexico", "mexico",
+    " USA", "us", "Iceland", "Ireland", "", "nan", None, np.nan,
+]
+MULTI_SELECT_VALUES = ["White|Black", "Asian, White", "Hispanic/Latino & White", " White ", "", "NaN", None, np.nan]
+
+CASES = [
+    (VICTIMIZATION_VALUES, normalize_victimization, normalize_victimization_series),
+    (CITIZENSHIP_VALUES, normalize_citizenship, normalize_citizenship_series),
+    (MULTI_SELECT_VALUES, normalize_blank, normalize_blank_series),
+]
+
+
+@pytest.mark.parametrize("values, scalar_fn, series_fn", CASES)
+def test_rules_match_legacy_normalizers(values, scalar_fn, series_fn):
+    series = pd.Series(values * 3, dtype=object)
+    pd.testing.assert_series_equal(series_fn(series), series.apply(scalar_fn))
+
+
+@pytest.mark.parametrize("values, scalar_fn, series_fn", CASES)
+def test_rules_match_legacy_normalizers_on_categoricals(values, scalar_fn, series_fn):
+    series = pd.Series([v for v in values if v is not None] * 3, dtype="category")
+    expected = series.astype(object).apply(scalar_fn)
+    assert series_fn(series).astype(object).tolist() == expected.tolist()
+
+
+def test_unlisted_values_are_kept():
+    rules = NormalizationRules()
+    countries = pd.Series(["Iceland", "Ireland", "Nicaraguaa"], dtype=object)
+    assert rules.apply("Country of Citizenship", countries).tolist() == ["Iceland", "Ireland", "Nicaraguaa"]
+    languages = pd.Series(["Spanglish", "spanish", "ASL", np.nan], dtype=object)
+    out = rules.apply("Primary Language", languages).tolist()
+    assert out[:3] == ["Spanglish", "Spanish", "American Sign Language"]
+    assert pd.isna(out[3])
+
+
+def test_fuzzy_matching_is_opt_in():
+    spec = merge_rules({"Country of Citizenship": {"choices": "countries", "fuzzy": {"cutoff": 0.85}}})
+    rules = NormalizationRules(spec)
+    assert rules.apply("Country of Citizenship", pd.Series(["Nicaraguaa", "Guatamala"])).tolist() == [
+        "Nicaragua", "Guatemala",
+    ]
+
+
+def test_fuzzy_candidates_can_be_narrowed():
+    spec = merge_rules({"Country of Citizenship": {
+        "choices": "countries", "fuzzy": {"choices": ["Nicaragua"], "cutoff": 0.85},
+    }})
+    rules = NormalizationRules(spec)
+    out = rules.apply("Country of Citizenship", pd.Series(["Nicaraguaa", "Iceland", "ireland"])).tolist()
+    assert out == ["Nicaragua", "Iceland", "Ireland"]
+
+
+def test_unknown_choice_list():
+    with pytest.raises(ValueError, match="choice list"):
+        NormalizationRules({"Country of Citizenship": {"choices": "planets"}})
@@ -0,0 +1,41 @@
+import json
+
+import pandas as pd
+import pytest
+
+from grantEngine import main
+from grantFilters import FilterEngine
+from grantPresets import evaluate_presets, load_presets
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path)
+
+
+def test_load_presets(tmp_path):
+    path = write_json(tmp_path / "presets.json", {"presets": {"ovc": {"Funder": "OVC"}}})
+    assert load_presets(path) == {"ovc": {"Funder": "OVC"}}
+    single = write_json(tmp_path / "hhs.json", {"Funder": "HHS", "Gender": {"not": "Male"}})
+    assert load_presets(single) == {"hhs": {"Funder": "HHS", "Gender": {"not": "Male"}}}
+
+
+def test_unknown_field_in_preset_file(tmp_path):
+    path = write_json(tmp_path / "presets.json", {"presets": {"ovc": {"Fundr": "OVC"}}})
+    with pytest.raises(ValueError, match="'ovc'.*'Fundr'"):
+        load_presets(path)
+
+
+def test_unknown_field_in_evaluated_presets():
+    df = pd.DataFrame({"Legacy Client ID": ["1", "2"], "Funder": ["OVC", "HHS"]})
+    filters = FilterEngine(df, ["Funder"], set())
+    with pytest.raises(ValueError, match="'ovc'.*'Fundr'"):
+        evaluate_presets(filters, {"ok": {"Funder": "HHS"}, "ovc": {"Fundr": "OVC"}}, "Legacy Client ID")
+    results = evaluate_presets(filters, {"ok": {"Funder": "HHS"}}, "Legacy Client ID")
+    assert results["ok"].clients == 1
+
+
+def test_cli_rejects_unknown_preset_field(tmp_path, capsys):
+    preset = write_json(tmp_path / "ovc.json", {"Fundr": "OVC"})
+    assert main(["missing.xlsx", "--preset", preset]) == 2
+    assert "Fundr" in capsys.readouterr().err